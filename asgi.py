@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+'''
+ASGI entry point serving the /suggestions endpoint of main.py, with searches
+run in a bounded pool of threads (see tools.asgiapp). Serve it with any ASGI
+server, e.g.
+```
+uvicorn asgi:app
+```
+The data set is reloaded in the background as by main.py (see tools.reloader),
+when its files change or on SIGHUP; there is no /admin/reload endpoint. The
+query log is served at /querylog with the ADMIN_TOKEN of configs.py. 
+'''
+
+from tools.asgiapp import SuggestionsApp
+from tools.searchservice import SearchService
+from tools.cache import LRUCache, SuggestionCache
+from tools.metrics import Metrics
+from tools.querylog import QueryLog
+from tools.reloader import Reloader
+from configs import SEARCH_ENGINE, CACHE_SIZE, CACHE_TTL_SECONDS, CACHE_GRID_DEGREES
+from configs import SESSION_CACHE_SIZE, SESSION_TTL_SECONDS, SNAPSHOT_PATH
+from configs import COLUMNAR_CITIES, SHARDS, SEARCH_TIMEOUT_MS
+from configs import METRICS_PASS_SAMPLE, QUERY_LOG_SIZE
+from configs import RELOAD_POLL_SECONDS, RELOAD_GRACE_SECONDS, ADMIN_TOKEN
+from configs import ASGI_WORKERS, ASGI_MAX_PENDING, ASGI_TIMEOUT_SECONDS
+
+# Metrics of all queries, served at /metrics. 
+metrics = Metrics(METRICS_PASS_SAMPLE)
+# The latest queries, served at /querylog with the ADMIN_TOKEN. 
+queryLog = QueryLog(QUERY_LOG_SIZE) if QUERY_LOG_SIZE > 0 else None
+
+app = SuggestionsApp(None, ASGI_WORKERS, ASGI_MAX_PENDING, ASGI_TIMEOUT_SECONDS,
+                     ADMIN_TOKEN)
+
+def build_service(cities, index):
+    '''Returns a new search service over a data set; see main.build_service().'''
+    return SearchService(cities, index, engine=SEARCH_ENGINE, numShards=SHARDS, 
+                         cache=SuggestionCache(CACHE_SIZE, CACHE_TTL_SECONDS, 
+                                               CACHE_GRID_DEGREES 
+                                               if CACHE_SIZE > 0 else 0), 
+                         sessions=LRUCache(SESSION_CACHE_SIZE, 
+                                           SESSION_TTL_SECONDS),
+                         timeoutMs=SEARCH_TIMEOUT_MS, metrics=metrics,
+                         queryLog=queryLog)
+
+def swap_service(new):
+    '''Serve requests with the search service new from now on; returns the old one.'''
+    old = app.service
+    app.service = new
+    return old
+
+# Load the cities data set, and reload it in the background when its files 
+# change or on SIGHUP. 
+dataPath = 'data/cities_canada-usa.tsv'
+reloader = Reloader(dataPath, SNAPSHOT_PATH, build_service, swap_service, 
+                    COLUMNAR_CITIES, RELOAD_GRACE_SECONDS)
+reloader.reload_now()
+reloader.start(RELOAD_POLL_SECONDS)
+reloader.listen()
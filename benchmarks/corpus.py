@@ -0,0 +1,125 @@
+'''
+Synthetic geonames-style data sets, for benchmarking data sets larger than
+the bundled one.
+
+Generate one from the project root with
+```
+python -m benchmarks.corpus 100000 /tmp/cities_100000.tsv
+```
+The file has the columns of data/cities_canada-usa.tsv and is read by
+DataLoader.get_cities_tsv. Names are built from syllables and the affixes
+common in Canadian and US place names; cities have a few alternative names
+(ASCII, accented and abbreviated spellings, and names in other scripts),
+coordinates in Canada or the USA and a long-tailed population. The same
+number of rows and seed always give the same file.
+'''
+
+import random
+import sys
+
+HEADER = ['id', 'name', 'ascii', 'alt_name', 'lat', 'long', 'feat_class',
+          'feat_code', 'country', 'cc2', 'admin1', 'admin2', 'admin3',
+          'admin4', 'population', 'elevation', 'dem', 'tz', 'modified_at']
+
+SYLLABLES = ['a', 'ab', 'al', 'an', 'ar', 'ash', 'ba', 'bel', 'ber', 'bo',
+             'bran', 'ca', 'cal', 'car', 'ches', 'co', 'da', 'del', 'den',
+             'do', 'el', 'en', 'er', 'fa', 'fer', 'gar', 'gle', 'ha', 'har',
+             'hol', 'i', 'in', 'ja', 'ka', 'ken', 'la', 'lan', 'le', 'lin',
+             'lo', 'ma', 'mar', 'mel', 'mi', 'mon', 'na', 'nor', 'o', 'or',
+             'pa', 'pem', 'per', 'que', 'ra', 'ren', 'ri', 'ro', 'sa', 'sal',
+             'se', 'sha', 'so', 'ta', 'ter', 'to', 'tre', 'u', 'va', 'ver',
+             'wa', 'wes', 'win', 'wood', 'ya', 'zel']
+SUFFIXES = ['', '', '', 'ville', 'ton', 'burg', 'field', 'ford', 'wood',
+            'dale', 'mont', 'port', ' Falls', ' City', ' Springs', ' Creek',
+            ' Heights', ' Lake']
+PREFIXES = [('Saint-', 'St. '), ('Sainte-', 'Ste. '), ('Mount ', 'Mt. '),
+            ('Fort ', 'Ft. '), ('Port ', 'Pt. '), ('New ', 'N. '),
+            ('North ', 'N. '), ('East ', 'E. ')]
+ACCENTS = {'e':u'é', 'a':u'à', 'o':u'ô', 'u':u'ü', 'i':u'î'}
+CYRILLIC = dict(zip(u'abcdefghijklmnopqrstuvwxyz',
+                    u'абкдефгхийклмнопкрстувшксз'))
+# (country, admin1 codes, time zone, latitude range, longitude range)
+REGIONS = [('CA', ['01', '02', '08', '10'], 'America/Toronto',
+            (42.0, 60.0), (-135.0, -53.0)),
+           ('US', ['CA', 'NY', 'TX', 'WA', 'FL'], 'America/New_York',
+            (25.0, 49.0), (-124.0, -67.0))]
+
+
+def city_name(rng):
+    '''Returns a random place name and its common abbreviation (or None).'''
+    stem = ''.join(rng.choice(SYLLABLES)
+                   for _ in range(rng.choice([1, 2, 2, 2, 3, 3])))
+    if(len(stem) < 3):
+        stem = stem + rng.choice(SYLLABLES)
+    name = stem.capitalize() + rng.choice(SUFFIXES)
+    if(rng.random() < 0.15):
+        prefix, short = rng.choice(PREFIXES)
+        return prefix + name, short + name
+    return name, None
+
+
+def alt_names(rng, name, short):
+    '''Returns alternative names of a city called name.'''
+    names = []
+    if(short != None):
+        names.append(short)
+    for _ in range(rng.choice([0, 0, 1, 1, 2, 3, 4, 6])):
+        kind = rng.random()
+        if(kind < 0.3):
+            names.append(''.join(ACCENTS.get(c, c) if rng.random() < 0.5 else c
+                                 for c in name))
+        elif(kind < 0.6):
+            names.append(''.join(CYRILLIC.get(c, c) for c in name.lower()))
+        elif(kind < 0.8):
+            names.append(name.upper())
+        else:
+            names.append(name + rng.choice([' Township', ' Station',
+                                            ' Village']))
+    # Without duplicates, in order.
+    return [n for i, n in enumerate(names) if n not in names[0:i]]
+
+
+def population(rng):
+    '''Returns a long-tailed random population, like that of the bundled data.'''
+    return int(5000*rng.paretovariate(1.2)) - 5000 + rng.randrange(5000)
+
+
+def rows(numRows, seed=0):
+    '''Yields numRows rows (lists of strings) of a synthetic data set.
+
+    Arguments:
+        numRows -- the number of cities.
+        seed -- [OPTIONAL] seed of the random number generator.
+    '''
+    rng = random.Random(seed)
+    for i in range(numRows):
+        name, short = city_name(rng)
+        country, admins, tz, lats, longs = rng.choice(REGIONS)
+        lat = round(rng.uniform(*lats), 5)
+        longi = round(rng.uniform(*longs), 5)
+        yield [str(1000000 + i), name, name, ','.join(alt_names(rng, name, short)),
+               str(lat), str(longi), 'P', 'PPL', country, '', rng.choice(admins),
+               '', '', '', str(population(rng)), '', str(rng.randrange(1500)),
+               tz, '2016-01-01']
+
+
+def write(path, numRows, seed=0):
+    '''Write a synthetic data set of numRows cities as a TSV file at path.'''
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('\t'.join(HEADER) + '\n')
+        for row in rows(numRows, seed):
+            f.write('\t'.join(row) + '\n')
+
+
+def main(args):
+    '''Write a data set of args[0] cities at args[1], with seed args[2] if given.'''
+    if(len(args) not in [2, 3]):
+        print('Usage: python -m benchmarks.corpus <rows> <cities.tsv> [seed]')
+        return 2
+
+    write(args[1], int(args[0]), int(args[2]) if len(args) == 3 else 0)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,68 @@
+'''
+Benchmark of the memory taken by the cities data set, per city, in each of the
+ways it can be held.
+
+Run from the project root with
+```
+python -m benchmarks.memory
+```
+Reports the memory still allocated (as measured by tracemalloc) after
+loading the data set as a list of City objects, and as a CityTable, divided
+by the number of cities; with and without the CityIndex built over them.
+'''
+
+import gc
+import os
+import shutil
+import tempfile
+import tracemalloc
+from configs import ROOT_DIR
+from tools.city import PHONETIC_CODES
+from tools.cityindex import CityIndex
+from tools.dataloader import DataLoader
+from tools.snapshot import Snapshot
+
+DATA_PATH = ROOT_DIR + '/data/cities_canada-usa.tsv'
+
+
+def retained(load):
+    '''Returns the result of load() and the bytes it still holds on to.'''
+    # Not shared with what was loaded before. 
+    PHONETIC_CODES.clear()
+    gc.collect()
+    tracemalloc.start()
+    result = load()
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, size
+
+
+def main():
+    # Warm up anything filled in lazily, such as the punctuation table.
+    DataLoader.get_cities_tsv(ROOT_DIR + '/data/sample.tsv')
+    cities = DataLoader.get_cities_tsv(DATA_PATH)
+    numCities = len(cities)
+    tmp = tempfile.mkdtemp()
+    path = os.path.join(tmp, 'cities.snapshot')
+    Snapshot.write(path, cities, CityIndex(cities))
+    del cities
+
+    cases = [('list of City (TSV)', lambda: DataLoader.get_cities_tsv(DATA_PATH)),
+             ('list of City (snapshot)', lambda: Snapshot.read(path)[0]),
+             ('CityTable (snapshot)', lambda: Snapshot.read(path, True)[0]),
+             ('list of City + index', lambda: Snapshot.read(path)),
+             ('CityTable + index', lambda: Snapshot.read(path, True))]
+
+    print('%-26s %14s' % ('representation', 'bytes/city'))
+    try:
+        for name, load in cases:
+            result, size = retained(load)
+            print('%-26s %14.0f' % (name, size/float(numCities)))
+            del result
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+'''
+Load generator replaying a query log (see tools.querylog) against the search
+service, in this process or over HTTP, and reporting latency percentiles and
+throughput.
+
+Run from the project root with
+```
+curl -s -H "Authorization: Bearer $ADMIN_TOKEN" http://127.0.0.1:8080/querylog > queries.ndjson
+python -m benchmarks.replay queries.ndjson --qps 50 --concurrency 4
+python -m benchmarks.replay queries.ndjson --url http://127.0.0.1:8080 --qps 50
+```
+The query log is only kept with QUERY_LOG_SIZE set, and served with the
+ADMIN_TOKEN, in configs.py. Without --url, the queries are answered by a
+SearchService built in this process as main.py builds it (with --no-cache,
+without a cache of suggestions). With --url, they are sent to /suggestions of a server, e.g.
+one started with `python main.py`; nothing but that server is contacted. A
+file of plain query strings, one per line, can be replayed too.
+
+Queries are sent at --qps queries per second (0 for as fast as the threads
+allow) by --concurrency threads, in the order of the log, --repeat times.
+A query's latency runs from when it was due to be sent, so that time spent
+waiting for a thread when the service cannot keep up counts against it
+rather than being hidden by a slower send rate. Reports p50, p95, p99 and
+maximum latency in ms, the throughput of queries answered, and the errors.
+'''
+
+import argparse
+import json
+import math
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from configs import ROOT_DIR, SEARCH_ENGINE, SHARDS, SNAPSHOT_PATH
+from configs import CACHE_SIZE, CACHE_TTL_SECONDS, CACHE_GRID_DEGREES
+from configs import SESSION_CACHE_SIZE, SESSION_TTL_SECONDS, COLUMNAR_CITIES
+from configs import SEARCH_TIMEOUT_MS
+from tools.cache import LRUCache, SuggestionCache
+from tools.querylog import QueryLog
+from tools.searchservice import SearchService
+
+DATA_PATH = ROOT_DIR + '/data/cities_canada-usa.tsv'
+PERCENTILES = (50, 95, 99)
+# Seconds an HTTP request may take before it counts as an error.
+HTTP_TIMEOUT = 30
+# Never through the proxies of the environment: the server is local.
+OPENER = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+
+
+def percentile(values, p):
+    '''Returns the p-th percentile (nearest rank) of a sorted list of values.'''
+    if(len(values) == 0):
+        return None
+    return values[max(0, int(math.ceil(p/100.0*len(values))) - 1)]
+
+
+def local_service(cache=True):
+    '''Returns a SearchService configured as main.py configures its own.'''
+    size = CACHE_SIZE if cache else 0
+    return SearchService.load(DATA_PATH, SNAPSHOT_PATH, COLUMNAR_CITIES,
+                    engine=SEARCH_ENGINE, numShards=SHARDS,
+                    cache=SuggestionCache(size, CACHE_TTL_SECONDS,
+                                          CACHE_GRID_DEGREES if size > 0 else 0),
+                    sessions=LRUCache(SESSION_CACHE_SIZE, SESSION_TTL_SECONDS),
+                    timeoutMs=SEARCH_TIMEOUT_MS)
+
+
+def local_query(service):
+    '''Returns a function answering a query log entry with service; returns None.'''
+    def query(entry):
+        numRes = entry['n'] if type(entry['n']) is int else 10
+        if(numRes < 0):
+            ''.join(service.suggestions_stream(entry['q'], entry['latitude'],
+                                               entry['longitude'], False,
+                                               entry['session']))
+        else:
+            service.suggestions(entry['q'], entry['latitude'],
+                                entry['longitude'], numRes, entry['session'])
+        return None
+    return query
+
+
+def http_query(url):
+    '''Returns a function sending a query log entry to /suggestions at url.
+
+    The function returns None, or the HTTP status of a failed request.
+    '''
+    def query(entry):
+        params = [('q', entry['q'])]
+        for name, field in [('latitude', 'latitude'), ('longitude', 'longitude'),
+                            ('n', 'n'), ('session', 'session')]:
+            if(entry[field] != None):
+                params.append((name, entry[field]))
+        try:
+            with OPENER.open(url.rstrip('/') + '/suggestions?' +
+                             urllib.parse.urlencode(params),
+                             timeout=HTTP_TIMEOUT) as response:
+                response.read()
+        except urllib.error.HTTPError as e:
+            return e.code
+        return None
+    return query
+
+
+def replay(entries, query, qps=0, concurrency=1):
+    '''Replays entries with query and returns the latencies and errors.
+
+    Arguments:
+        entries -- list of query log entries (see QueryLog.records()).
+        query -- function answering an entry, returning None or an error;
+                 exceptions raised count as errors too.
+        qps -- queries sent per second; 0 for as fast as the threads allow.
+        concurrency -- number of threads sending queries.
+
+    Returns:
+        A dictionary with the latencies of the queries answered, in ms and
+        ascending order ('latencies'), the number of each error ('errors'),
+        and the seconds from the first query to the last answer ('seconds').
+    '''
+    latencies = []
+    errors = {}
+    lock = threading.Lock()
+
+    def run(entry, due):
+        start = time.perf_counter()
+        try:
+            error = query(entry)
+        except Exception as e:
+            error = type(e).__name__
+        end = time.perf_counter()
+        with lock:
+            if(error == None):
+                latencies.append((end - (start if due == None else due))*1000)
+            else:
+                errors[str(error)] = errors.get(str(error), 0) + 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        for i, entry in enumerate(entries):
+            due = None
+            if(qps > 0):
+                due = start + i/float(qps)
+                time.sleep(max(0.0, due - time.perf_counter()))
+            executor.submit(run, entry, due)
+    seconds = time.perf_counter() - start
+    return {'latencies':sorted(latencies), 'errors':errors, 'seconds':seconds}
+
+
+def report(result):
+    '''Returns the summary of a replay(): numbers of queries, throughput and percentiles.'''
+    latencies = result['latencies']
+    summary = {'answered':len(latencies), 'errors':result['errors'],
+               'seconds':result['seconds'],
+               'throughput_qps':len(latencies)/result['seconds']
+                                if result['seconds'] > 0 else None,
+               'max_ms':latencies[-1] if latencies else None}
+    for p in PERCENTILES:
+        summary['p%d_ms' % p] = percentile(latencies, p)
+    return summary
+
+
+def main(args):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.replay',
+                                     description='Replay a query log against '
+                                     'the search service.')
+    parser.add_argument('log', help='query log in newline-delimited JSON, as '
+                        'served at /querylog, or one query per line')
+    parser.add_argument('--url', help='base URL of a server to query; by '
+                        'default, a service in this process')
+    parser.add_argument('--qps', type=float, default=0,
+                        help='queries per second; 0 for as fast as possible')
+    parser.add_argument('--concurrency', type=int, default=1,
+                        help='number of threads sending queries')
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='number of times the log is replayed')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='without --url, do not cache suggestions')
+    parser.add_argument('--output', help='path of the JSON summary')
+    options = parser.parse_args(args)
+
+    with open(options.log, encoding='utf-8') as f:
+        entries = [entry for entry in QueryLog.read(f) if entry['q']]
+    entries = entries*options.repeat
+    if(len(entries) == 0):
+        print('No queries in ' + options.log)
+        return 2
+
+    service = None
+    if(options.url != None):
+        query = http_query(options.url)
+    else:
+        service = local_service(not options.no_cache)
+        query = local_query(service)
+    try:
+        summary = report(replay(entries, query, options.qps,
+                                options.concurrency))
+    finally:
+        if(service != None):
+            service.close()
+
+    print('%d queries answered in %.1f s: %.1f queries/s'
+          % (summary['answered'], summary['seconds'], summary['throughput_qps']
+             or 0.0))
+    if(summary['answered'] > 0):
+        print('latency ms: ' + ', '.join('p%d %.2f' % (p, summary['p%d_ms' % p])
+                                         for p in PERCENTILES) +
+              ', max %.2f' % summary['max_ms'])
+    for error, count in sorted(summary['errors'].items()):
+        print('errors %s: %d' % (error, count))
+    if(options.output != None):
+        with open(options.output, 'w') as f:
+            json.dump(summary, f, indent=2, sort_keys=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,72 @@
+'''
+Benchmark of writing suggestions in JSON, with json.dumps and a default 
+callback as before, and with JSONFragments, against the time of the search.
+
+Run from the project root with
+```
+python -m benchmarks.serialize
+```
+For each query, reports the best-of-REPEATS time in ms of the search 
+(get_query_results over the index), and of writing its top 10 results and all
+its results in JSON: with json.dumps, with a JSONFragments without 
+precomputed fragments, and with one built when the cities were loaded. 
+'''
+
+import json
+import time
+from configs import ROOT_DIR
+from tools.autocomp import AutoComplete
+from tools.cityindex import CityIndex
+from tools.dataloader import DataLoader
+from tools.jsonfragments import JSONFragments
+from tools.matchresult import MatchResult
+from tools.query import Query
+from tools.scoringmethods.prefixpriority import PrefixPriority
+
+QUERIES = ['a', 'lo', 'lond', 'sageeney']
+REPEATS = 20
+
+
+def best(run):
+    '''Returns the best time in ms of run().'''
+    times = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    return min(times)*1000
+
+
+def main():
+    cities = DataLoader.get_cities_tsv(ROOT_DIR + '/data/cities_canada-usa.tsv')
+    index = CityIndex(cities)
+    pp = PrefixPriority()
+    start = time.perf_counter()
+    loaded = JSONFragments(cities)
+    print('Fragments of %d cities built in %.0f ms' % 
+          (len(cities), (time.perf_counter() - start)*1000))
+    onDemand = JSONFragments()
+
+    print('%-9s %6s %10s %10s %10s %10s %10s' % ('query', 'n', 'search ms', 
+                                  'dumps ms', 'on demand', 'loaded', 'share'))
+    for q in QUERIES:
+        query = Query(q, None, None)
+        for n in [10, -1]:
+            def search():
+                return AutoComplete().get_query_results(query, cities, pp, 0.6,
+                                                        0.1, 0.5, 0.1, index, n)
+            results = search()
+            assert(loaded.dumps(results) == 
+                   json.dumps(results, default=MatchResult.dict_repr))
+            searchTime = best(search)
+            dumpsTime = best(lambda: json.dumps(results, 
+                                                default=MatchResult.dict_repr))
+            onDemandTime = best(lambda: onDemand.dumps(results))
+            loadedTime = best(lambda: loaded.dumps(results))
+            print('%-9s %6d %10.3f %10.3f %10.3f %10.3f %9.1f%%' % 
+                  (q, len(results), searchTime, dumpsTime, onDemandTime, 
+                   loadedTime, 100*loadedTime/(searchTime + loadedTime)))
+
+
+if __name__ == '__main__':
+    main()
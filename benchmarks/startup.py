@@ -0,0 +1,67 @@
+'''
+Benchmark of worker start-up: the time and memory taken to import tools.utils,
+compared to building the punctuation table eagerly as it used to be, and to
+load the cities data set on top of either.
+
+Run from the project root with
+```
+python -m benchmarks.startup
+```
+Each case runs in a fresh interpreter; reports the best-of-5 wall time of
+the case and the peak resident set size of the interpreter.
+'''
+
+import json
+import subprocess
+import sys
+
+REPEATS = 5
+
+# How PUNCTUATION_SPACES used to be built when tools.utils was imported.
+EAGER_TABLE = '''
+import sys, unicodedata
+import tools.utils
+tools.utils.PUNCTUATION_SPACES = dict.fromkeys(i for i in range(sys.maxunicode)
+                            if unicodedata.category(chr(i)).startswith('P')
+                            or unicodedata.category(chr(i)).startswith('Z'))
+'''
+
+LOAD_DATA = '''
+from configs import ROOT_DIR
+from tools.dataloader import DataLoader
+DataLoader.get_cities_tsv(ROOT_DIR + '/data/cities_canada-usa.tsv')
+'''
+
+CASES = [('import, eager table', EAGER_TABLE),
+         ('import, lazy table', 'import tools.utils'),
+         ('load data, eager table', EAGER_TABLE + LOAD_DATA),
+         ('load data, lazy table', 'import tools.utils' + LOAD_DATA)]
+
+# Run in the child interpreter around the code of a case.
+HARNESS = '''
+import json, resource, time
+start = time.perf_counter()
+exec(compile(%r, '<case>', 'exec'))
+elapsed = time.perf_counter() - start
+print(json.dumps([elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss]))
+'''
+
+
+def run(code):
+    '''Returns the time in ms and the peak RSS in MiB of code in a new interpreter.'''
+    out = subprocess.check_output([sys.executable, '-c', HARNESS % code])
+    elapsed, maxRss = json.loads(out)
+    # ru_maxrss is in KiB on Linux.
+    return elapsed*1000, maxRss/1024.0
+
+
+def main():
+    print('%-24s %10s %10s' % ('case', 'ms', 'RSS MiB'))
+    for name, code in CASES:
+        runs = [run(code) for _ in range(REPEATS)]
+        print('%-24s %10.1f %10.1f' % (name, min(t for t, _ in runs),
+                                       min(m for _, m in runs)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,299 @@
+'''
+Benchmark suite of loading and searching, on the bundled data set and on
+synthetic data sets of growing size, with a check that every search path
+ranks cities as the original exhaustive loop does.
+
+Run from the project root with
+```
+python -m benchmarks.suite --output results.json
+python -m benchmarks.suite --sizes 10000,100000,1000000 --output scaling.json
+```
+For each data set, reports the time DataLoader.get_cities_tsv takes to read
+it and CityIndex to index it, then the per-query latency of
+AutoComplete.get_query_results (top 10, and all results) and of json_repr
+on its results, for fixed mixes of queries: single letters, prefixes, full
+names, phonetic misspellings, and prefixes with a location. Latencies are
+the best of a few runs of each query; their mean, median and maximum over
+the mix are reported. The top 10 are also searched with TrieEngine (trie
+ms), on data sets of up to LARGE cities: full names and misspellings show
+where it has to hand the query to the scan.
+
+The differential check compares the rankings returned by the scan without
+an index, the indexed scan, the indexed scan with a (distant) deadline, the
+columnar CityTable, TrieEngine and ShardedEngine with those of
+test.reference.brute_force_results, on the bundled data set and on the
+smallest synthetic one; the exit status is 1 if any differ.
+
+Everything is written as JSON to --output, to compare runs and track
+regressions; 1,000,000 cities need about 2.5 GiB of memory and a few
+minutes.
+'''
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+from benchmarks import corpus
+from configs import ROOT_DIR
+from test.reference import brute_force_results, summary
+from tools.autocomp import AutoComplete
+from tools.cityindex import CityIndex
+from tools.citytable import CityTable
+from tools.dataloader import DataLoader
+from tools.deadline import Deadline
+from tools.jsonfragments import JSONFragments
+from tools.query import Query
+from tools.scoringmethods.prefixpriority import PrefixPriority
+from tools.shardedengine import ShardedEngine
+from tools.trieengine import TrieEngine
+
+DATA_PATH = ROOT_DIR + '/data/cities_canada-usa.tsv'
+SIZES = (10000, 100000)
+NUM_RES = 10
+# Best of REPEATS runs; data sets over LARGE cities are run once.
+REPEATS = 3
+LARGE = 100000
+PARAMS = {'phoneticPenalty':0.6, 'minScore':0.1, 'altNamePenalty':0.5,
+          'proximityWeight':0.1}
+TORONTO = (43.7, -79.4)
+
+# Query mixes on the bundled data set, as (q, lat, longi).
+MIXES = {
+    'one-char': [(q, None, None) for q in ['a', 's', 'm', 't', 'w']],
+    'prefix': [(q, None, None) for q in ['lon', 'sain', 'mont', 'new y',
+                                         'vanc']],
+    'full-name': [(q, None, None) for q in ['London', 'Montreal', 'New York City',
+                                            'Saint-Jean-sur-Richelieu',
+                                            'Toronto', 'Vancouver']],
+    'misspelled': [(q, None, None) for q in ['sageeney', 'misisauga', 'tronto',
+                                             'vankouver', 'filadelfia']],
+    'location': [(q,) + TORONTO for q in ['a', 'lon', 'sain', 'mont', 'vanc']],
+}
+# Spelling changes that keep a name's sound, to misspell synthetic names.
+MISSPELLINGS = [('c', 'k'), ('ph', 'f'), ('ee', 'i'), ('ll', 'l'), ('s', 'z'),
+                ('er', 'ur'), ('o', 'oh'), ('y', 'i')]
+
+
+def synthetic_mixes(cities, seed=0):
+    '''Returns query mixes like MIXES, drawn from the names of cities.'''
+    rng = np.random.RandomState(seed)
+    names = [cities[i].origName for i in rng.choice(len(cities), 5, False)]
+    misspelled = []
+    for name in names:
+        q = name.lower()
+        for old, new in MISSPELLINGS:
+            if(old in q):
+                q = q.replace(old, new, 1)
+                break
+        misspelled.append(q)
+    prefixes = [name[0:3 + i % 3].lower() for i, name in enumerate(names)]
+    return {'one-char': [(q, None, None) for q in ['a', 's', 'm', 't', 'w']],
+            'prefix': [(q, None, None) for q in prefixes],
+            'full-name': [(q, None, None) for q in names],
+            'misspelled': [(q, None, None) for q in misspelled],
+            'location': [(q,) + TORONTO for q in ['a'] + prefixes[0:4]]}
+
+
+def best(function, repeats):
+    '''Returns the best time in ms of repeats calls of function, and its last result.'''
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return min(times)*1000, result
+
+
+def stats(times):
+    '''Returns the mean, median and maximum of a list of times in ms.'''
+    return {'mean':statistics.mean(times), 'median':statistics.median(times),
+            'max':max(times)}
+
+
+def time_queries(cities, index, mixes, repeats, trie=None):
+    '''Returns the latencies of searching and of writing JSON, per mix and numRes.
+
+    With a TrieEngine, the rows for the top NUM_RES also have the latencies
+    of searching with it.
+    '''
+    autoComplete = AutoComplete()
+    pp = PrefixPriority()
+    fragments = JSONFragments(cities)
+    rows = []
+    for mix in sorted(mixes):
+        for numRes in [NUM_RES, -1]:
+            searchTimes = []
+            jsonTimes = []
+            trieTimes = []
+            numResults = 0
+            for q, lat, longi in mixes[mix]:
+                query = Query(q, lat, longi)
+                searchTime, results = best(
+                    lambda: autoComplete.get_query_results(query, cities, pp,
+                                                           index=index,
+                                                           numRes=numRes,
+                                                           **PARAMS), repeats)
+                jsonTime, _ = best(lambda: autoComplete.json_repr(results,
+                                                                  fragments),
+                                   repeats)
+                if(trie != None and numRes >= 0):
+                    trieTimes.append(best(lambda: trie.get_query_results(query,
+                                              pp, numRes=numRes, **PARAMS),
+                                          repeats)[0])
+                searchTimes.append(searchTime)
+                jsonTimes.append(jsonTime)
+                numResults = numResults + len(results)
+            row = {'mix':mix, 'numRes':numRes, 'queries':len(mixes[mix]),
+                   'results':numResults, 'search_ms':stats(searchTimes),
+                   'json_ms':stats(jsonTimes)}
+            if(len(trieTimes) > 0):
+                row['trie_ms'] = stats(trieTimes)
+            rows.append(row)
+    return rows
+
+
+def benchmark(name, path, mixes=None):
+    '''Returns the load and query timings of the data set in the TSV file path.'''
+    repeats = REPEATS
+    loadTime, cities = best(lambda: DataLoader.get_cities_tsv(path), 1)
+    if(len(cities) > LARGE):
+        repeats = 1
+    else:
+        loadTime = min(loadTime, best(lambda: DataLoader.get_cities_tsv(path),
+                                      repeats - 1)[0])
+    indexTime, index = best(lambda: CityIndex(cities), 1)
+    trie = TrieEngine(cities, index) if len(cities) <= LARGE else None
+    if(mixes == None):
+        mixes = synthetic_mixes(cities)
+    return {'dataset':name, 'rows':len(cities), 'load_ms':loadTime,
+            'index_ms':indexTime,
+            'queries':time_queries(cities, index, mixes, repeats, trie)}
+
+
+def differential(name, path, mixes=None):
+    '''Returns, per search path, the queries whose rankings differ from brute force's.'''
+    cities = DataLoader.get_cities_tsv(path)
+    index = CityIndex(cities)
+    table = CityTable.from_cities(cities)
+    trie = TrieEngine(cities, index)
+    sharded = ShardedEngine(cities, 2)
+    autoComplete = AutoComplete()
+    pp = PrefixPriority()
+    if(mixes == None):
+        mixes = synthetic_mixes(cities)
+
+    def scan(data, index, deadline=None):
+        return lambda query, numRes: autoComplete.get_query_results(
+            query, data, pp, index=index, numRes=numRes, deadline=deadline,
+            **PARAMS)
+
+    def engine(engine):
+        return lambda query, numRes: engine.get_query_results(
+            query, pp, numRes=numRes, **PARAMS)
+
+    paths = [('scan', scan(cities, None)), ('index', scan(cities, index)),
+             ('deadline', scan(cities, index, Deadline(3600))),
+             ('columnar', scan(table, index)), ('trie', engine(trie)),
+             ('sharded', engine(sharded))]
+    mismatches = dict((path, []) for path, _ in paths)
+    numQueries = 0
+    try:
+        for mix in sorted(mixes):
+            for q, lat, longi in mixes[mix]:
+                query = Query(q, lat, longi)
+                expected = summary(brute_force_results(query, cities, pp,
+                                                       **PARAMS))
+                for numRes in [NUM_RES, -1]:
+                    numQueries = numQueries + 1
+                    top = expected if numRes < 0 else expected[0:numRes]
+                    for path, search in paths:
+                        if(summary(search(query, numRes)) != top):
+                            mismatches[path].append([q, lat, longi, numRes])
+    finally:
+        sharded.close()
+    return [{'dataset':name, 'rows':len(cities), 'path':path,
+             'queries':numQueries, 'mismatches':mismatches[path]}
+            for path, _ in paths]
+
+
+def environment():
+    '''Returns what the timings depend on besides the code: versions and machine.'''
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                         cwd=ROOT_DIR, stderr=subprocess.DEVNULL)
+        commit = commit.decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit':commit, 'python':platform.python_version(),
+            'numpy':np.__version__, 'platform':platform.platform(),
+            'cpus':os.cpu_count(),
+            'date':time.strftime('%Y-%m-%dT%H:%M:%S%z')}
+
+
+def print_benchmark(result):
+    print('%s: %d cities, load %.0f ms, index %.0f ms'
+          % (result['dataset'], result['rows'], result['load_ms'],
+             result['index_ms']))
+    print('  %-12s %6s %8s %10s %10s %10s %10s' % ('mix', 'n', 'results',
+                                                    'search ms', 'max ms',
+                                                    'json ms', 'trie ms'))
+    for row in result['queries']:
+        trie = '%10.2f' % row['trie_ms']['mean'] if 'trie_ms' in row else ''
+        print(('  %-12s %6d %8d %10.2f %10.2f %10.3f %s'
+               % (row['mix'], row['numRes'], row['results'],
+                  row['search_ms']['mean'], row['search_ms']['max'],
+                  row['json_ms']['mean'], trie)).rstrip())
+
+
+def main(args):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.suite',
+                                     description='Benchmark loading and '
+                                     'searching, and check search rankings.')
+    parser.add_argument('--sizes', default=','.join(str(n) for n in SIZES),
+                        help='comma-separated numbers of synthetic cities; '
+                        'empty for none (default: %(default)s)')
+    parser.add_argument('--output', help='path of the JSON results')
+    parser.add_argument('--no-check', action='store_true',
+                        help='skip the differential check')
+    options = parser.parse_args(args)
+    sizes = [int(n) for n in options.sizes.split(',') if n.strip()]
+
+    results = {'environment':environment(), 'benchmarks':[],
+               'differential':[]}
+    tmp = tempfile.mkdtemp()
+    try:
+        datasets = [('cities_canada-usa', DATA_PATH, MIXES)]
+        for size in sorted(sizes):
+            path = os.path.join(tmp, 'cities_%d.tsv' % size)
+            corpus.write(path, size)
+            datasets.append(('synthetic_%d' % size, path, None))
+
+        for name, path, mixes in datasets:
+            results['benchmarks'].append(benchmark(name, path, mixes))
+            print_benchmark(results['benchmarks'][-1])
+
+        if(not options.no_check):
+            for name, path, mixes in datasets[0:2]:
+                results['differential'].extend(differential(name, path, mixes))
+            for row in results['differential']:
+                print('%s: %-9s %d queries, %d mismatches'
+                      % (row['dataset'], row['path'], row['queries'],
+                         len(row['mismatches'])))
+    finally:
+        shutil.rmtree(tmp)
+
+    if(options.output != None):
+        with open(options.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    return 1 if any(row['mismatches'] for row in results['differential']) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
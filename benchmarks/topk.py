@@ -0,0 +1,93 @@
+'''
+Benchmark of keeping the top n results in a bounded heap versus sorting all
+of them, on the short queries that match the most cities.
+
+Run from the project root with
+```
+python -m benchmarks.topk
+```
+For each query, reports the best-of-5 latency of get_query_results and the
+peak memory allocated during the call (as measured by tracemalloc), when all
+results are sorted and sliced (n < 0, as before) and when only the top n are
+kept. The candidates of each query are looked up before either is measured
+(see PrecomputedIndex), so that both only measure scoring and ranking.
+On the bundled data set, e.g. 321 KiB sorted against 2 KiB for the top 10
+for 'a', and 270 against 2 KiB for 'lo'; the top n is also faster for the
+longer queries, whose candidates are mostly pruned.
+'''
+
+import time
+import tracemalloc
+from configs import ROOT_DIR
+from tools.autocomp import AutoComplete
+from tools.cityindex import CityIndex
+from tools.dataloader import DataLoader
+from tools.query import Query
+from tools.scoringmethods.prefixpriority import PrefixPriority
+
+QUERIES = ['a', 's', 'sa', 'lo', 'mo']
+NUM_RES = 10
+REPEATS = 5
+
+
+class PrecomputedIndex(object):
+    '''A CityIndex whose candidates for one query are looked up beforehand.
+
+    The candidates of a query take the same memory whatever numRes is, and
+    would otherwise make most of the peak allocation of both modes.
+    '''
+
+    def __init__(self, index, query, scoreMethod, phoneticPenalty, minScore,
+                 altNamePenalty):
+        self.index = index
+        queryStr, pq = AutoComplete().preprocess_query(query.q)
+        self.found = index.candidates(queryStr, pq, scoreMethod, phoneticPenalty,
+                                      minScore, altNamePenalty)
+
+    def candidates(self, *args):
+        return self.found
+
+    def __getattr__(self, name):
+        return getattr(self.index, name)
+
+
+def measure(search):
+    '''Returns the best time in ms and the peak allocation in KiB of search().'''
+    best = None
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        search()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best == None else min(best, elapsed)
+
+    tracemalloc.start()
+    search()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return best*1000, peak/1024.0
+
+
+def main():
+    cities = DataLoader.get_cities_tsv(ROOT_DIR + '/data/cities_canada-usa.tsv')
+    index = CityIndex(cities)
+    pp = PrefixPriority()
+
+    def search(query, precomputed, numRes):
+        results = AutoComplete().get_query_results(query, cities, pp, 0.6, 0.1,
+                                                   0.5, 0.1, precomputed, numRes)
+        return results[0:NUM_RES]
+
+    print('%-6s %12s %12s %12s %12s' % ('query', 'sort ms', 'top-n ms',
+                                        'sort KiB', 'top-n KiB'))
+    for q in QUERIES:
+        query = Query(q, None, None)
+        precomputed = PrecomputedIndex(index, query, pp, 0.6, 0.1, 0.5)
+        sortTime, sortMem = measure(lambda: search(query, precomputed, -1))
+        topTime, topMem = measure(lambda: search(query, precomputed, NUM_RES))
+        print('%-6s %12.1f %12.1f %12.1f %12.1f' % (q, sortTime, topTime,
+                                                    sortMem, topMem))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+'''
+Benchmark of applying the daily changes of geonames to a loaded data set
+(SearchService.updated()), against building the service over the changed
+data set again.
+
+Run from the project root with
+```
+python -m benchmarks.update
+python -m benchmarks.update --size 1000000 --diffs 0,100,10000
+```
+The data set is synthetic (see benchmarks.corpus), with --size cities, and
+the service's cache is filled with the suggestions of a few hundred
+prefixes first. A diff of n records modifies n/2 cities (new name and
+population), adds n/4 and deletes n/4. Reports, for each diff size, the
+best of three times to update the service, the time to build it again, and
+the share of the cached suggestions kept by the update.
+'''
+
+import argparse
+import random
+import sys
+import time
+from benchmarks import corpus
+from tools.cache import SuggestionCache
+from tools.dataloader import DataLoader
+from tools.geonamesdiff import GeonamesDiff
+from tools.searchservice import SearchService
+
+# Number of prefixes whose suggestions fill the cache.
+NUM_CACHED = 500
+
+
+def city(row):
+    '''Returns the City of a row of benchmarks.corpus.'''
+    return DataLoader.city(dict(zip(corpus.HEADER, row)))
+
+
+def diff(cities, rows, size, rng):
+    '''Returns a GeonamesDiff of size records over cities; new cities are made from rows.'''
+    modified = []
+    for old in rng.sample(cities, size//2):
+        row = next(rows)
+        row[0] = str(old.ID)
+        modified.append(city(row))
+    modified.extend(city(next(rows)) for _ in range(size//4))
+    deleted = [old.ID for old in rng.sample(cities, size//4)]
+    return GeonamesDiff(modified, deleted)
+
+
+def main(args):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.update',
+                                     description='Time incremental updates '
+                                     'of the data set against full rebuilds.')
+    parser.add_argument('--size', type=int, default=100000,
+                        help='number of cities of the data set')
+    parser.add_argument('--diffs', default='0,10,100,1000',
+                        help='comma-separated numbers of records of the diffs')
+    options = parser.parse_args(args)
+    sizes = [int(size) for size in options.diffs.split(',')]
+
+    rows = corpus.rows(options.size + sum(sizes), seed=1)
+    cities = [city(next(rows)) for _ in range(options.size)]
+    rng = random.Random(0)
+    service = SearchService(cities, cache=SuggestionCache(NUM_CACHED*2))
+    for prefixed in rng.sample(cities, NUM_CACHED):
+        service.suggestions(prefixed.origName[0:rng.randint(2, 5)])
+
+    print('%d cities, %d cached suggestions' % (len(cities), len(service.cache)))
+    print('%8s %12s %12s %8s' % ('records', 'update ms', 'rebuild ms', 'kept'))
+    for size in sizes:
+        changes = diff(cities, rows, size, rng)
+        best = None
+        for _ in range(3):
+            start = time.perf_counter()
+            updated = service.updated(changes)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best == None else min(best, elapsed)
+        start = time.perf_counter()
+        SearchService(updated.cities)
+        rebuild = time.perf_counter() - start
+        print('%8d %12.1f %12.1f %7.0f%%' % (size, best*1000, rebuild*1000,
+                                             100.0*len(updated.cache)/
+                                             max(1, len(service.cache))))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
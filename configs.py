@@ -8,3 +8,79 @@ import os
 
 # Project root 
 ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Search engine behind the /suggestions endpoint: 'scan' scores every city 
+# that could match (AutoComplete.get_query_results), 'trie' uses 
+# tools.trieengine.TrieEngine, and 'sharded' spreads the scan over SHARDS
+# worker processes (tools.shardedengine.ShardedEngine; None for one per CPU). 
+# All return the same results. 
+SEARCH_ENGINE = 'scan'
+SHARDS = None
+
+# Milliseconds a /suggestions search may take unless the caller gives 
+# timeout_ms, after which the best suggestions found so far (most populous 
+# cities first) are returned, as {"suggestions": [...], "partial": true}; 
+# None for no limit. 
+SEARCH_TIMEOUT_MS = None
+
+# Latency histograms and counters served at /metrics (tools.metrics.Metrics):
+# the scoring passes of one query in METRICS_PASS_SAMPLE are timed, as timing
+# them costs more than the other stages (0 for never). 
+METRICS_PASS_SAMPLE = 100
+
+# Number of the latest queries kept, with their latencies, by the query log 
+# served at /querylog (tools.querylog.QueryLog), to replay them with 
+# benchmarks.replay; 0 disables it. The log holds users' queries, locations
+# and session tokens, so it is only served with the ADMIN_TOKEN below. 
+QUERY_LOG_SIZE = 0
+
+# Hot reload of the data set (tools.reloader.Reloader), also done on SIGHUP: 
+# seconds between checks of the modification times of the TSV file and its 
+# snapshot (None for never), seconds a replaced search service is kept open 
+# for the requests still using it, and the token a POST to /admin/reload (and
+# a GET of /querylog) must give as 'Authorization: Bearer <token>' (None 
+# disables those endpoints). 
+RELOAD_POLL_SECONDS = 60
+RELOAD_GRACE_SECONDS = 30
+ADMIN_TOKEN = None
+
+# Daily modification and deletion files of geonames applied to the data set
+# (tools.geonamesdiff.GeonamesDiff), by a POST to /admin/update with the same
+# token or with python -m tools.geonamesdiff: only the cities of these
+# countries with at least this population are kept, as in the bundled data set.
+UPDATE_COUNTRIES = ('CA', 'US')
+UPDATE_MIN_POPULATION = 5000
+
+# Cache of /suggestions responses (tools.cache.SuggestionCache): maximum number
+# of entries (0 disables it), seconds before an entry expires (None for never),
+# and size in decimal degrees of the grid callers' locations are snapped to 
+# (0 for exact locations). Snapping happens before the search, so the grid 
+# also coarsens the proximity weighting of the suggestions, not just the 
+# cache key; with the cache disabled, locations are not snapped. 
+CACHE_SIZE = 10000
+CACHE_TTL_SECONDS = 3600
+CACHE_GRID_DEGREES = 0.1
+
+# State kept for the session parameter of /suggestions: maximum number of 
+# sessions, and seconds a session is kept after it starts. A session only 
+# holds the key of its latest candidates, which all sessions share in a cache
+# bounded by CityIndex.CANDIDATE_SET_BYTES (see tools.cityindex). 
+SESSION_CACHE_SIZE = 10000
+SESSION_TTL_SECONDS = 600
+
+# Snapshot of the preprocessed data set, compiled with 
+# python -m tools.snapshot data/cities_canada-usa.tsv data/cities_canada-usa.snapshot
+# Loaded instead of the TSV file when present and up to date. 
+SNAPSHOT_PATH = os.path.join(ROOT_DIR, 'data', 'cities_canada-usa.snapshot')
+
+# Store the cities in a columnar tools.citytable.CityTable rather than a list 
+# of City objects: much less memory, slower searches. 
+COLUMNAR_CITIES = False
+
+# ASGI entry point (asgi.py): number of threads searches run in (None for the
+# ThreadPoolExecutor default), maximum number of searches running or waiting
+# before requests are turned away with 503, and seconds a request may wait for
+# its suggestions before 504 (None for no limit). 
+ASGI_WORKERS = None
+ASGI_MAX_PENDING = 64
+ASGI_TIMEOUT_SECONDS = 2.0
@@ -1,17 +1,73 @@
 # -*- coding: utf-8 -*-
 
-from flask import Flask, request
-from tools.autocomp import AutoComplete
-from tools.dataloader import DataLoader
-
-from tools.scoringmethods.prefixpriority import PrefixPriority
+import hmac
+import json
+import os
+import tempfile
+from flask import Flask, Response, request, stream_with_context
+from tools.searchservice import SearchService
+from tools.cache import LRUCache, SuggestionCache
+from tools.geonamesdiff import GeonamesDiff
+from tools.metrics import Metrics
+from tools.querylog import QueryLog
+from tools.reloader import Reloader
+from tools.utils import to_float
+from configs import SEARCH_ENGINE, CACHE_SIZE, CACHE_TTL_SECONDS, CACHE_GRID_DEGREES
+from configs import SESSION_CACHE_SIZE, SESSION_TTL_SECONDS, SNAPSHOT_PATH
+from configs import COLUMNAR_CITIES, SHARDS, SEARCH_TIMEOUT_MS
+from configs import METRICS_PASS_SAMPLE, QUERY_LOG_SIZE
+from configs import RELOAD_POLL_SECONDS, RELOAD_GRACE_SECONDS, ADMIN_TOKEN
+from configs import UPDATE_COUNTRIES, UPDATE_MIN_POPULATION
 
 app = Flask(__name__)
 
-# Load the cities data set. 
-dataPath = 'data/cities_canada-usa.tsv'
-cities = DataLoader.get_cities_tsv(dataPath)
+# The search service over the current data set; shared by all requests. 
+service = None
+# Metrics of all queries, served at /metrics; kept when the data is reloaded. 
+metrics = Metrics(METRICS_PASS_SAMPLE)
+# The latest queries, served at /querylog; also kept when the data is reloaded. 
+queryLog = QueryLog(QUERY_LOG_SIZE) if QUERY_LOG_SIZE > 0 else None
+
+def build_service(cities, index):
+    '''Returns a new search service over a data set, with the settings of configs.py.
     
+    The new service comes with an empty cache and no sessions, as those of 
+    the old one are for the old data. 
+    '''
+    return SearchService(cities, index, engine=SEARCH_ENGINE, numShards=SHARDS, 
+                         # Suggestions already computed, shared by callers 
+                         # typing the same thing. 
+                         # Locations are only snapped to the grid for the 
+                         # cache's sake. 
+                         cache=SuggestionCache(CACHE_SIZE, CACHE_TTL_SECONDS, 
+                                               CACHE_GRID_DEGREES 
+                                               if CACHE_SIZE > 0 else 0), 
+                         # State kept between the queries of each session; 
+                         # see the session parameter. 
+                         sessions=LRUCache(SESSION_CACHE_SIZE, 
+                                           SESSION_TTL_SECONDS),
+                         timeoutMs=SEARCH_TIMEOUT_MS, metrics=metrics,
+                         queryLog=queryLog)
+
+def swap_service(new):
+    '''Serve requests with the search service new from now on; returns the old one.'''
+    global service
+    old = service
+    service = new
+    return old
+
+# Load the cities data set, and reload it in the background when its files 
+# change, on SIGHUP, or on a POST to /admin/reload. Not in the worker 
+# processes of a 'sharded' engine, which import this module again as 
+# '__mp_main__' when it is run as a script (see tools.shardedengine). 
+dataPath = 'data/cities_canada-usa.tsv'
+reloader = Reloader(dataPath, SNAPSHOT_PATH, build_service, swap_service, 
+                    COLUMNAR_CITIES, RELOAD_GRACE_SECONDS, app.logger)
+if(__name__ != '__mp_main__'):
+    reloader.reload_now()
+    reloader.start(RELOAD_POLL_SECONDS)
+    reloader.listen()
+
 @app.route('/suggestions')
 def autocomplete():
     '''Returns query completion suggestions for city names in JSON format. 
@@ -25,26 +81,52 @@ def autocomplete():
     The parameters for the HTTP request are:
         q -- the (UTF-8) query string. If q is empty, '{}' is returned. 
         latitude -- [OPTIONAL] decimal degree latitude of caller. If value provided
-                    is not a floating point number, it is ignored. 
+                    is not a finite floating point number, it is ignored. 
         latitude -- [OPTIONAL] decimal degree longitude of caller. If value provided
-                    is not a floating point number, it is ignored. 
+                    is not a finite floating point number, it is ignored. 
         n -- [OPTIONAL] the number of suggestions to return. If no value is provided,
              or the value provided is badly formatted (not an integer), then 
              a default of 10 is used. If a negative value is supplied, all 
              suggestions with a score above a certain threshold are returned. 
+        format -- [OPTIONAL] if 'ndjson' and n is negative, the suggestions
+                  are returned as newline-delimited JSON, one per line, 
+                  rather than as a list. 
+        session -- [OPTIONAL] token chosen by the client, the same for all the 
+                   queries made as a user types. If given, the cities that 
+                   could match the previous query of the session are reused 
+                   for the next one where possible (e.g. 'lond' after 'lon'),
+                   rather than looked up again. The suggestions are the same 
+                   either way. 
+        timeout_ms -- [OPTIONAL] milliseconds the search may take (by 
+                      default, SEARCH_TIMEOUT_MS in configs.py). After that,
+                      the best suggestions found so far are returned, 
+                      scoring the most populous cities first. If given, the
+                      suggestions are returned as the list of a JSON object
+                      {"suggestions": [...], "partial": true or false}, 
+                      partial being true if the search was cut short. A 
+                      search cut short by SEARCH_TIMEOUT_MS is answered 
+                      the same way even without timeout_ms. 
+                      Ignored if n is negative. 
+    
+    Suggestions are cached; the caller's location is snapped to a grid of 
+    CACHE_GRID_DEGREES (see configs.py) so that nearby callers share them.
+    All suggestions (negative n) are not cached but streamed as they are 
+    serialised, so that their JSON is not all held in memory at once; the
+    matches are, in a compact form, to be ranked (see 
+    AutoComplete.iter_query_results). 
     '''
     
     q = request.args.get('q', type=str)
-    lat = request.args.get('latitude', type=float)
-    longi = request.args.get('longitude', type=float)
+    lat = to_float(request.args.get('latitude'))
+    longi = to_float(request.args.get('longitude'))
     # Also added an argument for number of results to return.
     # Use negative number if want to return all.
     n = request.args.get('n', type=int)
-    
-    '''Parameters for AutoComplete. If we wanted to, could also customise parameters
-    for PrefixPriority'''
-    params = {'scoreMethod':PrefixPriority(), 'phoneticPenalty':0.6, 'minScore':0.1,
-              'altNamePenalty':0.5, 'proximityWeight':0.1}
+    token = request.args.get('session', type=str)
+    ndjson = request.args.get('format', type=str) == 'ndjson'
+    timeoutMs = to_float(request.args.get('timeout_ms'))
+    if(timeoutMs != None and timeoutMs < 0):
+        timeoutMs = None
     
     if(n != None and type(n) is int):
         numRes = n 
@@ -54,7 +136,136 @@ def autocomplete():
     if(q == None or len(q) == 0):
         return "{}" 
 
-    return AutoComplete().get_suggestions_json(q, lat, longi, cities, params, numRes)
+    if(numRes < 0):
+        chunks = service.suggestions_stream(q, lat, longi, ndjson, token)
+        return Response(stream_with_context(chunks), mimetype=
+                        'application/x-ndjson' if ndjson else None)
+    
+    return service.suggestions(q, lat, longi, numRes, token, timeoutMs)
+    
+
+@app.route('/metrics')
+def get_metrics():
+    '''Returns the latency histograms and counters of the queries, in the Prometheus text format.'''
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+    
+
+@app.route('/querylog')
+def get_query_log():
+    '''Returns the latest queries and their latencies, one JSON object per line; see tools.querylog.
+    
+    The queries are the users', with their locations and session tokens, so
+    the log is authorised as /admin/reload. 
+    '''
+    denied = admin_denied()
+    if(denied != None):
+        return denied
+    if(queryLog == None):
+        return 'The query log is disabled\n', 404
+    return Response(queryLog.ndjson(), mimetype='application/x-ndjson')
+    
+
+def admin_denied():
+    '''Returns the response to an admin request without the ADMIN_TOKEN, or None if it has it.'''
+    if(ADMIN_TOKEN == None):
+        return 'Not Found\n', 404
+    given = request.headers.get('Authorization', '').encode('utf-8')
+    if(not hmac.compare_digest(given, ('Bearer ' + ADMIN_TOKEN).encode('utf-8'))):
+        return 'Forbidden\n', 403
+    return None
+    
+
+@app.route('/admin/reload', methods=['POST'])
+def admin_reload():
+    '''Reloads the cities data set in the background; see tools.reloader.
+    
+    The current data set is served until the new one is ready. Requires the 
+    header 'Authorization: Bearer <ADMIN_TOKEN>' (see configs.py); not found
+    if ADMIN_TOKEN is None. Returns 202 and the generation, time and error 
+    of the latest load, as a JSON object. 
+    '''
+    denied = admin_denied()
+    if(denied != None):
+        return denied
+    reloader.reload()
+    return Response(json.dumps(reloader.status()), status=202, 
+                    mimetype='application/json')
+    
+
+@app.route('/admin/update', methods=['POST'])
+def admin_update():
+    '''Applies the daily modification and deletion files of geonames to the data set.
+    
+    The files are sent as the multipart form fields 'modifications' and 
+    'deletions' (either may be left out), as published by geonames; only the
+    cities of UPDATE_COUNTRIES with at least UPDATE_MIN_POPULATION are kept
+    (see configs.py). The cities, their index and the cache are updated in 
+    proportion to the size of the files, and the updated data set is served 
+    as soon as this returns; see SearchService.updated(). The changes last 
+    until the next reload, unless also applied to the TSV file with 
+    python -m tools.geonamesdiff. 
+    
+    Authorised as /admin/reload. Returns the numbers of cities added or 
+    modified and deleted, and the status of the reloader, as a JSON object.
+    '''
+    denied = admin_denied()
+    if(denied != None):
+        return denied
+    paths = {}
+    try:
+        for field in ('modifications', 'deletions'):
+            upload = request.files.get(field)
+            if(upload != None):
+                fd, paths[field] = tempfile.mkstemp(suffix='.txt')
+                os.close(fd)
+                upload.save(paths[field])
+        try:
+            diff = GeonamesDiff.read(paths.get('modifications'), 
+                                     paths.get('deletions'), UPDATE_COUNTRIES, 
+                                     UPDATE_MIN_POPULATION)
+        except (TypeError, ValueError) as e:
+            return 'Not a geonames modification or deletion file: %s\n' % e, 400
+    finally:
+        for path in paths.values():
+            os.remove(path)
+    reloader.update(diff)
+    return Response(json.dumps({'modified':len(diff.modified), 
+                                'deleted':len(diff.deleted), 
+                                'status':reloader.status()}), 
+                    mimetype='application/json')
+    
+
+@app.route('/suggestions/batch', methods=['POST'])
+def autocomplete_batch():
+    '''Returns query completion suggestions for many queries, one line of JSON per query.
+    
+    For bulk jobs. The body of the HTTP POST request is a JSON list of 
+    queries, each an object with the parameters q, latitude, longitude and n
+    of /suggestions (see autocomplete()), with the same defaults. The 
+    response is newline-delimited JSON: for each query, in order, the line 
+    /suggestions would return for it. Lines are sent as they are worked 
+    out. Identical queries are only searched once, and suggestions are not
+    cached. 
+    '''
+    body = request.get_json(force=True, silent=True)
+    if(not isinstance(body, list)):
+        return 'Expected a JSON list of queries\n', 400
+    
+    def parse(item):
+        if(not isinstance(item, dict)):
+            item = {}
+        q = item.get('q')
+        lat, longi = item.get('latitude'), item.get('longitude')
+        n = item.get('n')
+        return (q if isinstance(q, str) else None, 
+                to_float(lat), to_float(longi),
+                n if type(n) is int else 10)
+    
+    queries = (parse(item) for item in body)
+    # The service as of now, even if the data is reloaded meanwhile. 
+    suggestions = service.suggestions_batch(queries)
+    lines = (line + '\n' for line in suggestions)
+    return Response(stream_with_context(lines), mimetype='application/x-ndjson')
     
 
 if __name__ == '__main__':
@@ -0,0 +1,108 @@
+'''
+Reference implementations of the original, exhaustive query scoring loop and
+of the original character-by-character prefix matcher.
+
+Optimised search paths must return exactly what this returns; tests compare
+against it rather than against hand-picked expected values. Do not "improve"
+this code - its whole point is to stay the same.
+'''
+
+from metaphone import doublemetaphone
+from tools.utils import strip_punctuation_spaces
+from tools.matchresult import MatchResult
+from tools.autocomp import AutoComplete
+
+
+def brute_force_results(query, data, scoreMethod, phoneticPenalty=0.2,
+                        minScore=0.15, altNamePenalty=0.5, proximityWeight=0.1):
+    '''Scores every name of every city in data; see AutoComplete.get_query_results'''
+    results = []
+    pq1, pq2 = doublemetaphone(query.q)
+    if(len(pq2) > 0):
+        pq = (pq1, pq2)
+    else:
+        pq = pq1,
+
+    queryStr = strip_punctuation_spaces(query.q)
+    queryStr = queryStr.upper()
+
+    for city in data:
+        maxScore = scoreMethod.score(queryStr, city.name)
+        bestName = city.origName
+
+        for name in city.altNames:
+            score = altNamePenalty * scoreMethod.score(queryStr, name)
+            if(score > maxScore):
+                maxScore = score
+                bestName = name
+
+        if(len(pq1) >=2):
+            for origName in city.phonetics:
+                for name in city.phonetics[origName]:
+                    for q in pq:
+                        score = phoneticPenalty * scoreMethod.score(q, name)
+                        if(score > maxScore):
+                            maxScore = score
+                            bestName = origName
+
+        if(query.coord != None and maxScore > minScore):
+            proxPoints = AutoComplete().proximity_points(query.coord,
+                                                         (city.latitude, city.longitude))
+            maxScore = (maxScore + proxPoints*maxScore*proximityWeight)/(1.0 + proximityWeight)
+
+        if(maxScore > minScore):
+            results.append(MatchResult(city, maxScore, bestName))
+
+    return sorted(results, key=lambda matchresult: matchresult.score, reverse=True)
+
+
+def summary(results):
+    '''Returns the parts of a list of MatchResults that a caller can observe.
+
+    Scores are rounded to 12 decimal places: proximity is computed with NumPy
+    when an index is used (see tools.coordinates), which can differ from
+    math's trigonometric functions in the last bits.
+    '''
+    return [(r.city.ID, r.hsn, round(r.score, 12)) for r in results]
+
+
+def reference_get_matches(pattern, text, minLength=1):
+    '''The original simpleprefixmatch.get_matches.'''
+    matches = []
+    matchLen = 0
+    i = 0
+    j = 0
+
+    if(len(pattern) == 0 or len(text) == 0):
+        return []
+
+    while(j < len(text)):
+        if(i == len(pattern)):
+            i = 0
+            if(matchLen == len(pattern)):
+                matches.append((j-matchLen, matchLen))
+
+            matchLen = 0
+
+        if(pattern[i] == text[j]):
+            matchLen = matchLen + 1
+            i = i + 1
+
+        else:
+            if(matchLen >= minLength):
+                matches.append((j-matchLen, matchLen))
+
+            if(matchLen > 0):
+                i = 0
+                matchLen = 0
+                j = j - 1
+
+        j = j + 1
+
+    if(matchLen >= minLength):
+        if(j == len(text) - 1):
+            matches.append((j+1-matchLen, matchLen))
+        else:
+            matches.append((j-matchLen, matchLen))
+
+    return matches
@@ -0,0 +1,160 @@
+'''
+Tests of the ASGI application: same responses as the search service, and
+admission control, deadlines and cancellation.
+'''
+
+import asyncio
+import threading
+import unittest
+from tools.asgiapp import SuggestionsApp
+from tools.cache import LRUCache
+from tools.dataloader import DataLoader
+from tools.metrics import Metrics
+from tools.querylog import QueryLog
+from tools.searchservice import SearchService
+from configs import ROOT_DIR
+
+
+async def call(app, path, query, disconnect=None, headers=()):
+    '''Returns (status, body) of a GET request to app, or None if nothing was sent.'''
+    messages = []
+
+    async def receive():
+        if(disconnect != None):
+            await disconnect.wait()
+        else:
+            await asyncio.sleep(3600)
+        return {'type':'http.disconnect'}
+
+    async def send(message):
+        messages.append(message)
+
+    await app({'type':'http', 'method':'GET', 'path':path,
+               'query_string':query.encode('utf-8'), 'headers':list(headers)},
+              receive, send)
+    if(len(messages) == 0):
+        return None
+    return (messages[0]['status'],
+            b''.join(m.get('body', b'') for m in messages[1:]).decode('utf-8'))
+
+
+class TestSuggestionsApp(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cities = DataLoader.get_cities_tsv(ROOT_DIR + '/data/cities_canada-usa.tsv')
+        cls.service = SearchService(cities, sessions=LRUCache(100))
+
+    def setUp(self):
+        self.app = SuggestionsApp(self.service, 1, 3, 5.0)
+        self.release = threading.Event()
+
+    def tearDown(self):
+        self.release.set()
+        self.app.executor.shutdown()
+
+    def block(self):
+        '''Occupies the only thread of the app until self.release is set.'''
+        return self.app.submit(self.release.wait)
+
+    def test_same_as_service(self):
+        async def run():
+            self.assertEqual(await call(self.app, '/suggestions', 'q=lond&n=3'),
+                             (200, self.service.suggestions('lond', None, None, 3)))
+            self.assertEqual(await call(self.app, '/suggestions',
+                                        'q=Qu%C3%A9bec&latitude=45.5&longitude=x'),
+                             (200, self.service.suggestions(u'Québec', 45.5)))
+            # Not percent-encoded.
+            self.assertEqual(await call(self.app, '/suggestions', u'q=Montréal'),
+                             (200, self.service.suggestions(u'Montréal')))
+            self.assertEqual(await call(self.app, '/suggestions', 'q=ab&n=-1'),
+                             (200, self.service.suggestions('ab', None, None, -1)))
+            self.assertEqual(await call(self.app, '/suggestions', 'q='), (200, '{}'))
+            self.assertEqual((await call(self.app, '/other', 'q=a'))[0], 404)
+            self.assertEqual((await call(self.app, '/metrics', ''))[0], 404)
+        asyncio.run(run())
+        self.assertEqual(self.app.pending, 0)
+
+    def test_metrics(self):
+        self.app.service = SearchService(self.service.cities, self.service.index,
+                                         metrics=Metrics())
+        
+        async def run():
+            await call(self.app, '/suggestions', 'q=lond')
+            status, body = await call(self.app, '/metrics', '')
+            self.assertEqual(status, 200)
+            self.assertIn('autocomplete_requests_total 1\n', body)
+        asyncio.run(run())
+
+    def test_query_log(self):
+        self.app.service = SearchService(self.service.cities, self.service.index,
+                                         queryLog=QueryLog())
+
+        async def run():
+            await call(self.app, '/suggestions', 'q=lond&latitude=43.7&n=3')
+            # Only served with the admin token.
+            self.assertEqual((await call(self.app, '/querylog', ''))[0], 404)
+            self.app.adminToken = 'secret'
+            self.assertEqual((await call(self.app, '/querylog', ''))[0], 403)
+            self.assertEqual((await call(self.app, '/querylog', '', headers=[
+                (b'authorization', b'Bearer wrong')]))[0], 403)
+            status, body = await call(self.app, '/querylog', '', headers=[
+                (b'authorization', b'Bearer secret')])
+            self.assertEqual(status, 200)
+            self.assertEqual([(r['q'], r['latitude'], r['n'])
+                              for r in QueryLog.read(body.splitlines())],
+                             [('lond', 43.7, 3)])
+        asyncio.run(run())
+
+    def test_admission_control(self):
+        async def run():
+            self.block()
+            self.block()
+            self.block()
+            status, _ = await call(self.app, '/suggestions', 'q=lond')
+            self.assertEqual(status, 503)
+            self.release.set()
+        asyncio.run(run())
+
+    def test_deadline(self):
+        self.app.timeout = 0.05
+
+        async def run():
+            self.block()
+            status, _ = await call(self.app, '/suggestions', 'q=lond')
+            self.assertEqual(status, 504)
+            self.release.set()
+        asyncio.run(run())
+
+    def test_superseded(self):
+        async def run():
+            self.block()
+            first = asyncio.ensure_future(call(self.app, '/suggestions',
+                                               'q=lo&session=abc'))
+            await asyncio.sleep(0.01)
+            second = asyncio.ensure_future(call(self.app, '/suggestions',
+                                                'q=lon&session=abc'))
+            await asyncio.sleep(0.01)
+            self.release.set()
+            self.assertEqual((await first)[0], 409)
+            self.assertEqual(await second, (200, self.service.suggestions('lon')))
+            self.assertEqual(self.app.latest, {})
+        asyncio.run(run())
+
+    def test_disconnect(self):
+        async def run():
+            self.block()
+            disconnect = asyncio.Event()
+            request = asyncio.ensure_future(call(self.app, '/suggestions', 'q=lond',
+                                                 disconnect))
+            await asyncio.sleep(0.01)
+            self.assertEqual(self.app.pending, 2)
+            disconnect.set()
+            self.assertEqual(await request, None)
+            # The search was dropped before it started.
+            self.assertEqual(self.app.pending, 1)
+        asyncio.run(run())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,8 +2,19 @@
 Unit tests for utility methods in AutoComplete class in autocomp.py 
 '''
 
+import itertools
+import json
 import unittest
 from tools.autocomp import AutoComplete
+from tools.city import City
+from tools.cityindex import CityIndex
+from tools.coordinates import CityCoordinates
+from tools.dataloader import DataLoader
+from tools.deadline import Deadline
+from tools.query import Query
+from tools.scoringmethods.prefixpriority import PrefixPriority
+from configs import ROOT_DIR
+from test.reference import brute_force_results, summary
 
 class TestProximityPoint(unittest.TestCase):
     
@@ -43,6 +54,162 @@ class TestProximityPoint(unittest.TestCase):
         score = AutoComplete().proximity_points(a, b)
         self.assertTrue(abs(score - 1.0) < 0.01 and score <= 1.0)
 
+
+class TestCityCoordinates(unittest.TestCase):
+    
+    def test_same_as_scalar(self):
+        cities = [City(i, 'X', [], lat, longi, 'CA') for i, (lat, longi) in 
+                  enumerate([(80, -10), (-80, 170), (0, 0), (43.7, -79.4), 
+                             (90, 0), (-90, 0), (20.45, 141.55)])]
+        coords = CityCoordinates(cities)
+        positions = [6, 0, 1, 2, 3, 4, 5]
+        for query in [(20.45, 141.55), (0, -20), (-90, 0)]:
+            points = coords.proximity_points(query, positions)
+            weighed = coords.weigh_proximity(query, positions, [0.5]*7, 0.1)
+            for i, pos in enumerate(positions):
+                city = cities[pos]
+                expected = AutoComplete().proximity_points(query, 
+                                                (city.latitude, city.longitude))
+                self.assertAlmostEqual(points[i], expected, places=12)
+                expected = AutoComplete().weigh_proximity(0.5, query, city, 0.1)
+                self.assertAlmostEqual(weighed[i], expected, places=12)
+                self.assertIs(type(weighed[i]), float)
+
+
+
+class TestSuggestionsBatch(unittest.TestCase):
+    
+    @classmethod
+    def setUpClass(cls):
+        cls.cities = DataLoader.get_cities_tsv(ROOT_DIR + '/data/cities_canada-usa.tsv')
+        cls.params = {'scoreMethod':PrefixPriority(), 'phoneticPenalty':0.6, 
+                      'minScore':0.1, 'altNamePenalty':0.5, 'proximityWeight':0.1,
+                      'index':CityIndex(cls.cities)}
+    
+    def test_same_as_one_by_one(self):
+        queries = [('lond', None, None, 10), ('lond', 43.7, -79.4, 10), 
+                   ('', None, None, 10), ('lond', None, None, 10), 
+                   ['sageeney', None, None, 3], (None, 1.0, 2.0, 10), 
+                   ('vanc', None, None, -1), ('lond', 43.7, -79.4, 10), 
+                   ('st.john', 45.0, -66.0, 0)]
+        expected = []
+        for q, lat, longi, numRes in queries:
+            if(q == None or len(q) == 0):
+                expected.append('{}')
+            else:
+                expected.append(AutoComplete().get_suggestions_json(q, lat, 
+                                        longi, self.cities, self.params, numRes))
+        for chunkSize, maxSeenChars in [(256, 8*1024*1024), (2, 200), (1, 0)]:
+            actual = list(AutoComplete().get_suggestions_batch(queries, 
+                                self.cities, self.params, chunkSize, maxSeenChars))
+            self.assertEqual(actual, expected, (chunkSize, maxSeenChars))
+    
+    def test_streams(self):
+        '''Suggestions come as soon as their chunk is done, even from an endless stream.'''
+        queries = (('lon' if i % 2 else 'mont', None, None, 5) 
+                   for i in itertools.count())
+        batch = AutoComplete().get_suggestions_batch(queries, self.cities, 
+                                                     self.params, 4)
+        first = list(itertools.islice(batch, 6))
+        self.assertEqual(first[0], AutoComplete().get_suggestions_json('mont',
+                                None, None, self.cities, self.params, 5))
+        self.assertEqual(first[0:2]*3, first)
+
+
+
+class TestSuggestionsStream(unittest.TestCase):
+    
+    @classmethod
+    def setUpClass(cls):
+        cls.cities = DataLoader.get_cities_tsv(ROOT_DIR + '/data/cities_canada-usa.tsv')
+        cls.params = {'scoreMethod':PrefixPriority(), 'phoneticPenalty':0.6, 
+                      'minScore':0.1, 'altNamePenalty':0.5, 'proximityWeight':0.1}
+        cls.index = CityIndex(cls.cities)
+    
+    def test_iter_query_results(self):
+        pp = PrefixPriority()
+        for q, lat, longi in [('a', None, None), ('lond', 43.7, -79.4), 
+                              ('vfdeth', None, None)]:
+            query = Query(q, lat, longi)
+            for index in [None, self.index]:
+                expected = AutoComplete().get_query_results(query, self.cities, 
+                                            pp, 0.6, 0.1, 0.5, 0.1, index)
+                actual = AutoComplete().iter_query_results(query, self.cities, 
+                                            pp, 0.6, 0.1, 0.5, 0.1, index)
+                self.assertEqual(summary(list(actual)), summary(expected), q)
+    
+    def test_same_json(self):
+        '''The chunks make up exactly the JSON of all suggestions.'''
+        for params in [self.params, dict(self.params, index=self.index)]:
+            for q, lat, longi in [('s', None, None), ('lond', 43.7, -79.4), 
+                                  ('vfdeth', None, None)]:
+                expected = AutoComplete().get_suggestions_json(q, lat, longi, 
+                                                    self.cities, params, -1)
+                for chunkSize in [1, 7, 256]:
+                    chunks = list(AutoComplete().get_suggestions_stream(q, lat, 
+                                    longi, self.cities, params, False, chunkSize))
+                    self.assertEqual(''.join(chunks), expected, (q, chunkSize))
+                
+                lines = ''.join(AutoComplete().get_suggestions_stream(q, lat, 
+                                    longi, self.cities, params, True, 7))
+                self.assertEqual([json.loads(line) for line in lines.splitlines()],
+                                 json.loads(expected))
+                self.assertTrue(lines == '' or lines.endswith('}\n'))
+    
+    def test_chunks(self):
+        chunks = list(AutoComplete().get_suggestions_stream('a', None, None, 
+                                            self.cities, self.params, True, 100))
+        self.assertGreater(len(chunks), 10)
+        self.assertEqual(chunks[0].count('\n'), 99)
+
+
+
+class TestDeadline(unittest.TestCase):
+    
+    @classmethod
+    def setUpClass(cls):
+        cls.cities = DataLoader.get_cities_tsv(ROOT_DIR + '/data/cities_canada-usa.tsv')
+        cls.index = CityIndex(cls.cities)
+    
+    def results(self, q, deadline, numRes=-1, index=None):
+        return AutoComplete().get_query_results(Query(q, None, None), self.cities, 
+                                                PrefixPriority(), 0.6, 0.1, 0.5,
+                                                0.1, index, numRes, None, deadline)
+    
+    def test_not_reached(self):
+        for q in ['a', 'lond']:
+            for index in [None, self.index]:
+                for numRes in [-1, 10]:
+                    deadline = Deadline(3600)
+                    self.assertEqual(summary(self.results(q, deadline, numRes, 
+                                                          index)),
+                                     summary(self.results(q, None, numRes, index)))
+                    self.assertFalse(deadline.reached)
+    
+    def test_reached(self):
+        deadline = Deadline(0)
+        self.assertEqual(self.results('a', deadline, 10, self.index), [])
+        self.assertTrue(deadline.reached)
+    
+    def test_most_populous_first(self):
+        '''The cities scored by the deadline are the most populous candidates.'''
+        ticks = itertools.count()
+        deadline = Deadline(200, lambda: next(ticks))
+        expected = summary(brute_force_results(Query('sa', None, None), self.cities, 
+                                               PrefixPriority(), 0.6, 0.1, 0.5, 
+                                               0.1))
+        actual = summary(self.results('sa', deadline, -1, self.index))
+        self.assertTrue(deadline.reached)
+        self.assertGreater(len(actual), 0)
+        self.assertLess(len(actual), len(expected))
+        # Best first, ties in data set order, as without a deadline. 
+        self.assertEqual([match for match in expected if match in actual], actual)
+        populations = dict((city.ID, city.population) for city in self.cities)
+        found = set(match[0] for match in actual)
+        missed = [populations[match[0]] for match in expected 
+                  if match[0] not in found]
+        self.assertGreaterEqual(min(populations[ID] for ID in found), max(missed))
+
     
 if __name__ == "__main__":
     #import sys;sys.argv = ['', 'Test.test_empty_pattern']
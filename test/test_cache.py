@@ -0,0 +1,104 @@
+'''
+Tests of the LRU cache and of the keys of the suggestion cache.
+'''
+
+import unittest
+from tools.cache import LRUCache, SuggestionCache
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.put('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(len(cache), 2)
+
+    def test_ttl(self):
+        clock = FakeClock()
+        cache = LRUCache(10, ttl=5, clock=clock)
+        cache.put('a', 1)
+        clock.now = 5
+        self.assertEqual(cache.get('a'), 1)
+        clock.now = 5.5
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(len(cache), 0)
+
+    def test_stats(self):
+        cache = LRUCache(10)
+        cache.get('a')
+        cache.put('a', 1)
+        cache.get('a')
+        cache.get('a')
+        self.assertEqual(cache.stats(), {'hits':2, 'misses':1, 'size':1,
+                                         'maxSize':10})
+        cache.clear()
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats()['size'], 0)
+
+    def test_max_bytes(self):
+        cache = LRUCache(10, maxBytes=10, sizeof=len)
+        cache.put('a', 'xxxx')
+        cache.put('b', 'xxxx')
+        cache.put('a', 'xxxxx')
+        self.assertEqual(cache.nbytes, 9)
+        cache.put('c', 'xxx')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 'xxxxx')
+        self.assertEqual(cache.stats()['bytes'], 8)
+        cache.put('d', 'x'*11)
+        self.assertIsNone(cache.get('d'))
+        self.assertEqual(len(cache), 2)
+        cache.clear()
+        self.assertEqual(cache.nbytes, 0)
+
+    def test_disabled(self):
+        cache = LRUCache(0)
+        cache.put('a', 1)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(len(cache), 0)
+
+
+class TestSuggestionCache(unittest.TestCase):
+
+    def test_normalised_queries_share_key(self):
+        cache = SuggestionCache()
+        self.assertEqual(cache.key('Lond', None, None, 10),
+                         cache.key('LOND', None, None, 10))
+        # Punctuation is stripped from the query string, but changes the
+        # phonetic representation, which is computed on the raw query.
+        self.assertNotEqual(cache.key('lond', None, None, 10),
+                            cache.key('lond!', None, None, 10))
+        self.assertNotEqual(cache.key('lond', None, None, 10),
+                            cache.key('lond', None, None, 5))
+        self.assertNotEqual(cache.key('lond', None, None, 10),
+                            cache.key('londo', None, None, 10))
+
+    def test_snap(self):
+        cache = SuggestionCache(grid=0.1)
+        self.assertAlmostEqual(cache.snap(43.70011), 43.7)
+        self.assertEqual(cache.snap(43.70011), cache.snap(43.68))
+        self.assertNotEqual(cache.snap(43.70011), cache.snap(43.8))
+        self.assertIsNone(cache.snap(None))
+        self.assertEqual(SuggestionCache(grid=0).snap(43.70011), 43.70011)
+        for degrees in [float('nan'), float('inf'), float('-inf')]:
+            self.assertIsNone(cache.snap(degrees))
+            self.assertIsNone(SuggestionCache(grid=0).snap(degrees))
+
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
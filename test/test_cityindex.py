@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+'''
+Tests that searching with a CityIndex returns exactly what scoring every city
+returns.
+'''
+
+import unittest
+from tools.dataloader import DataLoader
+from tools.autocomp import AutoComplete
+from tools.cityindex import CityIndex
+from tools.query import Query
+from tools.scoringmethods.prefixpriority import PrefixPriority
+from tools.scoringmethods.jarowinkler import JaroWinkler
+from configs import ROOT_DIR
+from test.reference import brute_force_results, summary
+
+# Mix of short, prefix, full, misspelled, punctuated and non-latin queries.
+QUERIES = ['a', 'Z', 'ba', 'lon', 'lond', 'Londo', 'london', 'lundun',
+           'sageeney', 'beekonsf', 'st.john', "l'ancien", '뉴마켓', 'Пенти',
+           '1234!!!', '##$@!!', 'vfdeth', 'new york']
+
+
+class TestCityIndex(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        path = ROOT_DIR + '/data/cities_canada-usa.tsv'
+        cls.cities = DataLoader.get_cities_tsv(path)
+        cls.index = CityIndex(cls.cities)
+
+    def assert_same_results(self, q, lat=None, longi=None, scoreMethod=None,
+                            minScore=0.1, altNamePenalty=0.5, phoneticPenalty=0.6):
+        if(scoreMethod == None):
+            scoreMethod = PrefixPriority()
+        query = Query(q, lat, longi)
+        expected = brute_force_results(query, self.cities, scoreMethod, 
+                                       phoneticPenalty, minScore, altNamePenalty,
+                                       0.1)
+        actual = AutoComplete().get_query_results(query, self.cities, scoreMethod,
+                                                  phoneticPenalty, minScore, 
+                                                  altNamePenalty, 0.1, 
+                                                  index=self.index)
+        self.assertEqual(summary(actual), summary(expected), q)
+
+    def test_same_as_full_scan(self):
+        for q in QUERIES:
+            self.assert_same_results(q)
+
+    def test_same_with_location(self):
+        for q in QUERIES:
+            self.assert_same_results(q, 43.70011, -79.4163)
+
+    def test_high_min_score(self):
+        '''High thresholds let the index rule out alternative names lacking a bigram.'''
+        for q in QUERIES:
+            self.assert_same_results(q, minScore=0.3)
+            self.assert_same_results(q, minScore=0.3, altNamePenalty=0.9)
+
+    def test_non_positive_thresholds(self):
+        '''Cities that do not match at all are returned if minScore < 0.'''
+        for q in ['lond', 'a', '##$@!!']:
+            self.assert_same_results(q, minScore=0)
+            self.assert_same_results(q, minScore=-0.1)
+            self.assert_same_results(q, altNamePenalty=0)
+
+    def test_top_n(self):
+        '''Keeping only the best n results gives the first n of the full ranking.'''
+        pp = PrefixPriority()
+        for q, lat, longi in [('a', None, None), ('sa', None, None), 
+                              ('lond', 43.70011, -79.4163)]:
+            query = Query(q, lat, longi)
+            expected = summary(brute_force_results(query, self.cities, pp, 0.6,
+                                                   0.1, 0.5, 0.1))
+            for n in [0, 1, 10, 5000]:
+                for index in [None, self.index]:
+                    actual = AutoComplete().get_query_results(query, self.cities,
+                                        pp, 0.6, 0.1, 0.5, 0.1, index, n)
+                    self.assertEqual(summary(actual), expected[0:n], (q, n))
+
+    def test_top_n_penalties(self):
+        '''Names whose score bound cannot beat the best so far are skipped safely.'''
+        pp = PrefixPriority()
+        for q, lat, longi in [('sa', None, None), ('lond', None, None),
+                              ('lundun', 43.70011, -79.4163)]:
+            query = Query(q, lat, longi)
+            for phoneticPenalty, altNamePenalty, proximityWeight in [
+                    (0.6, 0.9, 0.1), (1.0, 1.0, 0.1), (-0.5, -0.5, 0.1), 
+                    (0.6, 0.5, -0.5)]:
+                expected = summary(brute_force_results(query, self.cities, pp, 
+                                            phoneticPenalty, 0.1, altNamePenalty,
+                                            proximityWeight))
+                for index in [None, self.index]:
+                    actual = AutoComplete().get_query_results(query, self.cities,
+                                        pp, phoneticPenalty, 0.1, altNamePenalty,
+                                        proximityWeight, index, 10)
+                    self.assertEqual(summary(actual), expected[0:10], 
+                                     (q, phoneticPenalty, altNamePenalty))
+    
+    def test_session(self):
+        '''Narrowing down the previous query's candidates gives the same results.'''
+        pp = PrefixPriority()
+        typed = ['l', 'lo', 'lon', 'lond', 'londo', 'lond', 'x', 'sa', 'sag',
+                 'sageeney', 'st.', 'st.john']
+        for minScore in [0.1, 0.3]:
+            session = {}
+            for q in typed:
+                query = Query(q, None, None)
+                expected = brute_force_results(query, self.cities, pp, 0.6, 
+                                               minScore, 0.5, 0.1)
+                actual = AutoComplete().get_query_results(query, self.cities, 
+                                    pp, 0.6, minScore, 0.5, 0.1, self.index, 
+                                    10, session)
+                self.assertEqual(summary(actual), summary(expected)[0:10], q)
+    
+    def test_sessions_share_candidates(self):
+        '''Sessions typing the same prefix share one CandidateSet; each only keeps its key.'''
+        pp = PrefixPriority()
+        index = CityIndex(self.cities)
+        sessions = [{} for _ in range(200)]
+        for session in sessions:
+            expected = index.candidate_set('LOND', ('LNT',), pp, 0.6, 0.1, 0.5)
+            self.assertEqual(index.candidates('LOND', ('LNT',), pp, 0.6, 0.1,
+                                              0.5, session), expected.result())
+        self.assertEqual(len(index.candidateSets), 1)
+        self.assertEqual(len(set(session['candidates'] for session in sessions)), 1)
+        self.assertLess(index.candidateSets.nbytes, 2*1024*1024)
+        for q, pq in [('L', ('L',)), ('X', ('S',)), ('SA', ('S',))]:
+            index.candidates(q, pq, pp, 0.6, 0.1, 0.5, sessions[0])
+        self.assertLessEqual(index.candidateSets.nbytes, 
+                             CityIndex.CANDIDATE_SET_BYTES)
+    
+    def test_candidate_set_reuse(self):
+        pp = PrefixPriority()
+        previous = self.index.candidate_set('LO', ('L',), pp, 0.6, 0.3, 0.5)
+        self.assertIs(self.index.candidate_set('LON', ('L',), pp, 0.6, 0.3, 0.5,
+                                               previous), previous)
+        for q, pq in [('LON', ('LN',)), ('LOND', ('LNT',)), ('PAR', ('PR',))]:
+            reused = self.index.candidate_set(q, pq, pp, 0.6, 0.3, 0.5, previous)
+            fresh = self.index.candidate_set(q, pq, pp, 0.6, 0.3, 0.5)
+            self.assertEqual(reused.entries, fresh.entries, q)
+            self.assertEqual(reused.result(), fresh.result(), q)
+        reused = self.index.candidate_set('LON', ('LN',), pp, 0.6, 0.3, 0.5, 
+                                          previous)
+        self.assertIs(reused.entries['names'], previous.entries['names'])
+    
+    def test_phonetic_penalties(self):
+        for q in ['lundun', 'sageeney', 'beekonsf']:
+            self.assert_same_results(q, phoneticPenalty=1.0)
+            self.assert_same_results(q, phoneticPenalty=0)
+            self.assert_same_results(q, minScore=0.3, phoneticPenalty=0.9)
+
+    def test_phonetic_candidates(self):
+        pp = PrefixPriority()
+        london = [c for c in self.cities if c.name == 'LONDON'][0]
+        pos = self.cities.index(london)
+        
+        # LNTN, the code of London, contains NT but does not begin with it.
+        candidates = self.index.phonetic_candidates(('NT',), pp, 0.1, 0.6)
+        self.assertIn('London', candidates[pos])
+        candidates = self.index.phonetic_candidates(('XN',), pp, 0.1, 0.6)
+        self.assertNotIn(pos, candidates)
+        self.assertEqual(self.index.phonetic_candidates(('LN',), pp, 0.1, 0), {})
+        self.assertEqual(self.index.phonetic_candidates((), pp, 0.1, 0.6), {})
+
+    def test_scoring_method_without_grams(self):
+        '''Scoring methods that cannot rule out names are scored on every city.'''
+        self.assertIsNone(JaroWinkler().required_grams('LOND', 0.1))
+        self.assert_same_results('lond', scoreMethod=JaroWinkler())
+
+    def test_required_grams(self):
+        pp = PrefixPriority()
+        self.assertEqual(pp.required_grams('LOND', 0.1), ['L'])
+        self.assertEqual(pp.required_grams('LOND', 0.2), ['LO'])
+        self.assertEqual(pp.required_grams('L', 0.2), ['L'])
+        self.assertEqual(pp.required_grams('', 0.2), [])
+        self.assertIsNone(pp.required_grams('LOND', -0.1))
+
+    def test_postings(self):
+        first = self.cities[0]
+        self.assertIn(0, self.index.names[first.name[0:2]])
+        for gram, postings in self.index.altNames.items():
+            self.assertEqual(list(postings), sorted(set(postings)), gram)
+
+    def test_popularity(self):
+        populations = [self.cities[pos].population for pos in self.index.popularity]
+        self.assertEqual(populations, sorted(populations, reverse=True))
+        self.assertEqual(sorted(self.index.popularity), list(range(len(self.cities))))
+        positions = [5, 3000, 17, 42, 1000]
+        ranked = self.index.by_popularity(positions)
+        self.assertEqual(ranked, [pos for pos in self.index.popularity 
+                                  if pos in positions])
+
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
@@ -0,0 +1,54 @@
+'''
+Tests that a CityTable behaves as the list of cities it was built from.
+'''
+
+import unittest
+from tools.autocomp import AutoComplete
+from tools.city import City
+from tools.cityindex import CityIndex
+from tools.citytable import CityTable
+from tools.dataloader import DataLoader
+from tools.query import Query
+from tools.scoringmethods.prefixpriority import PrefixPriority
+from configs import ROOT_DIR
+from test.reference import summary
+
+
+class TestCityTable(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.cities = DataLoader.get_cities_tsv(ROOT_DIR + '/data/cities_canada-usa.tsv')
+        cls.table = CityTable.from_cities(cls.cities)
+
+    def test_same_cities(self):
+        self.assertEqual(len(self.table), len(self.cities))
+        for city, tableCity in zip(self.cities, self.table):
+            for attribute in City.__slots__:
+                self.assertEqual(getattr(tableCity, attribute),
+                                 getattr(city, attribute), attribute)
+            self.assertEqual(list(tableCity.phonetics), list(city.phonetics))
+
+    def test_indexing(self):
+        self.assertEqual(self.table[-1].ID, self.cities[-1].ID)
+        self.assertEqual(self.table[0].ID, self.cities[0].ID)
+        self.assertRaises(IndexError, lambda: self.table[len(self.cities)])
+        self.assertRaises(IndexError, lambda: self.table[-len(self.cities) - 1])
+
+    def test_same_results(self):
+        pp = PrefixPriority()
+        index = CityIndex(self.cities)
+        tableIndex = CityIndex(self.table)
+        for q, lat, longi in [('lond', None, None), ('Пенти', None, None),
+                              ('st.john', 43.70011, -79.4163)]:
+            query = Query(q, lat, longi)
+            expected = AutoComplete().get_query_results(query, self.cities, pp,
+                                        0.6, 0.1, 0.5, 0.1, index, 10)
+            actual = AutoComplete().get_query_results(query, self.table, pp,
+                                        0.6, 0.1, 0.5, 0.1, tableIndex, 10)
+            self.assertEqual(summary(actual), summary(expected), q)
+
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
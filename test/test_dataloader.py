@@ -15,6 +15,7 @@ class TestImport(unittest.TestCase):
         self.assertEqual(first.latitude, 49.05798 )
         self.assertEqual(first.longitude, -122.25257)
         self.assertEqual(first.country, 'CA')
+        self.assertEqual(first.population, 151683)
     
     
     def test_nonunique_id(self):
@@ -0,0 +1,225 @@
+'''
+Tests of incremental updates: the daily modification and deletion files of
+geonames applied to a loaded data set give what loading the changed data set
+gives.
+'''
+
+import os
+import random
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from test.reference import brute_force_results, summary
+from tools.autocomp import AutoComplete
+from tools.cache import SuggestionCache
+from tools.cityindex import CityIndex
+from tools.citytable import CityTable
+from tools.dataloader import DataLoader
+from tools.geonamesdiff import GeonamesDiff, main
+from tools.query import Query
+from tools.searchservice import SearchService
+from tools.scoringmethods.prefixpriority import PrefixPriority
+from configs import ROOT_DIR
+
+DATA_PATH = ROOT_DIR + '/data/cities_canada-usa.tsv'
+QUERIES = [('lond', None, None), ('abbots', 43.7, -79.4), ('mont', None, None),
+           ('sageeney', None, None), ('st.john', 45.5, -73.6), ('w', None, None),
+           ('zz', None, None), ('vancouvr', 49.2, -123.1)]
+
+
+class TestGeonamesDiff(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        with open(DATA_PATH, encoding='utf-8') as f:
+            cls.header = f.readline()
+            cls.lines = f.readlines()
+        cls.cities = DataLoader.get_cities_tsv(DATA_PATH)
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write(self, name, lines):
+        path = os.path.join(self.tmp, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.writelines(lines)
+        return path
+
+    def changed(self, line, **fields):
+        '''Returns a line of the data set with some fields changed.'''
+        names = self.header.rstrip('\n').split('\t')
+        values = line.rstrip('\n').split('\t')
+        for name, value in fields.items():
+            values[names.index(name)] = str(value)
+        return '\t'.join(values) + '\n'
+
+    def random_diff(self, seed, size):
+        '''Returns the paths of random modification and deletion files of size records each.'''
+        rng = random.Random(seed)
+        lines = rng.sample(self.lines, 3*size)
+        modifications = []
+        for line in lines[0:size]:
+            other = rng.choice(self.lines).split('\t')
+            modifications.append(self.changed(line, name=other[1],
+                                              alt_name=other[3],
+                                              population=rng.randint(5000, 10**6)))
+        for i, line in enumerate(lines[size:2*size]):
+            modifications.append(self.changed(line, id=10**8 + seed*1000 + i,
+                                              name=line.split('\t')[1] + 'ville'))
+        deletions = [line.split('\t')[0] + '\tdeleted\t\n'
+                     for line in lines[2*size:3*size]]
+        return (self.write('modifications-%d.txt' % seed, modifications),
+                self.write('deletes-%d.txt' % seed, deletions))
+
+    def test_read(self):
+        added, modified, small, foreign, deleted = self.lines[0:5]
+        diff = GeonamesDiff.read(
+            self.write('modifications.txt', [
+                self.changed(added, id=99999999),
+                self.changed(modified, name='Modified'),
+                self.changed(small, population=4999),
+                self.changed(foreign, country='FR'),
+                self.changed(added, id=99999998, feat_class='A')]),
+            self.write('deletes.txt', [deleted.split('\t')[0] + '\tX\tgone\n']),
+            ('CA', 'US'), 5000)
+        self.assertEqual([(city.ID, city.origName) for city in diff.modified],
+                         [(99999999, added.split('\t')[1]),
+                          (int(modified.split('\t')[0]), 'Modified')])
+        self.assertEqual(diff.deleted, set([int(line.split('\t')[0]) for line in
+                                            [small, foreign, deleted]] + [99999998]))
+
+    def test_short_row(self):
+        line = self.lines[0].rstrip('\n').split('\t')
+        for fields in [line[0:3], line + ['extra']]:
+            path = self.write('modifications.txt', ['\t'.join(fields) + '\n'])
+            with self.assertRaises(ValueError):
+                GeonamesDiff.read(path)
+
+    def test_apply(self):
+        diff = GeonamesDiff.read(*self.random_diff(1, 30))
+        cities, positions, changes = diff.apply(self.cities)
+        modified = dict((city.ID, city) for city in diff.modified)
+        expected = [modified.pop(city.ID, city) for city in self.cities
+                    if city.ID not in diff.deleted] + list(modified.values())
+        self.assertEqual(sorted(id(city) for city in cities),
+                         sorted(id(city) for city in expected))
+        self.assertEqual(positions, GeonamesDiff.positions(cities))
+        # Every position at which the lists differ, and only those.
+        differing = [pos for pos in range(max(len(cities), len(self.cities)))
+                     if (cities[pos] if pos < len(cities) else None) is not
+                        (self.cities[pos] if pos < len(self.cities) else None)]
+        self.assertEqual([pos for pos, _, _ in changes], differing)
+        for pos, old, new in changes:
+            self.assertIs(old, self.cities[pos] if pos < len(self.cities) else None)
+            self.assertIs(new, cities[pos] if pos < len(cities) else None)
+
+    def test_index(self):
+        index = CityIndex(self.cities)
+        cities = self.cities
+        for seed in range(2, 5):
+            cities, _, changes = GeonamesDiff.read(
+                *self.random_diff(seed, 20)).apply(cities)
+            index = index.updated(cities, changes)
+        built = CityIndex(cities)
+        for kind in ('names', 'altNames'):
+            self.assertEqual(getattr(index, kind), getattr(built, kind))
+
+        def phonetics(index):
+            return dict((gram, sorted(index.phoneticEntries[entry]
+                                      for entry in entries))
+                        for gram, entries in index.phonetics.items())
+        self.assertEqual(phonetics(index), phonetics(built))
+        for pos in range(len(cities)):
+            start = index.entryStarts[pos]
+            self.assertEqual([entry[1] for entry in index.phoneticEntries[
+                                  start:start + len(cities[pos].phonetics)]],
+                             list(cities[pos].phonetics))
+        self.assertEqual(index.popularity, built.popularity)
+        self.assertEqual(index.ranks.tolist(), built.ranks.tolist())
+        for name in ('latitudes', 'longitudes', 'cosLatitudes'):
+            self.assertTrue(np.array_equal(getattr(index.coordinates, name),
+                                           getattr(built.coordinates, name)))
+
+    def test_service(self):
+        service = SearchService(self.cities, cache=SuggestionCache(100, grid=0.1))
+        for q, lat, longi in QUERIES:
+            service.suggestions(q, lat, longi)
+        updated = service.updated(GeonamesDiff.read(
+                      self.write('modifications.txt', [
+                          self.changed(self.lines[0], population=1234567)])))
+        self.assertEqual(len(service.cities), len(self.cities))
+        # Cached suggestions which could include the city are dropped.
+        kept = [key[0] for key in updated.cache.entries]
+        self.assertNotIn('ABBOTS', kept)
+        self.assertIn('LOND', kept)
+        self.assertEqual(updated.suggestions('lond'), service.suggestions('lond'))
+        for seed in (5, 6):
+            updated = updated.updated(GeonamesDiff.read(
+                          *self.random_diff(seed, 20)))
+        fresh = SearchService(updated.cities)
+        for q, lat, longi in QUERIES:
+            for numRes in (3, 10):
+                self.assertEqual(updated.suggestions(q, lat, longi, numRes),
+                                 fresh.suggestions(q, lat, longi, numRes))
+            self.assertEqual(updated.suggestions(q, lat, longi),
+                             updated.suggestions(q, lat, longi))
+        params = dict(updated.params)
+        for q, lat, longi in QUERIES:
+            query = Query(q, lat, longi)
+            self.assertEqual(summary(AutoComplete().get_query_results(
+                                 query, updated.cities, params['scoreMethod'],
+                                 params['phoneticPenalty'], params['minScore'],
+                                 params['altNamePenalty'],
+                                 params['proximityWeight'],
+                                 index=updated.index)),
+                             summary(brute_force_results(
+                                 query, updated.cities, PrefixPriority(),
+                                 params['phoneticPenalty'], params['minScore'],
+                                 params['altNamePenalty'],
+                                 params['proximityWeight'])))
+
+    def test_unaffected(self):
+        city = self.cities[0]
+        diff = GeonamesDiff.read(self.write('modifications.txt', [
+                   self.changed(self.lines[0], population=1234567)]))
+        unaffected = SearchService(self.cities).unaffected(
+                         diff.apply(self.cities)[2])
+        key = SuggestionCache().key
+        self.assertFalse(unaffected(key(city.origName, None, None, 10)))
+        self.assertTrue(unaffected(key('zzqx', None, None, 10)))
+
+    def test_engines(self):
+        diff = GeonamesDiff.read(*self.random_diff(7, 10))
+        cities = diff.apply(self.cities)[0]
+        for service in [SearchService(self.cities, engine='trie'),
+                        SearchService(CityTable.from_cities(self.cities))]:
+            updated = service.updated(diff)
+            self.assertEqual(type(updated.cities), type(service.cities))
+            for q, lat, longi in QUERIES:
+                self.assertEqual(updated.suggestions(q, lat, longi),
+                                 SearchService(cities).suggestions(q, lat, longi))
+
+    def test_main(self):
+        path = self.write('cities.tsv', [self.header] + self.lines)
+        modifications, deletions = self.random_diff(8, 20)
+        self.assertEqual(main([path, modifications, deletions]), 0)
+        diff = GeonamesDiff.read(modifications, deletions, ('CA', 'US'), 5000)
+        expected = diff.apply(self.cities)[0]
+        cities = DataLoader.get_cities_tsv(path)
+        # In the same order, so that ties rank the same after a reload. 
+        self.assertEqual([(city.ID, city.origName, city.population)
+                          for city in cities],
+                         [(city.ID, city.origName, city.population)
+                          for city in expected])
+        updated = SearchService(self.cities).updated(diff)
+        self.assertEqual(updated.suggestions('a', numRes=1000),
+                         SearchService(cities).suggestions('a', numRes=1000))
+        self.assertEqual(main([path]), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
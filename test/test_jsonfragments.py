@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+'''
+Tests that suggestions written from JSON fragments are exactly those written
+by json.dumps.
+'''
+
+import json
+import random
+import unittest
+from tools.city import City
+from tools.citytable import CityTable
+from tools.dataloader import DataLoader
+from tools.jsonfragments import JSONFragments
+from tools.matchresult import MatchResult
+from configs import ROOT_DIR
+
+
+def expected_json(matchResults):
+    return json.dumps(matchResults, default=MatchResult.dict_repr)
+
+
+class TestJSONFragments(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.cities = DataLoader.get_cities_tsv(ROOT_DIR + '/data/cities_canada-usa.tsv')
+        cls.fragments = JSONFragments(cls.cities)
+
+    def random_results(self, cities, count, seed):
+        rand = random.Random(seed)
+        results = []
+        for _ in range(count):
+            city = rand.choice(cities)
+            hsn = rand.choice([city.origName] + list(city.altNames) + 
+                              list(city.phonetics))
+            score = rand.choice([rand.random(), 0.0, 1.0, 1e-17, 0.1 + 0.2])
+            results.append(MatchResult(city, score, hsn))
+        return results
+
+    def test_same_as_json_dumps(self):
+        results = self.random_results(self.cities, 3000, 1)
+        self.assertEqual(self.fragments.dumps(results), expected_json(results))
+        self.assertEqual(self.fragments.dumps([]), '[]')
+        for result in results[0:100]:
+            self.assertEqual(self.fragments.suggestion(result), 
+                             json.dumps(result.dict_repr()))
+
+    def test_without_fragments(self):
+        '''Cities built on demand, unknown to the fragments, are written the same.'''
+        table = CityTable.from_cities(self.cities[0:500])
+        results = self.random_results(table, 300, 2)
+        self.assertEqual(self.fragments.dumps(results), expected_json(results))
+        self.assertEqual(JSONFragments().dumps(results), expected_json(results))
+
+    def test_awkward_values(self):
+        cities = [City(1, 'Québec "Vieux"', ['Kébèk\\\\', '東京'], 46.8, -71, 'CA'),
+                  City(2, 'Tab\tand\nnewline', [], 0, 0.0, 'U"S')]
+        fragments = JSONFragments(cities)
+        results = [MatchResult(cities[0], 0.5, '東京'),
+                   MatchResult(cities[0], 1, 'Kébèk\\\\'),
+                   MatchResult(cities[1], float('nan'), cities[1].origName),
+                   MatchResult(cities[1], float('inf'), 'x y')]
+        self.assertEqual(fragments.dumps(results), expected_json(results))
+
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
@@ -0,0 +1,72 @@
+'''
+Tests of the Flask routes of main.py, with Flask's test client.
+'''
+
+import json
+import os
+import unittest
+from configs import ROOT_DIR
+
+
+def import_main():
+    '''Returns the main module, which loads the data set when first imported.'''
+    # main.py loads the data set from a path relative to the project root.
+    cwd = os.getcwd()
+    os.chdir(ROOT_DIR)
+    try:
+        import main
+    finally:
+        os.chdir(cwd)
+    return main
+
+
+class TestBatchRoute(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.main = import_main()
+        cls.client = cls.main.app.test_client()
+
+    def post(self, body):
+        return self.client.post('/suggestions/batch', data=json.dumps(body))
+
+    def test_one_line_per_query(self):
+        response = self.post([{'q':'lond', 'n':2}, {'q':''},
+                              {'q':'mont', 'latitude':43.7, 'longitude':-79.4},
+                              'not a query', {'q':'lond', 'n':2}])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        service = self.main.service
+        self.assertEqual(response.get_data(as_text=True).split('\n'),
+                         [service.suggestions('lond', numRes=2), '{}',
+                          service.suggestions('mont', 43.7, -79.4), '{}',
+                          service.suggestions('lond', numRes=2), ''])
+
+    def test_not_a_list(self):
+        for body in [{'q':'lond'}, 'lond']:
+            self.assertEqual(self.post(body).status_code, 400)
+        response = self.client.post('/suggestions/batch', data='not json')
+        self.assertEqual(response.status_code, 400)
+
+
+class TestBuildService(unittest.TestCase):
+
+    def test_no_grid_without_cache(self):
+        '''Locations are only snapped for the cache's sake.'''
+        main = import_main()
+        cities = main.service.cities[0:10]
+        size = main.CACHE_SIZE
+        try:
+            main.CACHE_SIZE = 0
+            service = main.build_service(cities, None)
+            self.assertEqual(service.cache.grid, 0)
+            self.assertEqual(service.snap(43.70011), 43.70011)
+            main.CACHE_SIZE = 10
+            service = main.build_service(cities, None)
+            self.assertEqual(service.cache.grid, main.CACHE_GRID_DEGREES)
+        finally:
+            main.CACHE_SIZE = size
+
+
+if __name__ == '__main__':
+    unittest.main()
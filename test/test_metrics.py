@@ -0,0 +1,101 @@
+'''
+Tests of the metrics of queries and of their Prometheus text format.
+'''
+
+import unittest
+from tools.autocomp import AutoComplete
+from tools.cache import SuggestionCache
+from tools.dataloader import DataLoader
+from tools.metrics import Counter, Histogram, Metrics
+from tools.searchservice import SearchService
+from configs import ROOT_DIR
+
+
+def samples(text):
+    '''Returns a dictionary from the sample names (with labels) of text to their values.'''
+    values = {}
+    for line in text.splitlines():
+        if(not line.startswith('#')):
+            name, value = line.rsplit(' ', 1)
+            values[name] = float(value)
+    return values
+
+
+class TestHistogram(unittest.TestCase):
+
+    def test_render(self):
+        histogram = Histogram((0.1, 1.0))
+        for value in [0.05, 0.1, 0.5, 3.0]:
+            histogram.observe(value)
+        self.assertEqual(histogram.render('x', 'stage="a",'),
+                         ['x_bucket{stage="a",le="0.1"} 2',
+                          'x_bucket{stage="a",le="1.0"} 3',
+                          'x_bucket{stage="a",le="+Inf"} 4',
+                          'x_sum{stage="a"} 3.65',
+                          'x_count{stage="a"} 4'])
+        self.assertEqual(histogram.render('x')[-1], 'x_count 4')
+
+    def test_counter(self):
+        counter = Counter('y_total', 'Things.')
+        counter.inc()
+        counter.inc(41)
+        self.assertEqual(counter.render(), ['# HELP y_total Things.',
+                                            '# TYPE y_total counter',
+                                            'y_total 42'])
+
+
+class TestMetrics(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.cities = DataLoader.get_cities_tsv(ROOT_DIR + '/data/cities_canada-usa.tsv')
+        cls.plain = SearchService(cls.cities)
+
+    def test_same_suggestions(self):
+        service = SearchService(self.cities, self.plain.index, metrics=Metrics(1))
+        for q, lat, longi in [('a', None, None), ('lond', 43.7, -79.4),
+                              ('sageeney', None, None)]:
+            for numRes in [-1, 10]:
+                self.assertEqual(service.suggestions(q, lat, longi, numRes),
+                                 self.plain.suggestions(q, lat, longi, numRes))
+
+    def test_stages_and_counters(self):
+        metrics = Metrics(2)
+        service = SearchService(self.cities, self.plain.index, metrics=metrics,
+                                cache=SuggestionCache(10, grid=0))
+        for q in ['lond', 'lond', 'sageeney', 'mont']:
+            service.suggestions(q, 43.7, -79.4, 3)
+        service.suggestions('a', numRes=10, timeoutMs=0)
+        values = samples(metrics.render())
+
+        self.assertEqual(values['autocomplete_requests_total'], 5)
+        self.assertEqual(values['autocomplete_cache_hits_total'], 1)
+        self.assertEqual(values['autocomplete_cache_misses_total'], 4)
+        self.assertEqual(values['autocomplete_partial_total'], 1)
+        self.assertEqual(values['autocomplete_results_returned_total'], 9)
+        self.assertGreater(values['autocomplete_candidates_considered_total'], 0)
+        count = 'autocomplete_stage_seconds_count{stage="%s"}'
+        self.assertEqual(values[count % 'request'], 5)
+        for stage in ['normalize', 'candidates', 'score', 'rank', 'serialize']:
+            self.assertEqual(values[count % stage], 4, stage)
+        # The last query has no location.
+        self.assertEqual(values[count % 'proximity'], 3)
+        # One query in two.
+        for stage in ['literal', 'alt', 'phonetic']:
+            self.assertEqual(values[count % stage], 2, stage)
+        self.assertEqual(values['autocomplete_stage_seconds_bucket'
+                                '{stage="request",le="+Inf"}'], 5)
+
+    def test_passes(self):
+        '''The passes of a sampled query are each timed.'''
+        metrics = Metrics(1)
+        AutoComplete().get_suggestions_json('sageeney', None, None, self.cities,
+                        dict(self.plain.params, index=None, metrics=metrics), 10)
+        for stage in ['literal', 'alt', 'phonetic']:
+            self.assertEqual(metrics.stages[stage].count, 1)
+            self.assertGreater(metrics.stages[stage].sum, 0.0, stage)
+        self.assertEqual(metrics.candidates.value, len(self.cities))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,7 @@
+import random
 import unittest
 from tools.patternmatching import simpleprefixmatch as spm
+from test.reference import reference_get_matches
 
 class SimplePrefixMatchTest(unittest.TestCase):
 
@@ -76,6 +78,17 @@ class SimplePrefixMatchTest(unittest.TestCase):
         matches = spm.get_matches('ABC', 'ATTABTTAJABC', 2)
         self.assertEqual(matches, [(3, 2), (9, 3)])
 
+    def test_same_as_reference(self):
+        '''Random strings over a small alphabet hit every corner case.'''
+        rand = random.Random(1)
+        for _ in range(20000):
+            pattern = ''.join(rand.choice('AB') for _ in range(rand.randint(0, 4)))
+            text = ''.join(rand.choice('ABC') for _ in range(rand.randint(0, 9)))
+            for minLength in [-1, 0, 1, 2, 3, 5]:
+                self.assertEqual(spm.get_matches(pattern, text, minLength),
+                                 reference_get_matches(pattern, text, minLength),
+                                 (pattern, text, minLength))
+
 
 if __name__ == "__main__":
     #import sys;sys.argv = ['', 'Test.testName']
@@ -1,5 +1,8 @@
+import random
 import unittest
 from tools.scoringmethods.prefixpriority import PrefixPriority
+from tools.scoringmethods.jarowinkler import JaroWinkler
+from tools.scoringmethods.scoringmethod import QueryScorer
 
 class TestPrefixPriorityScore(unittest.TestCase):
     
@@ -77,6 +80,59 @@ class TestPrefixPriorityScore(unittest.TestCase):
         self.assertTrue(s < 0.15)
 
 
+class TestCompiledScorer(unittest.TestCase):
+    
+    def test_same_as_score(self):
+        '''Compiled scorers give exactly the scores of score().'''
+        rand = random.Random(2)
+        methods = [PrefixPriority(), PrefixPriority(1, 0.5, 3, -0.4), 
+                   PrefixPriority(3, 2, 0, 1.1)]
+        for _ in range(3000):
+            query = ''.join(rand.choice('ABC') for _ in range(rand.randint(0, 5)))
+            texts = [''.join(rand.choice('ABCD') for _ in range(rand.randint(0, 9)))
+                     for _ in range(10)] + [query, query + 'A', 'A' + query]
+            for method in methods:
+                scorer = method.compile(query)
+                for text in texts:
+                    self.assertEqual(scorer.score(text), method.score(query, text),
+                                     (query, text))
+    
+    def test_default_scorer(self):
+        jw = JaroWinkler()
+        scorer = jw.compile('LOND')
+        self.assertIsInstance(scorer, QueryScorer)
+        self.assertEqual(scorer.score('LONDON'), jw.score('LOND', 'LONDON'))
+        self.assertEqual(scorer.upper_bound('LONDON'), 1.0)
+        self.assertEqual(scorer.ceiling, 1.0)
+    
+    def test_upper_bound(self):
+        '''Upper bounds are never below the score, even by rounding.'''
+        rand = random.Random(3)
+        methods = [PrefixPriority(), PrefixPriority(1, 0.5, 3, -0.4), 
+                   PrefixPriority(3, 2, 0, 1.1), PrefixPriority(0.5, -1, 1, 0.3)]
+        for _ in range(3000):
+            query = ''.join(rand.choice('ABC') for _ in range(rand.randint(0, 5)))
+            texts = [''.join(rand.choice('ABCD') for _ in range(rand.randint(0, 9)))
+                     for _ in range(10)] + [query, query + 'A', 'A' + query]
+            for method in methods:
+                scorer = method.compile(query)
+                for text in texts:
+                    score = scorer.score(text)
+                    self.assertGreaterEqual(scorer.upper_bound(text), score, 
+                                            (query, text))
+                    self.assertGreaterEqual(scorer.ceiling, score, (query, text))
+    
+    def test_tight_upper_bound(self):
+        pp = PrefixPriority()
+        scorer = pp.compile('LOND')
+        for text in ['', 'PARIS', 'LAVAL', 'ALBANY', 'LOND']:
+            self.assertEqual(scorer.upper_bound(text), scorer.score(text), text)
+        self.assertLess(scorer.upper_bound('NEW LONDON'), 
+                        scorer.upper_bound('LONDON'))
+        self.assertEqual(pp.upper_bound('LOND', 'LONDON'), 
+                         scorer.upper_bound('LONDON'))
+        
+
 if __name__ == "__main__":
     #import sys;sys.argv = ['', 'Test.testName']
-    unittest.main()
\ No newline at end of file
+    unittest.main()
@@ -0,0 +1,52 @@
+'''
+Tests of the query log: a bounded ring buffer of the queries answered by the
+search service, read back for replaying.
+'''
+
+import unittest
+from tools.dataloader import DataLoader
+from tools.querylog import QueryLog
+from tools.searchservice import SearchService
+from configs import ROOT_DIR
+
+
+class TestQueryLog(unittest.TestCase):
+
+    def test_ring_buffer(self):
+        log = QueryLog(3)
+        for i in range(5):
+            log.record('q%d' % i, None, None, 10, None, 0.001)
+        self.assertEqual([r['q'] for r in log.records()], ['q2', 'q3', 'q4'])
+        self.assertAlmostEqual(log.records()[0]['ms'], 1.0)
+        disabled = QueryLog(0)
+        disabled.record('q', None, None, 10, None, 0.001)
+        self.assertEqual(disabled.records(), [])
+
+    def test_read(self):
+        log = QueryLog()
+        log.record(u'Québec', 45.5, -73.6, -1, 'abc', 0.002)
+        records = list(QueryLog.read(log.ndjson().splitlines() + ['', 'lond']))
+        self.assertEqual(records, log.records() +
+                         [dict(dict.fromkeys(QueryLog.FIELDS), q='lond')])
+        self.assertEqual(records[0]['latitude'], 45.5)
+
+    def test_service(self):
+        cities = DataLoader.get_cities_tsv(ROOT_DIR + '/data/cities_canada-usa.tsv')
+        log = QueryLog()
+        service = SearchService(cities, queryLog=log)
+        service.suggestions('lond', 43.71, -79.42, 3, 'abc')
+        service.suggestions('', 43.71, -79.42)
+        chunks = service.suggestions_stream('lond')
+        # Recorded once streamed.
+        self.assertEqual(len(log.records()), 1)
+        ''.join(chunks)
+        records = log.records()
+        self.assertEqual([(r['q'], r['latitude'], r['longitude'], r['n'],
+                           r['session']) for r in records],
+                         [('lond', 43.71, -79.42, 3, 'abc'),
+                          ('lond', None, None, -1, None)])
+        self.assertGreater(records[0]['ms'], 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+'''
+Tests of hot reloading: new search services are built from the changed data
+files, in the background, and swapped in while the old one keeps serving.
+'''
+
+import os
+import shutil
+import signal
+import tempfile
+import time
+import unittest
+from tools.geonamesdiff import GeonamesDiff
+from tools.reloader import Reloader
+from tools.searchservice import SearchService
+from tools.snapshot import Snapshot
+from configs import ROOT_DIR
+
+DATA_PATH = ROOT_DIR + '/data/cities_canada-usa.tsv'
+
+
+class TestReloader(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'cities.tsv')
+        self.snapshotPath = os.path.join(self.tmp, 'cities.snapshot')
+        with open(DATA_PATH) as f:
+            self.lines = f.readlines()[0:301]
+        self.write(self.lines[0:201])
+        self.service = None
+        self.closed = []
+        self.reloader = Reloader(self.path, self.snapshotPath, self.build,
+                                 self.install, graceSeconds=0)
+
+    def tearDown(self):
+        self.reloader.stop()
+        shutil.rmtree(self.tmp)
+
+    def write(self, lines, path=None, age=0):
+        '''Write lines to the TSV file (or path), modified age seconds ago.'''
+        path = path if path != None else self.path
+        with open(path, 'w') as f:
+            f.writelines(lines)
+        mtime = time.time() - age
+        os.utime(path, (mtime, mtime))
+
+    def build(self, cities, index):
+        service = SearchService(cities, index)
+        service.close = lambda: self.closed.append(service)
+        return service
+
+    def install(self, service):
+        old = self.service
+        self.service = service
+        return old
+
+    def wait_for(self, generation):
+        for _ in range(200):
+            if(self.reloader.generation >= generation):
+                return
+            time.sleep(0.05)
+        self.fail('No reload')
+
+    def test_reload_now(self):
+        first = self.reloader.reload_now()
+        self.assertIs(self.service, first)
+        self.assertEqual(len(first.cities), 200)
+        # A newer TSV file is compiled in a child process.
+        self.write(self.lines, age=-10)
+        second = self.reloader.reload_now()
+        self.assertIs(self.service, second)
+        self.assertEqual(len(second.cities), 300)
+        self.assertEqual(second.suggestions('abbots'),
+                         SearchService(second.cities).suggestions('abbots'))
+        self.assertEqual(self.closed, [first])
+        self.assertEqual(self.reloader.status()['generation'], 2)
+
+    def test_snapshot(self):
+        self.reloader.reload_now()
+        cities = SearchService.read(self.path)[0]
+        Snapshot.write(self.snapshotPath, cities[0:50],
+                       SearchService(cities[0:50]).index, self.path)
+        os.utime(self.snapshotPath, (time.time() + 10, time.time() + 10))
+        self.assertEqual(len(self.reloader.reload_now().cities), 50)
+        # A TSV file replaced by an older one, e.g. restored, is compiled. 
+        self.write(self.lines, age=3600)
+        self.assertFalse(self.reloader.snapshot_fresh())
+        self.assertEqual(len(self.reloader.reload_now().cities), 300)
+
+    def test_failure(self):
+        first = self.reloader.reload_now()
+        self.write(['not\ta\tgeonames\tfile\n', '1\t2\n'], age=-10)
+        with self.assertRaises(RuntimeError):
+            self.reloader.reload_now()
+        self.assertIs(self.service, first)
+        self.assertIn('Compiling', self.reloader.status()['error'])
+        self.assertEqual(self.closed, [])
+
+    def test_update(self):
+        with self.assertRaises(RuntimeError):
+            self.reloader.update(GeonamesDiff())
+        first = self.reloader.reload_now()
+        deleted = first.cities[0]
+        second = self.reloader.update(GeonamesDiff(deleted=[deleted.ID]))
+        self.assertIs(self.service, second)
+        self.assertEqual(len(second.cities), 199)
+        self.assertNotIn(deleted, second.cities)
+        self.assertEqual(self.closed, [first])
+        self.assertEqual(self.reloader.status()['updates'], 1)
+        self.reloader.reload_now()
+        self.assertEqual(self.reloader.status()['updates'], 0)
+
+    def test_background(self):
+        self.reloader.reload_now()
+        self.reloader.start(0.05)
+        self.reloader.reload()
+        self.wait_for(2)
+        # Reloaded once the new modification time has lasted one poll.
+        self.write(self.lines, age=-10)
+        self.wait_for(3)
+        self.assertEqual(len(self.service.cities), 300)
+        self.reloader.stop()
+        self.assertIsNone(self.reloader.thread)
+
+    def test_signal(self):
+        self.reloader.reload_now()
+        self.reloader.start()
+        previous = signal.getsignal(signal.SIGHUP)
+        try:
+            self.assertTrue(self.reloader.listen(signal.SIGHUP))
+            os.kill(os.getpid(), signal.SIGHUP)
+            self.wait_for(2)
+        finally:
+            signal.signal(signal.SIGHUP, previous)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,161 @@
+'''
+Tests that the search service returns what AutoComplete returns, and shares
+its state safely between threads.
+'''
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from tools.autocomp import AutoComplete
+from tools.cache import LRUCache, SuggestionCache
+from tools.cityindex import CityIndex
+from tools.citytable import CityTable
+from tools.dataloader import DataLoader
+from tools.searchservice import SearchService
+from tools.snapshot import Snapshot
+from tools.scoringmethods.prefixpriority import PrefixPriority
+from configs import ROOT_DIR
+
+DATA_PATH = ROOT_DIR + '/data/cities_canada-usa.tsv'
+
+
+class TestSearchService(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.cities = DataLoader.get_cities_tsv(DATA_PATH)
+        cls.service = SearchService(cls.cities, cache=SuggestionCache(100, grid=0.1),
+                                    sessions=LRUCache(100))
+        cls.params = {'scoreMethod':PrefixPriority(), 'phoneticPenalty':0.6,
+                      'minScore':0.1, 'altNamePenalty':0.5, 'proximityWeight':0.1}
+
+    def expected(self, q, lat, longi, numRes):
+        return AutoComplete().get_suggestions_json(q, lat, longi, self.cities,
+                                                   self.params, numRes)
+
+    def test_same_as_autocomplete(self):
+        for q, lat, longi in [('lond', None, None), ('sageeney', None, None),
+                              ('st.john', 43.7, -79.4)]:
+            for numRes in [0, 1, 10]:
+                self.assertEqual(self.service.suggestions(q, lat, longi, numRes),
+                                 self.expected(q, lat, longi, numRes))
+        self.assertEqual(self.service.suggestions('', None, None), '{}')
+        self.assertEqual(self.service.suggestions(None, None, None), '{}')
+
+    def test_cached_and_snapped(self):
+        first = self.service.suggestions('mont', 43.71, -79.42, 5)
+        hits = self.service.cache.hits
+        self.assertEqual(self.service.suggestions('MONT', 43.69, -79.38, 5), first)
+        self.assertEqual(self.service.cache.hits, hits + 1)
+        self.assertEqual(first, self.expected('mont', 43.7, -79.4, 5))
+
+    def test_not_finite_location(self):
+        for lat in [float('nan'), float('inf')]:
+            self.assertEqual(self.service.suggestions('lon', lat, 1.0),
+                             self.service.suggestions('lon', None, 1.0))
+
+    def test_sessions(self):
+        for q in ['l', 'lo', 'lon', 'lond']:
+            self.assertEqual(self.service.suggestions(q, None, None, 7, 'abc'),
+                             self.expected(q, None, None, 7))
+        self.assertIn('candidates', self.service.sessions.get('abc'))
+        self.assertEqual(self.service.session_params(None), self.service.params)
+        self.assertNotIn('session', self.service.params)
+
+    def test_stream_and_batch(self):
+        self.assertEqual(''.join(self.service.suggestions_stream('ab')),
+                         self.expected('ab', None, None, -1))
+        self.assertEqual(list(self.service.suggestions_stream('')), ['{}'])
+        queries = [('lond', None, None, 3), ('', None, None, 10),
+                   ('mont', 43.71, -79.42, 2)]
+        self.assertEqual(list(self.service.suggestions_batch(queries)),
+                         [self.expected('lond', None, None, 3), '{}',
+                          self.expected('mont', 43.7, -79.4, 2)])
+
+    def test_threads(self):
+        queries = ['l', 'lo', 'lon', 'lond', 'londo', 'mont', 'tor', 'van']
+        expected = dict((q, self.expected(q, None, None, 10)) for q in queries)
+        service = SearchService(self.cities, sessions=LRUCache(100))
+        errors = []
+
+        def work(token):
+            for q in queries:
+                if(service.suggestions(q, None, None, 10, token) != expected[q]):
+                    errors.append((token, q))
+
+        threads = [threading.Thread(target=work, args=(str(i % 2),))
+                   for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_timeout(self):
+        service = SearchService(self.cities, self.service.index,
+                                cache=SuggestionCache(100, grid=0))
+        expected = self.expected('sa', None, None, 10)
+        self.assertEqual(service.suggestions('sa', timeoutMs=60000),
+                         '{"suggestions": ' + expected + ', "partial": false}')
+        # From the cache; complete.
+        self.assertEqual(service.suggestions('sa', timeoutMs=0),
+                         '{"suggestions": ' + expected + ', "partial": false}')
+        self.assertEqual(service.suggestions('mont', timeoutMs=0),
+                         '{"suggestions": [], "partial": true}')
+        # Partial results are not cached.
+        self.assertEqual(service.suggestions('mont'),
+                         self.expected('mont', None, None, 10))
+        # Cut short by the service's default deadline: still said so, and
+        # not cached.
+        service.timeoutMs = 0
+        self.assertEqual(service.suggestions('lond'),
+                         '{"suggestions": [], "partial": true}')
+        service.timeoutMs = None
+        self.assertEqual(service.suggestions('lond'),
+                         self.expected('lond', None, None, 10))
+
+    def test_engines(self):
+        with self.assertRaises(ValueError):
+            SearchService(self.cities, engine='grep')
+        expected = self.expected('sain', None, None, 10)
+        for engine in ['trie', 'sharded']:
+            service = SearchService(self.cities, self.service.index, engine,
+                                    numShards=2)
+            try:
+                self.assertEqual(service.suggestions('sain'), expected, engine)
+            finally:
+                service.close()
+
+    def test_load(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, 'cities.snapshot')
+            Snapshot.write(path, self.cities[0:100], 
+                           CityIndex(self.cities[0:100]), DATA_PATH)
+            for columnar in [False, True]:
+                service = SearchService.load(DATA_PATH, path, columnar)
+                self.assertEqual(isinstance(service.cities, CityTable), columnar)
+                self.assertEqual(len(service.cities), 100)
+            # Not if the TSV file is not the one compiled, even if older. 
+            other = os.path.join(tmp, 'cities.tsv')
+            shutil.copy2(DATA_PATH, other)
+            os.utime(other, (0, 0))
+            self.assertEqual(len(SearchService.load(other, path).cities),
+                             len(self.cities))
+            expected = self.expected('lond', None, None, 10)
+            # The TSV file is loaded when there is no snapshot.
+            service = SearchService.load(DATA_PATH, os.path.join(tmp, 'none'))
+            self.assertEqual(service.suggestions('lond'), expected)
+            # Nor when the snapshot is truncated, though its header is right.
+            with open(path, 'r+b') as f:
+                f.truncate(os.path.getsize(path)//2)
+            self.assertEqual(len(SearchService.load(DATA_PATH, path).cities),
+                             len(self.cities))
+        finally:
+            shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    unittest.main()
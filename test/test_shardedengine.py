@@ -0,0 +1,138 @@
+'''
+Tests that the sharded engine returns exactly what the single-process search
+returns.
+'''
+
+import os
+import signal
+import threading
+import unittest
+from tools.autocomp import AutoComplete
+from tools.citytable import CityTable
+from tools.dataloader import DataLoader
+from tools.query import Query
+from tools.shardedengine import ShardedEngine
+from tools.scoringmethods.prefixpriority import PrefixPriority
+from configs import ROOT_DIR
+from test.reference import brute_force_results, summary
+
+
+class TestShardedEngine(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.cities = DataLoader.get_cities_tsv(ROOT_DIR + '/data/cities_canada-usa.tsv')
+        cls.engine = ShardedEngine(cls.cities, 3)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.engine.close()
+
+    def test_shards(self):
+        self.assertEqual(len(self.engine.bounds), 3)
+        self.assertEqual(self.engine.bounds[0][0], 0)
+        self.assertEqual(self.engine.bounds[-1][1], len(self.cities))
+        for (_, end), (start, _) in zip(self.engine.bounds, self.engine.bounds[1:]):
+            self.assertEqual(end, start)
+
+    def test_same_results(self):
+        pp = PrefixPriority()
+        # 'a' has many tied scores across shards. 
+        for q, lat, longi in [('a', None, None), ('lond', None, None),
+                              ('sageeney', None, None), 
+                              ('st.john', 43.70011, -79.4163)]:
+            query = Query(q, lat, longi)
+            expected = summary(brute_force_results(query, self.cities, pp, 0.6,
+                                                   0.1, 0.5, 0.1))
+            for n in [0, 1, 10, 5000, -1]:
+                actual = self.engine.get_query_results(query, pp, 0.6, 0.1, 0.5,
+                                                       0.1, n)
+                self.assertEqual(summary(actual), 
+                                 expected if n < 0 else expected[0:n], (q, n))
+
+    def test_through_autocomplete(self):
+        pp = PrefixPriority()
+        params = {'scoreMethod':pp, 'phoneticPenalty':0.6, 'minScore':0.1,
+                  'altNamePenalty':0.5, 'proximityWeight':0.1, 
+                  'engine':self.engine, 'session':{}}
+        for q in ['l', 'lo', 'lon']:
+            expected = AutoComplete().get_suggestions_json(q, None, None, 
+                                            self.cities, {'scoreMethod':pp, 
+                                            'phoneticPenalty':0.6, 'minScore':0.1,
+                                            'altNamePenalty':0.5, 
+                                            'proximityWeight':0.1}, 10)
+            self.assertEqual(AutoComplete().get_suggestions_json(q, None, None,
+                                            self.cities, params, 10), expected)
+
+    def test_batch(self):
+        pp = PrefixPriority()
+        queries = [('a', None, None, 10), ('lond', 43.7, -79.4, 5), 
+                   ('lond', None, None, -1), ('', None, None, 10), 
+                   ('a', None, None, 10)]
+        params = {'scoreMethod':pp, 'phoneticPenalty':0.6, 'minScore':0.1,
+                  'altNamePenalty':0.5, 'proximityWeight':0.1}
+        expected = list(AutoComplete().get_suggestions_batch(queries, 
+                                                    self.cities, params))
+        params['engine'] = self.engine
+        actual = list(AutoComplete().get_suggestions_batch(queries, self.cities,
+                                                           params, 2))
+        self.assertEqual(actual, expected)
+    
+    def test_not_forked(self):
+        self.assertNotEqual(ShardedEngine.context().get_start_method(), 'fork')
+        # Built from another thread, as on a reload.
+        engines = []
+        thread = threading.Thread(target=lambda: engines.append(
+                                      ShardedEngine(self.cities[0:100], 2)))
+        thread.start()
+        thread.join()
+        try:
+            query = Query('a', None, None)
+            self.assertEqual(summary(engines[0].get_query_results(
+                                 query, PrefixPriority(), 0.6, 0.1, 0.5, 0.1, 10)),
+                             summary(brute_force_results(
+                                 query, self.cities[0:100], PrefixPriority(),
+                                 0.6, 0.1, 0.5, 0.1))[0:10])
+        finally:
+            engines[0].close()
+
+    def test_worker_died(self):
+        engine = ShardedEngine(self.cities[0:100], 2)
+        try:
+            query = Query('a', None, None)
+            expected = summary(engine.get_query_results(query, PrefixPriority(),
+                                                        0.6, 0.1, 0.5, 0.1, 10))
+            for shard in (0, 1):
+                pid = engine.executors[shard].submit(os.getpid).result()
+                os.kill(pid, signal.SIGKILL)
+                self.assertEqual(summary(engine.get_query_results(query, 
+                                     PrefixPriority(), 0.6, 0.1, 0.5, 0.1, 10)),
+                                 expected)
+            pid = engine.executors[1].submit(os.getpid).result()
+            os.kill(pid, signal.SIGKILL)
+            self.assertEqual(summary(engine.get_query_results_batch(
+                                 [(query, 10)], PrefixPriority(), 0.6, 0.1,
+                                 0.5, 0.1)[0]), expected)
+        finally:
+            engine.close()
+
+    def test_small_data_sets(self):
+        table = CityTable.from_cities(self.cities[0:2])
+        for cities in [[], self.cities[0:2], table]:
+            engine = ShardedEngine(cities, 4)
+            try:
+                self.assertLessEqual(len(engine.bounds), 2)
+                query = Query(self.cities[0].origName, None, None)
+                actual = engine.get_query_results(query, PrefixPriority(), 0.6,
+                                                  0.1, 0.5, 0.1, 10)
+                expected = AutoComplete().get_query_results(query, cities,
+                                        PrefixPriority(), 0.6, 0.1, 0.5, 0.1,
+                                        numRes=10)
+                self.assertEqual(summary(actual), summary(expected))
+            finally:
+                engine.close()
+
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
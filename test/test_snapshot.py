@@ -0,0 +1,123 @@
+'''
+Tests that a data set read from a snapshot is the same as one read from TSV.
+'''
+
+import os
+import shutil
+import tempfile
+import unittest
+from tools.autocomp import AutoComplete
+from tools.city import City
+from tools.cityindex import CityIndex
+from tools.citytable import CityTable
+from tools.dataloader import DataLoader
+from tools.query import Query
+from tools.scoringmethods.prefixpriority import PrefixPriority
+from tools.snapshot import Snapshot, SnapshotFormatException, StaleSnapshotException
+from configs import ROOT_DIR
+from test.reference import summary
+
+
+class TestSnapshot(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.dir = tempfile.mkdtemp()
+        cls.path = os.path.join(cls.dir, 'cities.snapshot')
+        cls.cities = DataLoader.get_cities_tsv(ROOT_DIR + '/data/cities_canada-usa.tsv')
+        cls.index = CityIndex(cls.cities)
+        Snapshot.write(cls.path, cls.cities, cls.index)
+        cls.readCities, cls.readIndex = Snapshot.read(cls.path)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.dir)
+
+    def test_same_cities(self):
+        self.assertEqual(len(self.readCities), len(self.cities))
+        for city, readCity in zip(self.cities, self.readCities):
+            for attribute in City.__slots__:
+                self.assertEqual(getattr(readCity, attribute), 
+                                 getattr(city, attribute), attribute)
+            self.assertEqual(list(readCity.phonetics), list(city.phonetics))
+    
+    def test_columnar(self):
+        cities, index = Snapshot.read(self.path, columnar=True)
+        self.assertIsInstance(cities, CityTable)
+        self.assertEqual(cities.columns(), 
+                         CityTable.from_cities(self.cities).columns())
+        self.assertEqual(index.altNames, self.index.altNames)
+
+    def test_same_index(self):
+        self.assertEqual(self.readIndex.names, self.index.names)
+        self.assertEqual(self.readIndex.altNames, self.index.altNames)
+        self.assertEqual(self.readIndex.phonetics, self.index.phonetics)
+        self.assertEqual(self.readIndex.phoneticEntries, self.index.phoneticEntries)
+
+    def test_same_results(self):
+        pp = PrefixPriority()
+        for q, lat, longi in [('lond', None, None), ('sageeney', None, None),
+                              ('st.john', 43.70011, -79.4163)]:
+            query = Query(q, lat, longi)
+            expected = AutoComplete().get_query_results(query, self.cities, pp,
+                                        0.6, 0.1, 0.5, 0.1, self.index, 10)
+            actual = AutoComplete().get_query_results(query, self.readCities, pp,
+                                        0.6, 0.1, 0.5, 0.1, self.readIndex, 10)
+            self.assertEqual(summary(actual), summary(expected), q)
+
+    def test_not_a_snapshot(self):
+        path = os.path.join(self.dir, 'other')
+        for data in [b'', b'CITYSNAP', b'x'*100]:
+            with open(path, 'wb') as f:
+                f.write(data)
+            self.assertRaises(SnapshotFormatException, Snapshot.read, path)
+
+    def test_source(self):
+        path = os.path.join(self.dir, 'source.snapshot')
+        tsv = os.path.join(self.dir, 'cities.tsv')
+        shutil.copy2(ROOT_DIR + '/data/cities_canada-usa.tsv', tsv)
+        Snapshot.write(path, self.cities[0:10], CityIndex(self.cities[0:10]), tsv)
+        self.assertEqual(Snapshot.source(path), Snapshot.stamp(tsv))
+        self.assertEqual(Snapshot.source(self.path), Snapshot.UNKNOWN)
+        self.assertEqual(len(Snapshot.read(path, sourcePath=tsv)[0]), 10)
+        self.assertRaises(StaleSnapshotException, Snapshot.read, self.path,
+                          sourcePath=tsv)
+        # Same size, other modification time. 
+        os.utime(tsv, ns=(0, 0))
+        self.assertRaises(StaleSnapshotException, Snapshot.read, path,
+                          sourcePath=tsv)
+
+    def test_truncated_or_corrupt(self):
+        path = os.path.join(self.dir, 'truncated.snapshot')
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        for damaged in [data[0:len(data)//2], data[0:Snapshot.HEADER.size + 4],
+                        data + b'\x00'*8, 
+                        data[0:Snapshot.HEADER.size] + b'?'*16 + 
+                        data[Snapshot.HEADER.size + 16:]]:
+            with open(path, 'wb') as f:
+                f.write(damaged)
+            self.assertRaises(SnapshotFormatException, Snapshot.read, path)
+
+    def test_write_replaces(self):
+        path = os.path.join(self.dir, 'replaced.snapshot')
+        with open(path, 'wb') as f:
+            f.write(b'old')
+        Snapshot.write(path, self.cities[0:10], CityIndex(self.cities[0:10]))
+        self.assertEqual(len(Snapshot.read(path)[0]), 10)
+        self.assertFalse([name for name in os.listdir(self.dir) 
+                          if name.startswith('tmp')])
+
+    def test_other_version(self):
+        path = os.path.join(self.dir, 'old.snapshot')
+        with open(self.path, 'rb') as f:
+            data = bytearray(f.read())
+        data[8] = data[8] + 1
+        with open(path, 'wb') as f:
+            f.write(data)
+        self.assertRaises(SnapshotFormatException, Snapshot.read, path)
+
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
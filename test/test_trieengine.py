@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+'''
+Tests for the prefix trie and the search engine built on it.
+'''
+
+import unittest
+from tools.prefixtrie import PrefixTrie
+from tools.trieengine import TrieEngine, SubstringIndex
+from tools.dataloader import DataLoader
+from tools.query import Query
+from tools.scoringmethods.prefixpriority import PrefixPriority
+from tools.scoringmethods.jarowinkler import JaroWinkler
+from configs import ROOT_DIR
+from test.reference import brute_force_results, summary
+
+
+class TestPrefixTrie(unittest.TestCase):
+
+    def setUp(self):
+        self.trie = PrefixTrie()
+        for i, s in enumerate(['LONDON', 'LONGUEUIL', 'LONDONDERRY', 'LON',
+                               'LAVAL', 'LONDON']):
+            self.trie.insert(s, i, len(s))
+
+    def entries(self, prefix):
+        node, exact = self.trie.find(prefix)
+        if(node == None):
+            return None
+        return [entry for _, entry in self.trie.best_first(node)]
+
+    def test_find(self):
+        self.assertEqual(sorted(self.entries('LOND')), [0, 2, 5])
+        self.assertEqual(sorted(self.entries('L')), [0, 1, 2, 3, 4, 5])
+        self.assertEqual(self.entries('LONDONS'), None)
+        self.assertEqual(self.entries('X'), None)
+
+    def test_exact(self):
+        self.assertEqual(self.trie.find('LON')[1], True)
+        self.assertEqual(self.trie.find('LONGUE')[1], False)
+        self.assertEqual(self.trie.find('LONDON')[1], True)
+
+    def test_best_first_order(self):
+        node, _ = self.trie.find('LON')
+        keys = [key for key, _ in self.trie.best_first(node)]
+        self.assertEqual(keys, [3, 6, 6, 9, 11])
+
+        keys = [key for key, _ in self.trie.best_first(node, skipOwn=True)]
+        self.assertEqual(keys, [6, 6, 9, 11])
+        self.assertEqual(self.trie.size, 6)
+
+    def test_substring_index(self):
+        text = SubstringIndex()
+        for i, s in enumerate(['NEWLONDON', 'LONDON', 'LONLON']):
+            text.add(s, i)
+        text.freeze()
+        self.assertEqual(list(text.entries_containing('LON')), [0, 2])
+
+
+class TestTrieEngine(unittest.TestCase):
+    '''The engine must return exactly the first n results of the full scan.'''
+
+    @classmethod
+    def setUpClass(cls):
+        path = ROOT_DIR + '/data/cities_canada-usa.tsv'
+        cls.cities = DataLoader.get_cities_tsv(path)
+        cls.engine = TrieEngine(cls.cities)
+
+    def assert_same_results(self, q, n, lat=None, longi=None, scoreMethod=None):
+        if(scoreMethod == None):
+            scoreMethod = PrefixPriority()
+        query = Query(q, lat, longi)
+        expected = brute_force_results(query, self.cities, scoreMethod, 0.6,
+                                       0.1, 0.5, 0.1)
+        if(n >= 0):
+            expected = expected[0:n]
+        actual = self.engine.get_query_results(query, scoreMethod, 0.6, 0.1,
+                                               0.5, 0.1, n)
+        self.assertEqual(summary(actual), summary(expected), (q, n))
+
+    def test_prefixes(self):
+        for q in ['lo', 'lon', 'lond', 'Londo', 'springf', 'vanc', 'b']:
+            self.assert_same_results(q, 10)
+            self.assert_same_results(q, 1, 43.70011, -79.4163)
+
+    def test_other_queries(self):
+        '''Misspelled and unusual queries, which may fall back to the full scan.'''
+        for q in ['sageeney', 'st.john', 'Пенти', '##$@!!', 'xyzzy']:
+            self.assert_same_results(q, 10)
+
+    def test_hands_over_to_scan(self):
+        '''Full names and multi-word prefixes that the trie cannot certify.'''
+        scans = []
+        scan = self.engine.scan
+
+        def spy(*args):
+            scans.append(args[0].q)
+            return scan(*args)
+        self.engine.scan = spy
+        try:
+            for q in ['toronto', 'new y', 'san fr']:
+                self.assert_same_results(q, 10)
+            self.assert_same_results('lond', 10)
+        finally:
+            del self.engine.scan
+        self.assertEqual(scans, ['toronto', 'new y', 'san fr'])
+
+    def test_all_results(self):
+        self.assert_same_results('lond', -1)
+        self.assert_same_results('lond', 0)
+
+    def test_other_scoring_method(self):
+        self.assert_same_results('lond', 5, scoreMethod=JaroWinkler())
+
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
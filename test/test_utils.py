@@ -1,7 +1,10 @@
 # -*- coding: utf-8 -*-
 
 
+from tools.utils import PUNCTUATION_SPACES, PunctuationSpaces
 from tools.utils import strip_punctuation_spaces
+import sys
+import unicodedata
 import unittest
 
 class TestStringStripping(unittest.TestCase):
@@ -15,6 +18,19 @@ class TestStringStripping(unittest.TestCase):
         self.assertEqual(u'hello231blahblah', 
                          strip_punctuation_spaces(u'@hello \"\'231 blahblah!'))
         self.assertEqual(u'마켓마켓', strip_punctuation_spaces(u'   마켓??@#  마켓'))
+    
+    def test_every_code_point(self):
+        '''The lazy table strips exactly the characters the eager one used to.'''
+        text = ''.join(chr(i) for i in range(sys.maxunicode + 1))
+        expected = ''.join(c for c in text 
+                           if not unicodedata.category(c).startswith('P')
+                           and not unicodedata.category(c).startswith('Z'))
+        self.assertEqual(expected, strip_punctuation_spaces(text))
+        # Again, with the table filled in. 
+        self.assertEqual(expected, strip_punctuation_spaces(text))
+        # Only with punctuation, whitespace and the lower code points.
+        self.assertLess(len(PUNCTUATION_SPACES), 
+                        PunctuationSpaces.CACHED_BELOW + 1000)
         
 if __name__ == "__main__":
     #import sys;sys.argv = ['', 'Test.testName']
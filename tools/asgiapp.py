@@ -0,0 +1,252 @@
+'''
+ASGI application serving the /suggestions endpoint from a SearchService.
+
+Searches are CPU-bound, so they are not run on the event loop but in a
+bounded pool of threads, and the event loop only parses requests and sends
+responses. Under bursts of traffic, a slow query (e.g. a single letter) then
+holds up one thread rather than every request behind it, and the server can
+refuse what it cannot serve in time instead of queueing it:
+
+- admission control: at most maxPending searches are running or waiting for
+  a thread; a request beyond that is answered at once with 503 Service
+  Unavailable (and Retry-After), so that the queue, and the latency of
+  everything in it, stays bounded.
+- deadlines: a request whose suggestions are not ready within timeout
+  seconds of being admitted is answered with 504 Gateway Timeout, and its
+  search is dropped if it has not started yet.
+- cancellation: the queries of a session (see the session parameter) are
+  successive keystrokes of one user, so a new one supersedes the one before,
+  which is answered with 409 Conflict and dropped if it has not started yet.
+  Searches are also dropped when the client disconnects.
+
+A search that has started cannot be interrupted: its thread runs it to the end
+and its result is discarded.
+'''
+
+import asyncio
+import hmac
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+from tools.utils import to_float
+
+logger = logging.getLogger(__name__)
+
+class SuggestionsApp(object):
+    '''ASGI application serving /suggestions as main.autocomplete() does.
+
+    The parameters and responses are those of main.autocomplete(); the
+    batch endpoint is only served by main.py. If the service has Metrics,
+    they are served at /metrics as by main.get_metrics(), and if it has a
+    QueryLog and there is an adminToken, it is served at /querylog as by
+    main.get_query_log().
+
+    Attributes:
+        service -- the SearchService answering queries; may be replaced by
+                   another, e.g. over a new data set, while serving.
+        executor -- ThreadPoolExecutor the searches run in.
+        maxPending -- maximum number of searches running or waiting for a
+                      thread.
+        timeout -- seconds a request may wait for its suggestions, or None
+                   for no limit.
+        pending -- number of searches submitted and not yet finished.
+        latest -- dictionary from session token to the search of the latest
+                  query of the session, while it is not finished.
+        adminToken -- the token a request for /querylog must give as
+                      'Authorization: Bearer <token>', or None to not serve
+                      it.
+
+    Methods:
+        submit -- run a function in the executor, counting it as pending.
+        close -- stop the executor and the service.
+    '''
+
+    def __init__(self, service, maxWorkers=None, maxPending=64, timeout=2.0,
+                 adminToken=None):
+        '''Create an application answering queries with service.
+
+        Arguments:
+            service -- SearchService.
+            maxWorkers -- [OPTIONAL] number of threads searches run in; by
+                          default, as for ThreadPoolExecutor.
+            maxPending -- [OPTIONAL] see the class attributes.
+            timeout, adminToken -- [OPTIONAL] see the class attributes.
+        '''
+        self.service = service
+        self.executor = ThreadPoolExecutor(maxWorkers)
+        self.maxPending = maxPending
+        self.timeout = timeout
+        self.pending = 0
+        self.latest = {}
+        self.adminToken = adminToken
+        self.lock = threading.Lock()
+
+    async def __call__(self, scope, receive, send):
+        if(scope['type'] == 'lifespan'):
+            await self.lifespan(receive, send)
+        elif(scope['type'] == 'http'):
+            if(scope['path'] == '/metrics' and self.service.metrics != None):
+                await respond(send, 200, self.service.metrics.render(),
+                              contentType=METRICS_CONTENT_TYPE)
+            elif(scope['path'] == '/querylog' and self.service.queryLog != None
+                 and self.adminToken != None):
+                if(not self.authorised(scope)):
+                    await respond(send, 403, 'Forbidden\n')
+                else:
+                    await respond(send, 200, self.service.queryLog.ndjson(),
+                                  contentType=NDJSON_CONTENT_TYPE)
+            elif(scope['path'] != '/suggestions'):
+                await respond(send, 404, 'Not Found\n')
+            elif(scope['method'] != 'GET'):
+                await respond(send, 405, 'Method Not Allowed\n',
+                              [(b'allow', b'GET')])
+            else:
+                await self.suggestions(scope, receive, send)
+
+    def authorised(self, scope):
+        '''Returns True iff a request gives the adminToken; see main.admin_denied().'''
+        given = b''
+        for name, value in scope.get('headers', ()):
+            if(name.lower() == b'authorization'):
+                given = value
+        return hmac.compare_digest(given, ('Bearer ' +
+                                           self.adminToken).encode('utf-8'))
+
+    async def lifespan(self, receive, send):
+        while(True):
+            message = await receive()
+            if(message['type'] == 'lifespan.startup'):
+                await send({'type':'lifespan.startup.complete'})
+            elif(message['type'] == 'lifespan.shutdown'):
+                self.close()
+                await send({'type':'lifespan.shutdown.complete'})
+                return
+
+    async def suggestions(self, scope, receive, send):
+        '''Answers a /suggestions request; see main.autocomplete().'''
+        args = {}
+        # As Werkzeug does for main.py: UTF-8, also for bytes not
+        # percent-encoded.
+        for name, value in parse_qsl(scope['query_string'].decode('utf-8',
+                                                                  'replace'),
+                                     keep_blank_values=True):
+            args.setdefault(name, value)
+        q = args.get('q')
+        lat, longi = to_float(args.get('latitude')), to_float(args.get('longitude'))
+        try:
+            numRes = int(args.get('n'))
+        except (TypeError, ValueError):
+            numRes = 10
+        token = args.get('session')
+        ndjson = args.get('format') == 'ndjson'
+        timeoutMs = to_float(args.get('timeout_ms'))
+        if(timeoutMs != None and timeoutMs < 0):
+            timeoutMs = None
+
+        if(q == None or len(q) == 0):
+            await respond(send, 200, '{}')
+            return
+        if(self.pending >= self.maxPending):
+            await respond(send, 503, 'Too many queries, try again later\n',
+                          [(b'retry-after', b'1')])
+            return
+
+        # The service as of now, even if it is replaced meanwhile.
+        service = self.service
+        chunks = None
+        if(numRes < 0):
+            chunks = service.suggestions_stream(q, lat, longi, ndjson, token)
+            work = self.submit(next, chunks, None)
+        else:
+            work = self.submit(service.suggestions, q, lat, longi, numRes,
+                               token, timeoutMs)
+
+        if(token != None and len(token) > 0):
+            previous = self.latest.get(token)
+            if(previous != None):
+                previous.cancel()
+            self.latest[token] = work
+        try:
+            done = await self.wait(work, receive)
+        finally:
+            if(token != None and self.latest.get(token) is work):
+                del self.latest[token]
+
+        if(not done):
+            # The client is gone.
+            work.cancel()
+        elif(work.cancelled()):
+            await respond(send, 409, 'Superseded by a later query of the session\n')
+        elif(not work.done()):
+            work.cancel()
+            await respond(send, 504, 'Query timed out\n')
+        elif(work.exception() != None):
+            logger.error('Query %r failed', q, exc_info=work.exception())
+            await respond(send, 500, 'Internal Server Error\n')
+        elif(chunks == None):
+            await respond(send, 200, work.result())
+        else:
+            await self.stream(send, chunks, work.result(), ndjson)
+
+    async def wait(self, work, receive):
+        '''Waits for work until it is done or the deadline passes; returns False if the client disconnects first.'''
+        disconnect = asyncio.ensure_future(disconnected(receive))
+        try:
+            done, _ = await asyncio.wait([work, disconnect], timeout=self.timeout,
+                                         return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            disconnect.cancel()
+        return disconnect not in done
+
+    async def stream(self, send, chunks, chunk, ndjson):
+        '''Sends chunk and the rest of chunks, serialised in the executor as they are sent.'''
+        await send({'type':'http.response.start', 'status':200,
+                    'headers':[(b'content-type', NDJSON_CONTENT_TYPE
+                                if ndjson else CONTENT_TYPE)]})
+        while(chunk != None):
+            await send({'type':'http.response.body',
+                        'body':chunk.encode('utf-8'), 'more_body':True})
+            chunk = await self.submit(next, chunks, None)
+        await send({'type':'http.response.body', 'body':b''})
+
+    def submit(self, function, *args):
+        '''Returns an asyncio future of function(*args), run in the executor.
+
+        The call counts as pending until it finishes or is cancelled.
+        Cancelling the future before the call starts keeps it from running.
+        '''
+        with self.lock:
+            self.pending = self.pending + 1
+        future = self.executor.submit(function, *args)
+        future.add_done_callback(self.finished)
+        return asyncio.wrap_future(future)
+
+    def finished(self, future):
+        with self.lock:
+            self.pending = self.pending - 1
+
+    def close(self):
+        '''Stop the executor, once running searches finish, and the service.'''
+        self.executor.shutdown()
+        self.service.close()
+
+
+# As returned by Flask for a string.
+CONTENT_TYPE = b'text/html; charset=utf-8'
+# Prometheus text exposition format.
+METRICS_CONTENT_TYPE = b'text/plain; version=0.0.4; charset=utf-8'
+NDJSON_CONTENT_TYPE = b'application/x-ndjson'
+
+async def respond(send, status, body, headers=(), contentType=None):
+    '''Send a complete response with a text body.'''
+    if(contentType == None):
+        contentType = CONTENT_TYPE if status == 200 else b'text/plain; charset=utf-8'
+    await send({'type':'http.response.start', 'status':status,
+                'headers':[(b'content-type', contentType)] + list(headers)})
+    await send({'type':'http.response.body', 'body':body.encode('utf-8')})
+
+async def disconnected(receive):
+    '''Returns when the client disconnects.'''
+    while((await receive())['type'] != 'http.disconnect'):
+        pass
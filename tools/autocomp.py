@@ -1,11 +1,18 @@
 # -*- coding: utf-8 -*-
 
 from metaphone import doublemetaphone
-from tools.utils import haversine, sigmoid, strip_punctuation_spaces
+from tools.utils import haversine, sigmoid, strip_punctuation_spaces, MAX_DIST_KM
 from tools.matchresult import MatchResult
 from tools.query import Query
+from tools.topresults import TopResults
+from tools.jsonfragments import JSONFragments
+from tools.metrics import PassTimer
 
-import json 
+import numpy as np
+from array import array
+from collections import OrderedDict
+from itertools import islice
+from time import perf_counter
 from tools.scoringmethods.scoringmethod import ScoringMethod
 from tools.scoringmethods.prefixpriority import PrefixPriority
 
@@ -23,9 +30,15 @@ class AutoComplete(object):
     Methods:
         get_suggestions_json -- returns auto-complete suggestions for query in 
                                 JSON format.
+        get_suggestions_batch -- yields auto-complete suggestions for many 
+                                 queries in JSON format. 
+        get_suggestions_stream -- yields all auto-complete suggestions for 
+                                  query in JSON format, a chunk at a time. 
         get_query_results -- gets auto-complete suggestions for a query, taking into
                              account query string, location (if provided), and
                              other factors. 
+        iter_query_results -- yields all the results of get_query_results,
+                              with a few dozen bytes per result in memory. 
         json_repr -- returns a JSON representation of given auto-complete suggestions.
         proximity_points -- given 2 coordinates, returns a value in [0, 1] where 
                             the larger the value, the closer the coordinates.
@@ -42,6 +55,15 @@ class AutoComplete(object):
             cities -- list of City objects to try to match the query to
             params -- dictionary containing parameters for get_query_result method;
                       the keys should be the names of the arguments thereof.
+                      The 'index' and 'session' keys are optional. If the 
+                      optional key 'engine' is present, its value (e.g. a 
+                      TrieEngine built over cities) is used in place of 
+                      get_query_results. The optional key 'fragments' is a
+                      JSONFragments built over cities, used by json_repr. 
+                      The optional key 'deadline' is a Deadline by which 
+                      get_query_results stops; engines do not stop early. 
+                      The optional key 'metrics' is the Metrics the stages
+                      of the query are recorded in.
             numRes -- the number of results to return. 
                       If numRes > the number of results returned by algorithm,
                       return all available results. 
@@ -58,19 +80,178 @@ class AutoComplete(object):
         '''
           
         query = Query(q, lat, longi)
-        results = self.get_query_results(query, cities, 
+        engine = params.get('engine')
+        metrics = params.get('metrics')
+        if(engine != None):
+            results = engine.get_query_results(query, params['scoreMethod'], 
+                                    params['phoneticPenalty'], params['minScore'], 
+                                    params['altNamePenalty'], 
+                                    params['proximityWeight'], numRes,
+                                    params.get('session'))
+        else: 
+            results = self.get_query_results(query, cities, 
                                     params['scoreMethod'], params['phoneticPenalty'], 
                                     params['minScore'], params['altNamePenalty'], 
-                                    params['proximityWeight'])
+                                    params['proximityWeight'], 
+                                    params.get('index'), numRes, 
+                                    params.get('session'), 
+                                    params.get('deadline'), metrics)
         if(numRes < 0):
             numRes = len(results)
+        
+        if(metrics == None):
+            return self.json_repr(results[0:numRes], params.get('fragments'))
+        start = perf_counter()
+        suggestions = self.json_repr(results[0:numRes], params.get('fragments'))
+        metrics.observe('serialize', perf_counter() - start)
+        metrics.results.inc(min(numRes, len(results)))
+        return suggestions
+    
+    
+    def get_suggestions_stream(self, q, lat, longi, cities, params, 
+                               ndjson=False, chunkSize=256):
+        '''Yields all suggestions for query q in JSON format, a chunk at a time.
+        
+        Joined, the chunks are exactly what get_suggestions_json returns for
+        a negative numRes; or, if ndjson, the same suggestions as one line of
+        JSON each. Results come from iter_query_results, so that the JSON 
+        representations of the suggestions, which can run to megabytes for
+        short queries, are not all held in memory at once. Memory still grows
+        with the number of suggestions, though much more slowly; see 
+        iter_query_results. 
+        
+        Arguments: 
+            q, lat, longi, cities -- as for get_suggestions_json. 
+            params -- as for get_suggestions_json; the 'engine' key is not used,
+                      as all engines give the same results for all 
+                      suggestions. 
+            ndjson -- if True, yield newline-delimited JSON rather than a list.
+            chunkSize -- the number of suggestions per chunk. 
+        
+        Preconditions are as for get_suggestions_json. 
+        '''
+        query = Query(q, lat, longi)
+        results = self.iter_query_results(query, cities, params['scoreMethod'], 
+                                params['phoneticPenalty'], params['minScore'], 
+                                params['altNamePenalty'], 
+                                params['proximityWeight'], params.get('index'), 
+                                params.get('session'))
+        fragments = params.get('fragments')
+        if(fragments == None):
+            fragments = JSONFragments()
+        if(ndjson):
+            separator, start, end = '\n', '', '\n'
+        else:
+            separator, start, end = ', ', '[', ']'
+        
+        count = 0
+        while(True):
+            chunk = [fragments.suggestion(result) 
+                     for result in islice(results, chunkSize)]
+            if(len(chunk) == 0):
+                break
+            yield (start if count == 0 else separator) + separator.join(chunk)
+            count = count + len(chunk)
+        if(count == 0 and not ndjson):
+            yield start + end
+        elif(count > 0):
+            yield end
+    
+    
+    def get_suggestions_batch(self, queries, cities, params, chunkSize=256,
+                              maxSeenChars=8*1024*1024):
+        '''Yields the suggestions for each of many queries in JSON format, in order.
+        
+        For bulk jobs: each suggestion is the same as get_suggestions_json 
+        returns, or '{}' for an empty or missing query string, as from the
+        /suggestions endpoint. Queries are read chunkSize at a time, so that
+        results are yielded as they are worked out and queries can come from
+        a stream. 
+        
+        Identical queries are only searched once, as long as their 
+        suggestions are remembered. All the queries share one session, so 
+        queries requiring the same n-grams (e.g. with the same first 
+        characters) share their candidates, which are kept in the index's 
+        byte-bounded cache (see CityIndex.candidates()). If the engine in 
+        params has a get_query_results_batch method (e.g. a ShardedEngine), 
+        each chunk is searched with one call to it, which spreads the chunk 
+        over the engine's worker processes. 
+        
+        Memory is bounded by maxSeenChars for the suggestions remembered, 
+        plus, with such an engine, the results of one chunk, and otherwise 
+        the results of one query; all suggestions (numRes < 0) for a short 
+        query can alone run to megabytes. 
+        
+        Arguments: 
+            queries -- iterable of (q, lat, longi, numRes) tuples; see 
+                       get_suggestions_json. 
+            cities, params -- as for get_suggestions_json; the 'session' key
+                              of params is not used. 
+            chunkSize -- the number of queries to search at a time. 
+            maxSeenChars -- the total length of the suggestions of distinct
+                            queries remembered, least recently used first 
+                            out; about as many bytes, as the JSON is mostly
+                            ASCII. Longer suggestions are not remembered. 
+        '''
+        engine = params.get('engine')
+        searchBatch = getattr(engine, 'get_query_results_batch', None)
+        params = dict(params, session={})
+        fragments = params.get('fragments')
+        # Suggestions of the distinct queries seen, by (q, lat, longi, numRes),
+        # and their total length. 
+        seen = OrderedDict()
+        seenChars = 0
+        queries = iter(queries)
+        while(True):
+            chunk = [tuple(query) for query in islice(queries, chunkSize)]
+            if(len(chunk) == 0):
+                return
+            
+            # Results of the distinct queries of the chunk not seen yet, if
+            # searched all at once. 
+            found = {}
+            if(searchBatch != None):
+                todo = list(OrderedDict.fromkeys(key for key in chunk 
+                                                 if key[0] != None and 
+                                                 len(key[0]) > 0 and 
+                                                 key not in seen))
+                found = dict(zip(todo, searchBatch(
+                                [(Query(q, lat, longi), numRes) 
+                                 for q, lat, longi, numRes in todo],
+                                params['scoreMethod'], params['phoneticPenalty'], 
+                                params['minScore'], params['altNamePenalty'],
+                                params['proximityWeight'])))
             
-        return self.json_repr(results[0:numRes])
+            for key in chunk:
+                q, lat, longi, numRes = key
+                if(q == None or len(q) == 0):
+                    yield '{}'
+                    continue
+                
+                suggestions = seen.get(key)
+                if(suggestions != None):
+                    seen.move_to_end(key)
+                    yield suggestions
+                    continue
+                if(key in found):
+                    results = found[key]
+                    suggestions = self.json_repr(results if numRes < 0 else 
+                                                 results[0:numRes], fragments)
+                else:
+                    suggestions = self.get_suggestions_json(q, lat, longi, 
+                                                    cities, params, numRes)
+                if(len(suggestions) <= maxSeenChars):
+                    seen[key] = suggestions
+                    seenChars = seenChars + len(suggestions)
+                    while(seenChars > maxSeenChars):
+                        seenChars = seenChars - len(seen.popitem(last=False)[1])
+                yield suggestions
     
     
     def get_query_results(self, query, data, scoreMethod=PrefixPriority, 
                           phoneticPenalty=0.2, minScore=0.15, 
-                          altNamePenalty=0.5, proximityWeight=0.1):
+                          altNamePenalty=0.5, proximityWeight=0.1, index=None,
+                          numRes=-1, session=None, deadline=None, metrics=None):
         '''Get all cities matching the query with a score > minScore
         
         Arguments:
@@ -86,6 +267,25 @@ class AutoComplete(object):
                               the most well-known name of cities. 
             proximityWeight -- how much influence geographical closeness has on
                                the final score, if applicable. 
+            index -- [OPTIONAL] CityIndex built over data. If supplied, the
+                     names and phonetic representations of cities that cannot
+                     score above minScore are not scored, and the proximity 
+                     of the matching cities is computed all at once from the
+                     index's coordinate arrays. 
+            numRes -- [OPTIONAL] if non-negative, only the numRes best results
+                      are returned; they are kept in a bounded heap rather than
+                      sorting all results. 
+            session -- [OPTIONAL] dictionary kept between the successive
+                       queries of one user (e.g. as they type), initially
+                       empty. Used with index to reuse the candidates of the
+                       previous query rather than look them up again; see 
+                       CityIndex.candidates(). 
+            deadline -- [OPTIONAL] Deadline after which no more cities are 
+                        scored. The results are then the best of the cities
+                        scored by the deadline, the most populous first if 
+                        index is given, and deadline.reached is True. 
+            metrics -- [OPTIONAL] Metrics to record the time spent in each
+                       stage of the search in. 
         
         Returns:
             A list of MatchResults, each MatchResult containing the city, 
@@ -95,66 +295,311 @@ class AutoComplete(object):
             -- query.q != None and query.q != ''
         '''
         
-        results = []
-        # Phonetic representation of query
-        pq1, pq2 = doublemetaphone(query.q)
-        if(len(pq2) > 0):
-            pq = (pq1, pq2)
+        # Best numRes results so far, if only those are wanted. 
+        top = TopResults(numRes, minScore) if numRes >= 0 else None
+        matches = self.match_cities(query, data, scoreMethod, phoneticPenalty,
+                                    minScore, altNamePenalty, proximityWeight,
+                                    index, session, top, deadline, metrics)
+        
+        if(top != None):
+            for pos, city, score, bestName in matches:
+                top.add(score, pos, city, bestName)
+            start = perf_counter() if metrics != None else None
+            results = top.results()
         else:
-            pq = pq1,
+            if(deadline != None):
+                # Matches come most populous first; put them back in order. 
+                matches = sorted(matches, key=lambda match: match[0])
+            results = [MatchResult(city, score, bestName) 
+                       for _, city, score, bestName in matches]
+            start = perf_counter() if metrics != None else None
+            # Sort results in descending order; ties stay in data set order.
+            results.sort(key=lambda matchresult: matchresult.score, reverse=True)
         
-        # Convert query to uppercase, strip punctuation and whitespace.
-        queryStr = strip_punctuation_spaces(query.q)
-        queryStr = queryStr.upper()
+        if(metrics != None):
+            metrics.observe('rank', perf_counter() - start)
+        return results
+    
+    
+    def iter_query_results(self, query, data, scoreMethod=PrefixPriority, 
+                           phoneticPenalty=0.2, minScore=0.15, 
+                           altNamePenalty=0.5, proximityWeight=0.1, index=None,
+                           session=None):
+        '''Yields all cities matching the query with a score > minScore, best first.
         
-        for city in data: 
-
-            # Try matching original query string to the city name. 
-            maxScore = scoreMethod.score(queryStr, city.name)
-            
-            # The name of the city that got the highest score.
-            bestName = city.origName 
-            
-            # Then try matching alternative names 
-            for name in city.altNames: 
-                score = altNamePenalty * scoreMethod.score(queryStr, name)
-
-                if(score > maxScore):
-                    maxScore = score 
-                    bestName = name 
+        Yields the same MatchResults as get_query_results returns for a 
+        negative numRes, but takes much less memory when there are many: 
+        only the position, score and best name of each matching city are kept
+        (in arrays), to be ranked at the end, and MatchResults are only made
+        as they are yielded. The memory taken is not bounded, though: ranking
+        needs every match before the first is yielded, so those arrays, and
+        the candidates the index looks up, grow with the number of matches. 
+        
+        Arguments are as for get_query_results. 
+        '''
+        positions = array('I')
+        scores = array('d')
+        names = []
+        for pos, _, score, bestName in self.match_cities(query, data, 
+                                            scoreMethod, phoneticPenalty, 
+                                            minScore, altNamePenalty, 
+                                            proximityWeight, index, session):
+            positions.append(pos)
+            scores.append(score)
+            names.append(bestName)
+        
+        # Matches come in data set order, so a stable sort keeps ties in it. 
+        for i in np.argsort(-np.array(scores), kind='stable').tolist():
+            yield MatchResult(data[positions[i]], scores[i], names[i])
+    
+    
+    def match_cities(self, query, data, scoreMethod, phoneticPenalty, minScore, 
+                     altNamePenalty, proximityWeight, index=None, session=None, 
+                     top=None, deadline=None, metrics=None):
+        '''Yields (position, city, score, bestName) of the cities matching query with a score > minScore.
+        
+        Cities are yielded in data set order; or, with a deadline and index,
+        most populous first, so that those scored by the deadline are the
+        likeliest ones. Arguments are as for get_query_results, except:
+            top -- [OPTIONAL] TopResults the matches are for. Cities that 
+                   cannot get into it may be left out. 
+        '''
+        # Cities to weigh by proximity, as positions, scores and best names;
+        # they are weighed all at once if the index has their coordinates. 
+        nearPositions = array('I')
+        nearScores = []
+        nearNames = []
+        # Proximity never raises a score, so names that cannot get their 
+        # city into top are not worth scoring; unless it can. 
+        bounding = top if query.coord == None or proximityWeight >= 0 else None
+        if(metrics != None):
+            start = perf_counter()
+        queryStr, pq = self.preprocess_query(query.q)
+        if(metrics != None):
+            metrics.observe('normalize', perf_counter() - start)
+            start = perf_counter()
+        
+        # Cities, and which of their names, worth scoring. 
+        positions, names, phonetics = None, None, None
+        if(index != None):
+            positions, names, phonetics = index.candidates(queryStr, pq, 
+                                                scoreMethod, phoneticPenalty, 
+                                                minScore, altNamePenalty, session)
+            if(metrics != None):
+                metrics.observe('candidates', perf_counter() - start)
+        if(deadline != None and index != None):
+            positions = index.by_popularity(positions)
+        elif(positions == None):
+            positions = range(len(data))
+        
+        # Work out what only depends on the query once, not for every name. 
+        scorer = scoreMethod.compile(queryStr)
+        phoneticScorers = [scoreMethod.compile(q) for q in pq]
+        passBounds = self.pass_bounds(scorer, phoneticScorers, phoneticPenalty,
+                                      altNamePenalty)
+        # Time the passes of a sample of the queries; see Metrics. 
+        passTimer = None
+        if(metrics != None):
+            if(metrics.sample_passes()):
+                passTimer = PassTimer(scorer, phoneticScorers)
+                scorer, phoneticScorers = passTimer.scorer, passTimer.phoneticScorers
+            start = perf_counter()
+        
+        stopped = None
+        for pos in positions: 
+            if(deadline != None and deadline.expired()):
+                stopped = pos
+                break 
+            city = data[pos]
+            if(passTimer != None):
+                passTimer.name = city.name
+            scoreNames = names == None or pos in names
+            phoneticNames = None if phonetics == None else phonetics.get(pos, ())
+            maxScore, bestName = self.score_city(city, scorer, phoneticScorers, 
+                                                 phoneticPenalty, altNamePenalty,
+                                                 scoreNames, phoneticNames, 
+                                                 bounding, passBounds)
             
-            '''    
-            Now try matching based on phonetic names, and penalise the 
-            score slightly. Also require that for phonetics, we need a longer
-            character sequence to match (else way too many irrelevant results). 
-            '''
-            if(len(pq1) >=2):
-                for origName in city.phonetics:
-                    # For each phonetic representation of the alternative name
-                    for name in city.phonetics[origName]:
-                        # for each phonetic representation of the query string    
-                        for q in pq:      
-                            score = phoneticPenalty * scoreMethod.score(q, name)  
-                            if(score > maxScore):
-                                maxScore = score 
-                                bestName = origName
+            # Don't bother if the city cannot make the top numRes anyway. 
+            if(bounding != None and not top.could_enter(maxScore)):
+                continue 
                                              
             # If query location provided, score closer cities higher. 
-            # Also give location more weight when score is already high. 
             if(query.coord != None and maxScore > minScore):
-                proxPoints = self.proximity_points(query.coord, 
-                                                  (city.latitude, city.longitude))
-                
-                # Add proximity points and renormalise to [0, 1] range.
-                maxScore = (maxScore + proxPoints*maxScore*proximityWeight)/(1.0 + proximityWeight)
+                if(index != None):
+                    nearPositions.append(pos)
+                    nearScores.append(maxScore)
+                    nearNames.append(bestName)
+                    continue 
+                maxScore = self.weigh_proximity(maxScore, query.coord, city, 
+                                                proximityWeight)
             
             if(maxScore > minScore):
-                results.append(MatchResult(city, maxScore, bestName))
-                    
-        # Sort results in descending order.                   
-        return sorted(results, key=lambda matchresult: matchresult.score, reverse=True)
+                yield pos, city, maxScore, bestName
+        
+        if(metrics != None):
+            metrics.observe('score', perf_counter() - start)
+            # Candidates reached, whether or not pruning skipped their names. 
+            metrics.candidates.inc(len(positions) if stopped == None 
+                                   else positions.index(stopped))
+            if(passTimer != None):
+                passTimer.record(metrics)
+        
+        if(len(nearPositions) > 0):
+            start = perf_counter() if metrics != None else None
+            scores = index.coordinates.weigh_proximity(query.coord, 
+                                nearPositions, nearScores, proximityWeight)
+            if(metrics != None):
+                metrics.observe('proximity', perf_counter() - start)
+            for i, score in enumerate(scores):
+                if(score > minScore):
+                    pos = nearPositions[i]
+                    yield pos, data[pos], score, nearNames[i]
 
     
+    def preprocess_query(self, q):
+        '''Returns the preprocessed query string and the query's phonetic representations.
+        
+        The query string is converted to uppercase and has punctuation and 
+        whitespace stripped. The phonetic representations are those computed by
+        the double metaphone algorithm; if the primary one is shorter than 2
+        characters, an empty tuple is returned instead, as phonetic matching on
+        so short a sequence gives way too many irrelevant results. 
+        
+        Returns:
+            A tuple (queryStr, pq), where pq is a tuple of phonetic strings.
+        '''
+        # Phonetic representation of query
+        pq1, pq2 = doublemetaphone(q)
+        if(len(pq1) < 2):
+            pq = ()
+        elif(len(pq2) > 0):
+            pq = (pq1, pq2)
+        else:
+            pq = pq1,
+        
+        # Convert query to uppercase, strip punctuation and whitespace.
+        queryStr = strip_punctuation_spaces(q)
+        queryStr = queryStr.upper()
+        
+        return queryStr, pq
+    
+    
+    def pass_bounds(self, scorer, phoneticScorers, phoneticPenalty, 
+                    altNamePenalty):
+        '''Returns upper bounds of the penalised scores of alternative names and phonetic representations.
+        
+        Penalised bounds are only bounds for non-negative penalties, but 
+        scores are never negative, so negative penalties give a bound of 0. 
+        
+        Returns: 
+            A tuple (altBound, phoneticBound). 
+        '''
+        altBound = max(altNamePenalty, 0)*scorer.ceiling
+        phoneticBound = 0.0
+        for phoneticScorer in phoneticScorers:
+            phoneticBound = max(phoneticBound, 
+                                max(phoneticPenalty, 0)*phoneticScorer.ceiling)
+        return altBound, phoneticBound
+    
+    
+    def score_city(self, city, scorer, phoneticScorers, phoneticPenalty, 
+                   altNamePenalty, scoreNames=True, phoneticNames=None, 
+                   top=None, passBounds=None):
+        '''Returns the best score of any of city's names, and the name that attained it.
+        
+        Proximity to the caller is not taken into account. 
+        
+        The alternative names, or phonetic representations, are not scored
+        at all if the upper bound of their penalised scores (see 
+        pass_bounds) cannot beat the best score so far. 
+        
+        Arguments:
+            city -- the City to score. 
+            scorer -- QueryScorer of the query string, as returned by 
+                      preprocess_query, compiled by the scoring method. 
+            phoneticScorers -- list of the QueryScorers of the query's 
+                               phonetic representations, in the same order. 
+            phoneticPenalty, altNamePenalty -- see get_query_results.
+            scoreNames -- if False, only the phonetic representations of the 
+                          city's names are scored; use when the names are known
+                          not to score above the threshold of interest. 
+            phoneticNames -- if not None, only the phonetic representations of 
+                             these of the city's original names are scored;
+                             the others must be known not to score above the
+                             threshold of interest. 
+            top -- [OPTIONAL] TopResults the city is a candidate for. Names 
+                   whose bound could not get the city into top are not scored
+                   either; then, if the city cannot get into top, the score 
+                   returned may be below its best one. 
+            passBounds -- [OPTIONAL] what pass_bounds() returns for the other
+                          arguments; pass it when scoring many cities. 
+        
+        Returns:
+            A tuple (score, bestName), where bestName is the name of the city 
+            which resulted in the highest score. 
+        '''
+        # The name of the city that got the highest score.
+        bestName = city.origName 
+        maxScore = 0.0
+        if(passBounds == None):
+            passBounds = self.pass_bounds(scorer, phoneticScorers, 
+                                          phoneticPenalty, altNamePenalty)
+        altBound, phoneticBound = passBounds
+        
+        if(scoreNames):
+            # Try matching original query string to the city name. 
+            if(top == None or top.could_enter(scorer.upper_bound(city.name))):
+                maxScore = scorer.score(city.name)
+            
+            # Then try matching alternative names, unless none could do better.
+            if(altBound > maxScore and (top == None or top.could_enter(altBound))):
+                for name in city.altNames: 
+                    score = altNamePenalty * scorer.score(name)
+    
+                    if(score > maxScore):
+                        maxScore = score 
+                        bestName = name 
+        
+        if(len(phoneticScorers) == 0 or (phoneticNames != None and len(phoneticNames) == 0)):
+            return maxScore, bestName
+        
+        if(phoneticBound <= maxScore or 
+           (top != None and not top.could_enter(phoneticBound))):
+            return maxScore, bestName
+        
+        '''    
+        Now try matching based on phonetic names, and penalise the 
+        score slightly. 
+        '''
+        for origName in city.phonetics:
+            if(phoneticNames != None and origName not in phoneticNames):
+                continue
+            # For each phonetic representation of the alternative name
+            for name in city.phonetics[origName]:
+                # for each phonetic representation of the query string    
+                for phoneticScorer in phoneticScorers:      
+                    score = phoneticPenalty * phoneticScorer.score(name)  
+                    if(score > maxScore):
+                        maxScore = score 
+                        bestName = origName
+        
+        return maxScore, bestName
+    
+    
+    def weigh_proximity(self, score, queryCoord, city, proximityWeight):
+        '''Returns score adjusted for how close city is to queryCoord.
+        
+        Location is given more weight when the score is already high. The 
+        result is in range [0, score] for non-negative score and proximityWeight.
+        '''
+        proxPoints = self.proximity_points(queryCoord, 
+                                           (city.latitude, city.longitude))
+        
+        # Add proximity points and renormalise to [0, 1] range.
+        return (score + proxPoints*score*proximityWeight)/(1.0 + proximityWeight)
+    
+    
     def proximity_points(self, query, candidate):
         '''Returns a score between 0 and 1 based on physical proximity of query and candidate.
         
@@ -177,19 +622,22 @@ class AutoComplete(object):
                that is, otf (x, y) where -90 <= x <= 90 and -180 <= y <= 180.
         '''
         
-        ''''The (approximate) maximum distance any two locations on the surface 
-        of a sphere of radius 6371 km can be. 
-        '''
-        MAX_DIST = 20016
         dist = haversine(query, candidate)
         
-        return 1.0 - (dist/MAX_DIST)
+        return 1.0 - (dist/MAX_DIST_KM)
     
     
-    def json_repr(self, matchResults):
+    def json_repr(self, matchResults, fragments=None):
         '''Returns a JSON representation of the matchResults.
+        
+        The same as json.dumps(matchResults, default=MatchResult.dict_repr),
+        written by a JSONFragments; pass the one built when the cities were
+        loaded, if any, so that only the scores and alternative names need
+        formatting. 
         '''
-        return json.dumps(matchResults, default=MatchResult.dict_repr)
+        if(fragments == None):
+            fragments = JSONFragments()
+        return fragments.dumps(matchResults)
          
     
     
@@ -0,0 +1,184 @@
+'''
+In-process caches.
+
+Classes:
+    LRUCache -- thread-safe least-recently-used cache with optional expiry.
+    SuggestionCache -- LRUCache of suggestions keyed on normalised queries.
+'''
+
+from collections import OrderedDict
+import copy
+from math import isfinite
+import threading
+import time
+from tools.autocomp import AutoComplete
+
+class LRUCache(object):
+    '''Thread-safe least-recently-used cache with an optional time-to-live.
+
+    When the cache is full, adding an entry evicts the least recently used
+    one. If a time-to-live is set, entries older than it are treated as
+    absent (and removed) when looked up. The cache can also be bounded by
+    the size of its values, as worked out by a sizeof function, for values
+    whose sizes vary too much for a number of entries to bound memory.
+
+    Attributes:
+        maxSize -- maximum number of entries; 0 disables the cache.
+        ttl -- seconds an entry stays valid after being added, or None for no
+               expiry.
+        maxBytes -- maximum total size of the values, or None for no limit.
+        sizeof -- function returning the size in bytes of a value; only used
+                  with maxBytes.
+        nbytes -- total size of the values, with maxBytes; 0 otherwise.
+        hits -- number of lookups that found a valid entry.
+        misses -- number of lookups that did not.
+
+    Methods:
+        get -- look up a key.
+        put -- add or replace an entry.
+        clear -- remove all entries; e.g. when the data they derive from
+                 changes.
+        filtered -- a copy of the cache with some of the entries.
+        stats -- the counters and size of the cache as a dictionary.
+    '''
+
+    def __init__(self, maxSize=1024, ttl=None, clock=time.monotonic,
+                 maxBytes=None, sizeof=None):
+        '''Create an empty cache.
+
+        Arguments:
+            maxSize -- maximum number of entries; 0 disables the cache.
+            ttl -- [OPTIONAL] seconds an entry stays valid.
+            clock -- [OPTIONAL] function returning the current time in seconds;
+                     for testing.
+            maxBytes, sizeof -- [OPTIONAL] see the class attributes. A value
+                                larger than maxBytes is not stored.
+        '''
+        self.maxSize = maxSize
+        self.ttl = ttl
+        self.clock = clock
+        self.maxBytes = maxBytes
+        self.sizeof = sizeof
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        # Key -> (time added, value, size), least recently used first.
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        '''Returns the value stored for key, or default if absent or expired.'''
+        with self.lock:
+            entry = self.entries.get(key)
+            if(entry != None and self.ttl != None and
+               self.clock() - entry[0] > self.ttl):
+                self.remove(key)
+                entry = None
+
+            if(entry == None):
+                self.misses = self.misses + 1
+                return default
+
+            self.entries.move_to_end(key)
+            self.hits = self.hits + 1
+            return entry[1]
+
+    def put(self, key, value):
+        '''Store value for key, evicting the least recently used entry if full.'''
+        if(self.maxSize <= 0):
+            return
+        size = 0
+        if(self.maxBytes != None):
+            size = self.sizeof(value)
+            if(size > self.maxBytes):
+                return
+
+        with self.lock:
+            if(key in self.entries):
+                self.remove(key)
+            self.entries[key] = (self.clock(), value, size)
+            self.nbytes = self.nbytes + size
+            while(len(self.entries) > self.maxSize or 
+                  (self.maxBytes != None and self.nbytes > self.maxBytes)):
+                self.remove(next(iter(self.entries)))
+
+    def remove(self, key):
+        '''Remove the entry of key; the lock must be held.'''
+        self.nbytes = self.nbytes - self.entries.pop(key)[2]
+
+    def clear(self):
+        '''Remove all entries; the hit and miss counters are kept.'''
+        with self.lock:
+            self.entries.clear()
+            self.nbytes = 0
+
+    def filtered(self, keep):
+        '''Returns a new cache, with the same settings and counters, of the entries whose key keep(key) is true for.
+
+        The entries keep the time they were added and their order of use.
+        '''
+        with self.lock:
+            entries = list(self.entries.items())
+        cache = copy.copy(self)
+        cache.lock = threading.Lock()
+        cache.entries = OrderedDict((key, entry) for key, entry in entries
+                                    if keep(key))
+        cache.nbytes = sum(entry[2] for entry in cache.entries.values())
+        return cache
+
+    def stats(self):
+        '''Returns a dictionary with the hits, misses and size of the cache.
+
+        With maxBytes, it also has the total size of the values ('bytes') and
+        maxBytes.
+        '''
+        with self.lock:
+            stats = {'hits':self.hits, 'misses':self.misses,
+                     'size':len(self.entries), 'maxSize':self.maxSize}
+            if(self.maxBytes != None):
+                stats['bytes'] = self.nbytes
+                stats['maxBytes'] = self.maxBytes
+            return stats
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class SuggestionCache(LRUCache):
+    '''Cache of suggestions for queries, keyed on what the search depends on.
+
+    Many users type the same prefixes, in different case and punctuation, from
+    nearby locations. The key is the query as the search sees it - the
+    uppercase, punctuation- and whitespace-stripped query string and its
+    phonetic representations (see AutoComplete.preprocess_query) - along with
+    the number of results and the caller's location snapped to a grid, so that
+    all of these share an entry. For results to only depend on the key,
+    searches must be made with the snapped location; see snap().
+
+    Attributes:
+        grid -- size of the grid cells in decimal degrees; 0 keeps the exact
+                location.
+    '''
+
+    def __init__(self, maxSize=1024, ttl=None, grid=0.1, clock=time.monotonic):
+        LRUCache.__init__(self, maxSize, ttl, clock)
+        self.grid = grid
+
+    def snap(self, degrees):
+        '''Returns degrees (latitude or longitude, or None) snapped to the grid; None if not finite.'''
+        if(degrees == None or not isfinite(degrees)):
+            return None
+        if(self.grid <= 0):
+            return degrees
+        return round(degrees/self.grid)*self.grid
+
+    def key(self, q, lat, longi, numRes):
+        '''Returns the cache key for a query.
+
+        Arguments:
+            q -- the query string as sent by the caller.
+            lat, longi -- location of the caller, or None; already snapped.
+            numRes -- the number of results asked for.
+        '''
+        queryStr, pq = AutoComplete().preprocess_query(q)
+        return (queryStr, pq, numRes, lat, longi)
@@ -1,6 +1,10 @@
+import sys
 from metaphone import doublemetaphone
 from tools.utils import strip_punctuation_spaces
 
+# Distinct phonetic representations of names, shared by all cities. 
+PHONETIC_CODES = {}
+
 class City(object):
     '''A city and pre-computed attributes to aid in queries. 
         
@@ -8,7 +12,8 @@ class City(object):
     pucntuation- and whitespace-stripped 
     versions of its name and alternative names and their associated phonetic
     representations as computed by the double metaphone algorithm. 
-    NB: Treat class as immutable.
+    NB: Treat class as immutable. Strings are interned, as the same names,
+    country codes and phonetic representations recur across many cities. 
     
     Attributes:
         ID -- unique ID for this city. Two cities are considered 
@@ -27,9 +32,15 @@ class City(object):
                      this city in its original form (with case, spaces, etc.),
                      and the value a tuple consisting of the phonetic 
                      representations of this city.
+        population -- number of inhabitants of this city; 0 if unknown. 
     '''    
     
-    def __init__(self, ID, name, altNames, latitude, longitutde, country):
+    # No per-instance __dict__; there can be hundreds of thousands of cities. 
+    __slots__ = ('ID', 'name', 'altNames', 'latitude', 'longitude', 'country',
+                 'origName', 'phonetics', 'population')
+    
+    def __init__(self, ID, name, altNames, latitude, longitutde, country,
+                 population=0):
         # Unique ID for this city. Must be hashable.
         self.ID = ID
         # UTF-8 Name, stored in all-uppercase for simplicity. 
@@ -43,27 +54,52 @@ class City(object):
         # Also store original name, as written in the file. 
         # If we decide to strip whitespace, punctuation, etc. want to be able to
         # return the actual name of city.
-        self.origName = name 
+        self.origName = sys.intern(name)
          
         self.latitude = latitude
         self.longitude = longitutde
         # ISO-3166 2-letter country code 
-        self.country = country 
+        self.country = sys.intern(country)
+        self.population = population
         
         # dic of phonetic (double metaphone) representation of city's name(s)
         # key is original name (with no preprocessing), value is phonetic name. 
         self.phonetics = {}        
         # Store metaphone representation of city's name and alt names.
-        self.phonetics[self.origName] = doublemetaphone(self.origName)
+        self.phonetics[self.origName] = self.phonetic(self.origName)
         
         for name in altNames:
-            self.phonetics[name] = doublemetaphone(name)
+            self.phonetics[sys.intern(name)] = self.phonetic(name)
+    
+    @classmethod
+    def preprocessed(cls, ID, name, altNames, latitude, longitude, country, 
+                     origName, phonetics, population=0):
+        '''Returns a City from attributes already preprocessed; e.g. read from a snapshot.
+        
+        Arguments are the attributes of the City, as documented above. 
+        '''
+        city = cls.__new__(cls)
+        city.ID = ID
+        city.name = name 
+        city.altNames = altNames 
+        city.origName = origName 
+        city.latitude = latitude
+        city.longitude = longitude 
+        city.country = country 
+        city.phonetics = phonetics 
+        city.population = population
+        return city 
     
     def preprocess(self, string):
         '''Removes whitespace and punctuation from string, convert to uppercase.'''
         s = strip_punctuation_spaces(string)    
         s = s.upper()
-        return s 
+        return sys.intern(s) 
+    
+    def phonetic(self, string):
+        '''Returns the double metaphone representations of string, interned.'''
+        codes = tuple(sys.intern(code) for code in doublemetaphone(string))
+        return PHONETIC_CODES.setdefault(codes, codes)
       
     def __str__(self, *args, **kwargs):
         return self.origName + " in " + self.country + " (ID=" + str(self.ID) + ")"
@@ -0,0 +1,517 @@
+from array import array
+import bisect
+import sys
+import numpy as np
+from tools.cache import LRUCache
+from tools.coordinates import CityCoordinates
+
+class CityIndex(object):
+    '''Inverted index from short character n-grams of city names to cities.
+
+    Built once when a data set is loaded, so that a query only needs to score
+    the cities whose (preprocessed) names share characters with the query
+    string, rather than every city in the data set. Which n-grams a name must
+    contain to be worth scoring is decided by the scoring method; see
+    ScoringMethod.required_grams().
+
+    NB: Treat as immutable; the index is only valid for the list it was built
+    over. To change the list, see updated(). 
+
+    Attributes:
+        cities -- the list of City objects the index was built over.
+        names -- dictionary in which the key is a 1- or 2-gram of a city's
+                 (preprocessed) name, and the value an array of the positions
+                 in cities, in ascending order, of the cities whose name 
+                 contains it.
+        altNames -- as names, but for the cities' alternative names.
+        phonetics -- as names, but for the phonetic representations of the
+                     cities' names (see City.phonetics), and the values are 
+                     positions in phoneticEntries.
+        phoneticEntries -- list of (position in cities, original name) tuples,
+                           one for each key of each city's phonetics; None for
+                           those of cities replaced by updated().
+        entryStarts -- array in which element i is the position in 
+                       phoneticEntries of the first entry of city i, whose 
+                       entries follow it in the order of its phonetics. 
+        coordinates -- CityCoordinates of cities, for weighing matches by 
+                       proximity to the caller. 
+        popularity -- list of the positions of cities, most populous first;
+                      ties in position order. 
+        ranks -- array in which element i is the rank of city i in popularity.
+        candidateSets -- LRUCache of the CandidateSets of the queries of 
+                         sessions, keyed on their n-grams (see 
+                         CandidateSet.key()) and bounded by their size, 
+                         shared by all sessions. 
+
+    Methods:
+        candidates -- the cities, and which of their names, that could score 
+                      above a threshold for a query. 
+        candidate_set -- the same as a CandidateSet, which can be reused 
+                         for the next query of a user.
+        name_candidates -- positions of the cities whose name or alternative
+                           names could score above a threshold for a query.
+        phonetic_candidates -- the names whose phonetic representations could
+                               score above a threshold for a query. 
+        by_popularity -- positions of cities, most populous first. 
+        updated -- a new index, over a list with some cities changed. 
+    '''
+
+    # Length of the longest n-grams stored in the index.
+    MAX_GRAM = 2
+
+    # Bytes the CandidateSets in candidateSets may take; that of a one- or 
+    # two-character query takes up to about 1 MB over the bundled data set. 
+    CANDIDATE_SET_BYTES = 32*1024*1024
+
+    def __init__(self, cities, postings=None):
+        '''Build the index over a list of City objects.
+        
+        Arguments:
+            cities -- list of City objects.
+            postings -- [OPTIONAL] tuple (names, altNames, phonetics) of the 
+                        postings of an index previously built over the same
+                        cities (e.g. read from a snapshot), to use rather than
+                        building them again. 
+        '''
+        self.cities = cities
+        self.names = {}
+        self.altNames = {}
+        self.phonetics = {}
+        self.phoneticEntries = []
+        self.entryStarts = array('I')
+        self.coordinates = CityCoordinates(cities)
+        self.candidateSets = self.candidate_set_cache()
+        if(postings != None):
+            self.names, self.altNames, self.phonetics = postings
+
+        populations = []
+        for pos, city in enumerate(cities):
+            populations.append(city.population)
+            self.entryStarts.append(len(self.phoneticEntries))
+            if(postings == None):
+                self.add_grams(self.names, pos, (city.name,))
+                self.add_grams(self.altNames, pos, city.altNames)
+            for origName, codes in city.phonetics.items():
+                if(postings == None):
+                    self.add_grams(self.phonetics, len(self.phoneticEntries), 
+                                   codes)
+                self.phoneticEntries.append((pos, origName))
+        
+        # Arrays take a fraction of the memory of lists of ints. 
+        for kind in CandidateSet.KINDS:
+            postings = getattr(self, kind)
+            for gram in postings:
+                postings[gram] = array('I', postings[gram])
+        
+        order = np.argsort(-np.array(populations, dtype=np.int64), kind='stable')
+        self.popularity = order.tolist()
+        self.ranks = np.empty(len(order), dtype=np.intp)
+        self.ranks[order] = np.arange(len(order))
+
+    @classmethod
+    def candidate_set_cache(cls):
+        '''Returns an empty LRUCache for candidateSets.'''
+        return LRUCache(sys.maxsize, maxBytes=cls.CANDIDATE_SET_BYTES, 
+                        sizeof=CandidateSet.nbytes)
+
+    @classmethod
+    def add_grams(cls, postings, pos, strings):
+        '''Add position pos to the postings of every n-gram in strings.'''
+        for gram in cls.grams(strings):
+            postings.setdefault(gram, []).append(pos)
+
+    @classmethod
+    def grams(cls, strings):
+        '''Returns the set of n-grams, up to MAX_GRAM characters, of strings.'''
+        grams = set()
+        for string in strings:
+            for n in range(1, cls.MAX_GRAM + 1):
+                for i in range(len(string) - n + 1):
+                    grams.add(string[i:i+n])
+        return grams
+
+    @staticmethod
+    def lookup(postings, grams):
+        '''Returns the set of positions containing at least one of grams.'''
+        return set().union(*(postings.get(gram, ()) for gram in grams))
+
+    def by_popularity(self, positions=None):
+        '''Returns a list of positions in cities, most populous city first.
+        
+        Arguments:
+            positions -- [OPTIONAL] sequence of positions; by default, all 
+                         of them. 
+        '''
+        if(positions == None):
+            return self.popularity
+        positions = np.array(positions, dtype=np.intp)
+        return positions[np.argsort(self.ranks[positions])].tolist()
+
+    def updated(self, cities, changes):
+        '''Returns a new index over cities, a list with some cities changed.
+
+        Only the postings, entries and coordinates of the changed positions
+        are worked out again, so the cost in Python is proportional to the 
+        number of changes; the rest is shared with this index or, where it 
+        changes, copied (postings arrays, coordinate arrays, the popularity 
+        list), which takes a few milliseconds per million cities. This index
+        is left as it was, for the searches still using it. 
+
+        Arguments:
+            cities -- the new list of City objects.
+            changes -- list of (pos, old, new) tuples, one per changed 
+                       position: old is the City at pos in the list this 
+                       index is over, or None if pos was beyond its end, and
+                       new the City at pos in cities, or None if pos is 
+                       beyond its end. Other positions hold the same cities
+                       in both lists. 
+        '''
+        index = CityIndex.__new__(CityIndex)
+        index.cities = cities
+        index.names = dict(self.names)
+        index.altNames = dict(self.altNames)
+        index.phonetics = dict(self.phonetics)
+        index.phoneticEntries = list(self.phoneticEntries)
+        index.entryStarts = array('I', self.entryStarts)
+        index.coordinates = self.coordinates.updated(cities, 
+                                                     [pos for pos, _, _ in changes])
+        index.candidateSets = self.candidate_set_cache()
+        # Postings arrays copied so far, as (kind, gram); the others are still
+        # this index's. 
+        copied = set()
+
+        def edit(kind, gram):
+            postings = getattr(index, kind)
+            if((kind, gram) not in copied):
+                postings[gram] = array('I', postings.get(gram, ()))
+                copied.add((kind, gram))
+            return postings[gram]
+
+        for pos, old, new in changes:
+            if(old is not None):
+                for kind, strings in [('names', (old.name,)), 
+                                      ('altNames', old.altNames)]:
+                    for gram in self.grams(strings):
+                        self.remove(edit(kind, gram), pos)
+                start = self.entryStarts[pos]
+                for entry, codes in enumerate(old.phonetics.values(), start):
+                    for gram in self.grams(codes):
+                        self.remove(edit('phonetics', gram), entry)
+                    index.phoneticEntries[entry] = None
+            if(new is not None):
+                for kind, strings in [('names', (new.name,)), 
+                                      ('altNames', new.altNames)]:
+                    for gram in self.grams(strings):
+                        bisect.insort(edit(kind, gram), pos)
+                start = len(index.phoneticEntries)
+                for entry, (origName, codes) in enumerate(new.phonetics.items(), 
+                                                          start):
+                    for gram in self.grams(codes):
+                        bisect.insort(edit('phonetics', gram), entry)
+                    index.phoneticEntries.append((pos, origName))
+                if(pos < len(index.entryStarts)):
+                    index.entryStarts[pos] = start
+                else:
+                    index.entryStarts.append(start)
+        del index.entryStarts[len(cities):]
+        for kind, gram in copied:
+            postings = getattr(index, kind)
+            if(len(postings[gram]) == 0):
+                del postings[gram]
+
+        # Out of the popularity order, from the last rank so that the ranks 
+        # of those still to remove stay right; then back in at their rank. 
+        index.popularity = list(self.popularity)
+        for rank in sorted((self.ranks[pos] for pos, old, _ in changes 
+                            if old is not None), reverse=True):
+            del index.popularity[rank]
+        for pos, _, new in changes:
+            if(new is not None):
+                index.popularity.insert(index.popularity_rank(pos), pos)
+        index.ranks = np.empty(len(cities), dtype=np.intp)
+        index.ranks[np.array(index.popularity, dtype=np.intp)] = np.arange(
+                                                                len(cities))
+        return index
+
+    @staticmethod
+    def remove(positions, pos):
+        '''Remove pos, if there, from an ascending array of positions.'''
+        i = bisect.bisect_left(positions, pos)
+        if(i < len(positions) and positions[i] == pos):
+            del positions[i]
+
+    def popularity_rank(self, pos):
+        '''Returns where in popularity the city at pos belongs: by descending population, then position.'''
+        key = (-self.cities[pos].population, pos)
+        lo, hi = 0, len(self.popularity)
+        while(lo < hi):
+            mid = (lo + hi)//2
+            other = self.popularity[mid]
+            if((-self.cities[other].population, other) < key):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def candidates(self, queryStr, pq, scoreMethod, phoneticPenalty, minScore, 
+                   altNamePenalty, session=None):
+        '''Returns the cities, and which of their names, that could score above minScore.
+        
+        Arguments: 
+            queryStr, pq -- the query as returned by 
+                            AutoComplete.preprocess_query().
+            session -- [OPTIONAL] dictionary kept between the successive 
+                       queries of one user. The CandidateSet of each query is
+                       kept in candidateSets, shared by all sessions, and
+                       only its key in the session; it is reused for any 
+                       query requiring the same n-grams, and the lookups of 
+                       the kinds whose n-grams did not change since the 
+                       session's previous query are reused too.
+            Other arguments are as for AutoComplete.get_query_results().
+        
+        Returns:
+            A tuple (positions, names, phonetics), where 
+                positions -- ascending list of positions in cities of the 
+                             cities that could score above minScore, or None 
+                             if every city could. 
+                names -- see name_candidates()
+                phonetics -- see phonetic_candidates()
+        '''
+        grams = self.query_grams(queryStr, pq, scoreMethod, phoneticPenalty, 
+                                 minScore, altNamePenalty)
+        if(session == None):
+            return self.collect(grams).result()
+        
+        key = CandidateSet.key(grams)
+        found = self.candidateSets.get(key)
+        if(found == None):
+            previous = None
+            if(session.get('candidates') != None):
+                previous = self.candidateSets.get(session['candidates'])
+            found = self.collect(grams, previous)
+            # Shared between threads from now on, so merged beforehand.
+            found.result()
+            self.candidateSets.put(key, found)
+        session['candidates'] = key
+        return found.result()
+    
+    def candidate_set(self, queryStr, pq, scoreMethod, phoneticPenalty, 
+                      minScore, altNamePenalty, previous=None):
+        '''Returns the CandidateSet of a query, reusing previous where possible.
+        
+        Arguments are as for candidates(); previous is a CandidateSet 
+        returned for an earlier query, or None. 
+        '''
+        return self.collect(self.query_grams(queryStr, pq, scoreMethod, 
+                                             phoneticPenalty, minScore, 
+                                             altNamePenalty), previous)
+    
+    def query_grams(self, queryStr, pq, scoreMethod, phoneticPenalty, minScore,
+                    altNamePenalty):
+        '''Returns a dictionary from each kind of name to its required_grams() for a query.'''
+        return dict((kind, self.required_grams(kind, queryStr, pq, scoreMethod, 
+                                               phoneticPenalty, minScore, 
+                                               altNamePenalty))
+                    for kind in CandidateSet.KINDS)
+    
+    def collect(self, grams, previous=None):
+        '''Returns the CandidateSet of the names containing grams, as returned by query_grams(), reusing previous where possible.'''
+        if(previous != None and previous.index is not self):
+            previous = None
+        if(previous != None and previous.grams == grams):
+            return previous
+        
+        found = CandidateSet(self)
+        for kind in CandidateSet.KINDS:
+            if(previous != None and previous.grams.get(kind) == grams[kind]):
+                entries = previous.entries[kind]
+            elif(grams[kind] != None):
+                entries = self.lookup(getattr(self, kind), grams[kind])
+            else:
+                entries = None
+            found.grams[kind] = grams[kind]
+            found.entries[kind] = entries
+        return found
+    
+    @staticmethod
+    def required_grams(kind, queryStr, pq, scoreMethod, phoneticPenalty, 
+                       minScore, altNamePenalty):
+        '''Returns the n-grams a string of a kind must contain to score above minScore.
+        
+        Arguments:
+            kind -- 'names', 'altNames' or 'phonetics'; see CandidateSet.
+            Other arguments are as for candidates().
+        
+        Returns:
+            A list of n-grams (empty if no string of the kind can score above
+            minScore), or None if any string could. 
+        '''
+        if(kind == 'names'):
+            return scoreMethod.required_grams(queryStr, minScore)
+        
+        # Penalised scores are never above 0.
+        if(kind == 'altNames'):
+            if(altNamePenalty <= 0):
+                return []
+            return scoreMethod.required_grams(queryStr, minScore/altNamePenalty)
+        
+        if(phoneticPenalty <= 0):
+            return []
+        grams = []
+        for q in pq:
+            qGrams = scoreMethod.required_grams(q, minScore/phoneticPenalty)
+            if(qGrams == None):
+                return None
+            grams.extend(qGrams)
+        return grams
+    
+    def name_candidates(self, query, scoreMethod, minScore, altNamePenalty):
+        '''Returns positions of cities whose names could score above minScore.
+
+        Arguments:
+            query -- preprocessed query string (uppercase, no punctuation or
+                     whitespace).
+            scoreMethod -- the ScoringMethod the names will be scored with.
+            minScore -- the score a name must exceed to be of interest.
+            altNamePenalty -- number the scores of alternative names are
+                              multiplied by.
+
+        Returns:
+            A set of positions in cities, or None if the scoring method cannot
+            rule out any city (in which case every city is a candidate).
+
+        Postconditions:
+            -- Any city not returned scores at most max(0, minScore) on its
+               name and all its alternative names.
+        '''
+        candidates = set()
+        for kind in ('names', 'altNames'):
+            grams = self.required_grams(kind, query, (), scoreMethod, 0, 
+                                        minScore, altNamePenalty)
+            if(grams is None):
+                return None
+            candidates.update(self.lookup(getattr(self, kind), grams))
+
+        return candidates
+
+    def phonetic_candidates(self, pq, scoreMethod, minScore, phoneticPenalty):
+        '''Returns the names whose phonetic representations could score above minScore.
+
+        Arguments:
+            pq -- the phonetic representations of the query to match; e.g. as
+                  returned by AutoComplete.preprocess_query().
+            scoreMethod -- the ScoringMethod the names will be scored with.
+            minScore -- the score a phonetic match must exceed to be of 
+                        interest.
+            phoneticPenalty -- number the scores of phonetic matches are
+                               multiplied by.
+
+        Returns:
+            A dictionary in which the key is a position in cities, and the
+            value the set of original names (keys of City.phonetics) of that
+            city that could score above minScore; or None if the scoring 
+            method cannot rule out any name. 
+
+        Postconditions:
+            -- Any phonetic representation of a name not returned scores at
+               most max(0, minScore) against every string in pq, after
+               penalty.
+        '''
+        grams = self.required_grams('phonetics', '', pq, scoreMethod, 
+                                    phoneticPenalty, minScore, 0)
+        if(grams == None):
+            return None
+        
+        return self.phonetic_names(self.lookup(self.phonetics, grams))
+    
+    def phonetic_names(self, entries):
+        '''Returns the positions in phoneticEntries grouped as by phonetic_candidates().'''
+        candidates = {}
+        for entry in entries:
+            pos, origName = self.phoneticEntries[entry]
+            candidates.setdefault(pos, set()).add(origName)
+
+        return candidates
+
+
+class CandidateSet(object):
+    '''The names of each kind that could score above a threshold for a query.
+    
+    Which names are candidates only depends on the n-grams the scoring method
+    requires of them, which seldom change as a user types a city's name 
+    (under Prefix Priority, they are the first one or two characters of the
+    query), and are the same for the many users typing the same first 
+    characters. Keeping the candidates of recent queries (see 
+    CityIndex.candidateSets) means the next query requiring the same n-grams
+    can reuse them, along with the merged candidates built from them, rather
+    than look them up again. 
+    
+    NB: Treat as immutable once returned by CityIndex.candidate_set(). 
+    
+    Attributes:
+        index -- the CityIndex the candidates were found in.
+        grams -- dictionary in which the key is a kind of name ('names', 
+                 'altNames' or 'phonetics'), and the value the n-grams a name
+                 of the kind must contain, or None if any name could score 
+                 above the threshold; see CityIndex.required_grams(). 
+        entries -- dictionary in which the key is a kind of name, and the value
+                   the set of entries (as stored in the postings of the index
+                   for that kind) containing one of its grams, or None if 
+                   grams is None. 
+    
+    Methods:
+        result -- the candidates as returned by CityIndex.candidates().
+        key -- the key of the candidates of some n-grams. 
+        nbytes -- the approximate memory taken by a CandidateSet. 
+    '''
+    
+    KINDS = ('names', 'altNames', 'phonetics')
+    
+    # Bytes taken by an int object in a set of entries, besides its slot. 
+    INT_BYTES = 32
+    
+    def __init__(self, index):
+        self.index = index 
+        self.grams = {}
+        self.entries = {}
+        self.merged = None
+    
+    def result(self):
+        '''Returns (positions, names, phonetics) as CityIndex.candidates() does.'''
+        if(self.merged != None):
+            return self.merged
+        
+        names, phonetics = None, None
+        if(self.entries['names'] != None and self.entries['altNames'] != None):
+            names = self.entries['names'].union(self.entries['altNames'])
+        if(self.entries['phonetics'] != None):
+            phonetics = self.index.phonetic_names(self.entries['phonetics'])
+        
+        if(names == None or phonetics == None):
+            self.merged = None, names, phonetics
+        else:
+            self.merged = sorted(names.union(phonetics)), names, phonetics
+        return self.merged
+    
+    @classmethod
+    def key(cls, grams):
+        '''Returns a hashable key for grams, a dictionary as CandidateSet.grams.'''
+        return tuple(None if grams[kind] == None else tuple(grams[kind]) 
+                     for kind in cls.KINDS)
+    
+    def nbytes(self):
+        '''Returns the approximate number of bytes taken by the candidates, merged or not.
+        
+        The ints in the merged candidates are those of the entries, or of 
+        the index, so they are only counted once. 
+        '''
+        containers = [entries for entries in self.entries.values() 
+                      if entries != None]
+        size = self.INT_BYTES*sum(len(entries) for entries in containers)
+        if(self.merged != None):
+            positions, names, phonetics = self.merged
+            containers.extend(part for part in (positions, names, phonetics) 
+                              if part != None)
+            if(phonetics != None):
+                containers.extend(phonetics.values())
+        return size + sum(sys.getsizeof(part) for part in containers)
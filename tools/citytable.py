@@ -0,0 +1,136 @@
+import sys
+from array import array
+from tools.city import City, PHONETIC_CODES
+
+class CityTable(object):
+    '''Columnar storage of a list of cities, behaving as a read-only list of City objects.
+
+    A City object, with its list of alternative names and dictionary of
+    phonetic representations, takes well over a kilobyte, most of it in the
+    overhead of many small Python objects. A CityTable instead stores each 
+    attribute of all the cities in one flat array: distinct strings are stored
+    once, UTF-8 encoded one after the other in a single bytes object, and 
+    referred to by their index; and the alternative names and phonetic 
+    representations of the cities are stored one after the other, with the 
+    offset of each city's first one. The cost is that indexing a CityTable 
+    builds a new City from the arrays each time, so searches are slower than
+    over a list of City objects.
+
+    NB: Treat as immutable.
+
+    Attributes:
+        text -- the distinct strings of the cities, UTF-8 encoded and 
+                concatenated. 
+        stringOffsets -- array in which element i is the offset in text of 
+                         string i, and element i+1 the offset following it.
+        ids, latitudes, longitudes, populations -- arrays of the cities' 
+                                                  attributes.
+        countries, origNames, names -- arrays of the indexes of the strings
+                                       of the cities' attributes.
+        altOffsets -- array in which element i is the offset in altNames of
+                      the first alternative name of city i, and element i+1
+                      the offset following its last one.
+        altNames -- array of the indexes of the strings of the cities'
+                    alternative names.
+        phoneticOffsets -- as altOffsets, for phoneticKeys.
+        phoneticKeys -- array of the indexes of the strings of the keys of 
+                        the cities' phonetics.
+        phoneticCodes -- array of the indexes of the strings of the phonetic
+                         representations of the names in phoneticKeys; two
+                         for each.
+
+    Methods:
+        from_cities -- build a CityTable from a list of City objects.
+        string -- the string with a given index. 
+        columns -- the names and arrays of the columns, in COLUMNS order.
+    '''
+
+    # Names and array typecodes of the columns.
+    COLUMNS = (('ids', 'q'), ('latitudes', 'd'), ('longitudes', 'd'),
+               ('countries', 'I'), ('origNames', 'I'), ('names', 'I'),
+               ('altOffsets', 'I'), ('altNames', 'I'), ('phoneticOffsets', 'I'),
+               ('phoneticKeys', 'I'), ('phoneticCodes', 'I'),
+               ('populations', 'q'))
+
+    def __init__(self, strings, *columns):
+        '''Create a table from a string table and the columns, in COLUMNS order.
+
+        Arguments:
+            strings -- list of strings; their indexes are those the columns
+                       refer to. 
+            columns -- sequences of numbers; see the class attributes.
+        '''
+        encoded = [string.encode('utf-8') for string in strings]
+        self.text = b''.join(encoded)
+        self.stringOffsets = array('I', [0])
+        for string in encoded:
+            self.stringOffsets.append(self.stringOffsets[-1] + len(string))
+        for (name, typecode), column in zip(self.COLUMNS, columns):
+            setattr(self, name, array(typecode, column))
+
+    @classmethod
+    def from_cities(cls, cities):
+        '''Returns a CityTable of a list of City objects.'''
+        strings = {}
+
+        def ref(string):
+            return strings.setdefault(string, len(strings))
+
+        columns = dict((name, []) for name, _ in cls.COLUMNS)
+        columns['altOffsets'].append(0)
+        columns['phoneticOffsets'].append(0)
+        for city in cities:
+            columns['ids'].append(city.ID)
+            columns['latitudes'].append(city.latitude)
+            columns['longitudes'].append(city.longitude)
+            columns['countries'].append(ref(city.country))
+            columns['origNames'].append(ref(city.origName))
+            columns['names'].append(ref(city.name))
+            columns['altNames'].extend(ref(name) for name in city.altNames)
+            columns['altOffsets'].append(len(columns['altNames']))
+            for key, codes in city.phonetics.items():
+                columns['phoneticKeys'].append(ref(key))
+                columns['phoneticCodes'].extend(ref(code) for code in codes)
+            columns['phoneticOffsets'].append(len(columns['phoneticKeys']))
+            columns['populations'].append(city.population)
+
+        return cls(list(strings), *(columns[name] for name, _ in cls.COLUMNS))
+
+    def string(self, i):
+        '''Returns the string with index i, interned.'''
+        offsets = self.stringOffsets
+        return sys.intern(self.text[offsets[i]:offsets[i + 1]].decode('utf-8'))
+
+    def columns(self):
+        '''Returns a list of (name, array) of the columns, in COLUMNS order.'''
+        return [(name, getattr(self, name)) for name, _ in self.COLUMNS]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, i):
+        '''Returns a new City with the attributes of city i.'''
+        if(i < 0):
+            i = i + len(self.ids)
+        if(i < 0 or i >= len(self.ids)):
+            raise IndexError('CityTable index out of range')
+
+        string = self.string
+        altNames = [string(s) for s in
+                    self.altNames[self.altOffsets[i]:self.altOffsets[i + 1]]]
+        phonetics = {}
+        codes = self.phoneticCodes
+        for k in range(self.phoneticOffsets[i], self.phoneticOffsets[i + 1]):
+            pair = (string(codes[2*k]), string(codes[2*k + 1]))
+            phonetics[string(self.phoneticKeys[k])] = PHONETIC_CODES.setdefault(
+                                                                pair, pair)
+
+        return City.preprocessed(self.ids[i], string(self.names[i]), altNames,
+                                 self.latitudes[i], self.longitudes[i],
+                                 string(self.countries[i]),
+                                 string(self.origNames[i]), phonetics,
+                                 self.populations[i])
+
+    def __iter__(self):
+        for i in range(len(self.ids)):
+            yield self[i]
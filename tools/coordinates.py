@@ -0,0 +1,99 @@
+from math import radians, cos
+import numpy as np
+from tools.utils import EARTH_RADIUS_KM, MAX_DIST_KM
+
+class CityCoordinates(object):
+    '''The coordinates of a list of cities as arrays, to weigh many cities by proximity at once.
+
+    Built once when a data set is loaded, so that a query with a location
+    computes the proximity of all the cities matching it with a few NumPy
+    operations, rather than one call to haversine() per city. The formula is
+    that of tools.utils.haversine() and AutoComplete.proximity_points();
+    results agree with them to within floating point rounding.
+
+    NB: Treat as immutable; only valid for the list it was built over. To
+    change the list, see updated().
+
+    Attributes:
+        latitudes -- float64 array of the cities' latitudes in radians, in
+                     the same order as the list of cities.
+        longitudes -- float64 array of the cities' longitudes in radians.
+        cosLatitudes -- cosines of latitudes.
+
+    Methods:
+        proximity_points -- proximity of a location to some of the cities.
+        weigh_proximity -- scores of some of the cities adjusted for how
+                           close they are to a location.
+        updated -- the coordinates of a list with some cities changed.
+    '''
+
+    def __init__(self, cities):
+        '''Build the arrays for a list of City objects.'''
+        self.latitudes = np.radians(np.array([city.latitude for city in cities],
+                                             dtype=np.float64))
+        self.longitudes = np.radians(np.array([city.longitude for city in cities],
+                                              dtype=np.float64))
+        self.cosLatitudes = np.cos(self.latitudes)
+
+    def updated(self, cities, positions):
+        '''Returns the coordinates of cities, a list differing from this one at positions only.
+
+        The arrays are copied, resized to the length of cities, and only the
+        elements at positions (those below the new length) are computed
+        again.
+        '''
+        coordinates = CityCoordinates.__new__(CityCoordinates)
+        numCities = len(cities)
+        positions = np.array([pos for pos in positions if pos < numCities],
+                             dtype=np.intp)
+        changed = [cities[pos] for pos in positions.tolist()]
+        latitudes = np.radians(np.array([city.latitude for city in changed],
+                                        dtype=np.float64))
+        longitudes = np.radians(np.array([city.longitude for city in changed],
+                                         dtype=np.float64))
+        for name, values in [('latitudes', latitudes), ('longitudes', longitudes),
+                             ('cosLatitudes', np.cos(latitudes))]:
+            column = np.resize(getattr(self, name), numCities)
+            column[positions] = values
+            setattr(coordinates, name, column)
+        return coordinates
+
+    def proximity_points(self, coord, positions):
+        '''Returns an array of the proximity points of coord to the cities at positions.
+
+        Arguments:
+            coord -- latitude and longitude as a decimal degree tuple.
+            positions -- list of positions in the list of cities.
+
+        Returns:
+            A float64 array of numbers in range [0, 1], as returned by
+            AutoComplete.proximity_points() for each city.
+        '''
+        lat1, long1 = radians(coord[0]), radians(coord[1])
+        lat = self.latitudes[positions] - lat1
+        longi = self.longitudes[positions] - long1
+        d = (np.sin(lat * 0.5) ** 2 +
+             cos(lat1) * self.cosLatitudes[positions] * np.sin(longi * 0.5) ** 2)
+        dist = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(d))
+
+        return 1.0 - (dist/MAX_DIST_KM)
+
+    def weigh_proximity(self, coord, positions, scores, proximityWeight):
+        '''Returns scores adjusted for how close the cities at positions are to coord.
+
+        Same as AutoComplete.weigh_proximity() for each city.
+
+        Arguments:
+            coord -- latitude and longitude as a decimal degree tuple.
+            positions -- list of positions in the list of cities.
+            scores -- list of the cities' scores, in the same order.
+            proximityWeight -- see AutoComplete.get_query_results().
+
+        Returns:
+            A list of floats.
+        '''
+        proxPoints = self.proximity_points(coord, positions)
+        scores = np.array(scores, dtype=np.float64)
+
+        weighed = (scores + proxPoints*scores*proximityWeight)/(1.0 + proximityWeight)
+        return weighed.tolist()
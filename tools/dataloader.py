@@ -9,6 +9,7 @@ class DataLoader(object):
     
     Methods:
         get_cities_tsv -- read tab-separated geonames file. 
+        city -- the City of a row of a geonames file. 
         
     '''
     
@@ -18,8 +19,9 @@ class DataLoader(object):
         
         The file is expected to be tab-separated, with the first row being the
         field names. The field names should contain: name, id, alt_name, lat, long,
-        and country. The field alt_name gives the alternative names of the 
-        city, comma-separated. The character encoding is UTF-8.
+        and country, and may contain population. The field alt_name gives the
+        alternative names of the city, comma-separated. The character encoding
+        is UTF-8.
         
         Arguments:
             fileName -- path to the TSV file.
@@ -42,20 +44,32 @@ class DataLoader(object):
             reader = csv.DictReader(f, delimiter='\t',
                                 quoting=csv.QUOTE_NONE)
             for row in reader: 
-                altnames = row['alt_name'].split(',')
-                ID = int(row['id'])
+                city = cls.city(row)
                 
-                if(ID in IDs):
+                if(city.ID in IDs):
                     raise NoneUniqueIDException('ID ' + row['id'] + ' duplicated')
                 
-                IDs.add(ID)
-                cities.append(City(ID, row['name'], altnames, 
-                                   float(row['lat']), float(row['long']), 
-                                   row['country']))
+                IDs.add(city.ID)
+                cities.append(city)
                 
             
         return cities 
     
+    @classmethod
+    def city(cls, row):
+        '''Returns the City of a row of a geonames file, given as a dictionary from field name to value.'''
+        return City(int(row['id']), row['name'], row['alt_name'].split(','), 
+                    float(row['lat']), float(row['long']), row['country'], 
+                    cls.population(row.get('population')))
+    
+    @staticmethod
+    def population(field):
+        '''Returns the population in a field of the file; 0 if missing or not a number.'''
+        try:
+            return max(0, int(field))
+        except (TypeError, ValueError):
+            return 0
+    
 
 class NoneUniqueIDException(Exception):
     '''Exception raised if two cities in a file have the same ID.'''
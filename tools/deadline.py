@@ -0,0 +1,35 @@
+import time
+
+class Deadline(object):
+    '''Point in time by which a search should stop and return what it has found.
+
+    A search given a deadline checks it as it goes, and stops scoring cities
+    once it has passed; its results are then the best of the cities scored so
+    far, and the deadline records that they are partial.
+
+    Attributes:
+        end -- the time of the deadline, as returned by clock.
+        clock -- function returning the current time in seconds.
+        reached -- True once expired() has found the deadline passed.
+
+    Methods:
+        expired -- whether the deadline has passed.
+    '''
+
+    def __init__(self, seconds, clock=time.monotonic):
+        '''Create a deadline seconds from now.
+
+        Arguments:
+            seconds -- time until the deadline, in seconds.
+            clock -- [OPTIONAL] function returning the current time in
+                     seconds; for testing.
+        '''
+        self.clock = clock
+        self.end = clock() + seconds
+        self.reached = False
+
+    def expired(self):
+        '''Returns True iff the deadline has passed; once it has, always True.'''
+        if(not self.reached):
+            self.reached = self.clock() >= self.end
+        return self.reached
@@ -0,0 +1,239 @@
+'''
+Daily modification and deletion files of geonames, applied to a data set
+without loading it again.
+
+Geonames publishes, every day, the records modified that day
+(modifications-YYYY-MM-DD.txt, with the columns of a geonames file but no
+header) and the IDs of the records deleted (deletes-YYYY-MM-DD.txt: id, name
+and comment). A search service applies them with SearchService.updated(); a
+geonames TSV file, e.g. the data set's own for its next load, with
+```
+python -m tools.geonamesdiff data/cities_canada-usa.tsv modifications-2026-10-17.txt deletes-2026-10-17.txt
+```
+run from the project root.
+
+Classes:
+    GeonamesDiff -- cities added, modified and deleted.
+'''
+
+import csv
+import os
+import shutil
+import sys
+import tempfile
+from tools.dataloader import DataLoader
+
+# Columns of a geonames file; modification files have no header.
+FIELDS = ('id', 'name', 'ascii', 'alt_name', 'lat', 'long', 'feat_class',
+          'feat_code', 'country', 'cc2', 'admin1', 'admin2', 'admin3',
+          'admin4', 'population', 'elevation', 'dem', 'tz', 'modified_at')
+
+class GeonamesDiff(object):
+    '''Cities added, modified and deleted since a data set was built.
+
+    Geonames covers every place of every country, but a data set only holds
+    some of them (the bundled one, the cities of Canada and the USA with a
+    population above 5000), so records are filtered as they are read: a
+    modified record which no longer belongs in the data set is a deletion.
+
+    Applying a diff to a list of cities keeps the position of every city
+    which is neither modified nor deleted but one: the last city of the list
+    is moved into the position of each deleted one, and added cities are
+    appended. Only those positions change, so whatever is built over the list
+    (see CityIndex.updated()) only needs to be worked out again for them.
+    The rows of a geonames file are moved the same way (see rows()), so that
+    the file, loaded again, has the cities in the same order, and ties
+    between equal scores, broken by position, are ranked the same.
+
+    Attributes:
+        modified -- list of the City objects added or modified, in the order
+                    of the file.
+        deleted -- set of the IDs of the cities deleted.
+
+    Methods:
+        read -- read the modification and deletion files of geonames.
+        positions -- the position of each city of a list, by ID.
+        apply -- the cities of a list with the diff applied.
+        place -- the items of a list with the diff applied.
+        rows -- the rows of a geonames file with the diff applied.
+    '''
+
+    def __init__(self, modified=(), deleted=()):
+        self.modified = list(modified)
+        self.deleted = set(deleted)
+        # The rows of the modified cities, for rows().
+        self.modifiedRows = []
+
+    @classmethod
+    def read(cls, modificationsPath=None, deletionsPath=None, countries=None,
+             minPopulation=0, featureClasses=('P',)):
+        '''Returns the diff of a modification file and a deletion file of geonames.
+
+        Arguments:
+            modificationsPath -- [OPTIONAL] path to the modification file.
+            deletionsPath -- [OPTIONAL] path to the deletion file.
+            countries -- [OPTIONAL] the country codes of the cities kept; by
+                         default, all of them.
+            minPopulation -- [OPTIONAL] the population a city must have to be
+                             kept.
+            featureClasses -- [OPTIONAL] the feature classes of the records
+                              kept ('P' for cities, villages, etc.); None for
+                              all of them.
+
+        Raises:
+            ValueError -- raised if a record does not have the FIELDS of a
+                          geonames file, or a number field is not a number.
+        '''
+        diff = cls()
+        csv.field_size_limit(sys.maxsize)
+        if(modificationsPath != None):
+            with open(modificationsPath, 'rt', encoding='utf-8') as f:
+                reader = csv.DictReader(f, fieldnames=FIELDS, delimiter='\t',
+                                        quoting=csv.QUOTE_NONE)
+                for row in reader:
+                    # Missing fields are None, extra ones under the key None.
+                    if(None in row.values() or None in row):
+                        raise ValueError('Line %d of %s does not have the %d '
+                                         'fields of a geonames file' % (
+                                         reader.line_num, modificationsPath,
+                                         len(FIELDS)))
+                    if((countries == None or row['country'] in countries) and
+                       (featureClasses == None or
+                        row['feat_class'] in featureClasses) and
+                       DataLoader.population(row['population']) >= minPopulation):
+                        diff.modified.append(DataLoader.city(row))
+                        diff.modifiedRows.append(row)
+                    else:
+                        diff.deleted.add(int(row['id']))
+        if(deletionsPath != None):
+            with open(deletionsPath, 'rt', encoding='utf-8') as f:
+                for line in f:
+                    if(len(line.strip()) > 0):
+                        diff.deleted.add(int(line.split('\t', 1)[0]))
+        return diff
+
+    @staticmethod
+    def positions(cities):
+        '''Returns a dictionary from the ID of each city of a list to its position.'''
+        return dict((city.ID, pos) for pos, city in enumerate(cities))
+
+    def apply(self, cities, positions=None):
+        '''Returns the cities of a list with the diff applied, and what changed.
+
+        A city both modified and deleted is deleted; deleting a city not in
+        the list does nothing.
+
+        Arguments:
+            cities -- list of City objects; left as it is.
+            positions -- [OPTIONAL] positions(cities), to save working it out.
+
+        Returns:
+            A tuple (cities, positions, changes): the new list of City
+            objects, positions() of it, and a list of (pos, old, new) tuples,
+            in ascending order of pos, one for each position at which the new
+            list differs from the old one: old is the City at pos in the old
+            list, or None if pos is beyond its end, and new the City at pos in
+            the new list, or None if pos is beyond its end.
+        '''
+        positions = dict(positions if positions != None
+                         else self.positions(cities))
+        cities, changes = self.place(cities, positions, self.modified,
+                                     lambda city: city.ID)
+        return cities, positions, changes
+
+    def place(self, items, positions, modified, key):
+        '''Returns the items of a list, and what changed, with the diff applied; see apply().
+
+        Arguments:
+            items -- list of items (cities or rows) in which to place modified.
+            positions -- dictionary from the ID of each item to its position;
+                         updated.
+            modified -- the items of the modified cities, in order.
+            key -- function returning the ID of an item.
+        '''
+        numItems = len(items)
+        items = list(items)
+        # Position -> the item at it in the old list, for each position changed.
+        olds = {}
+
+        def put(pos, item):
+            if(pos not in olds):
+                olds[pos] = items[pos] if pos < numItems else None
+            if(pos < len(items)):
+                items[pos] = item
+            else:
+                items.append(item)
+            positions[key(item)] = pos
+
+        for item in modified:
+            if(key(item) not in self.deleted):
+                put(positions.get(key(item), len(items)), item)
+        for ID in sorted(self.deleted):
+            pos = positions.pop(ID, None)
+            if(pos == None):
+                continue
+            last = len(items) - 1
+            if(pos != last):
+                put(pos, items[last])
+            if(last not in olds):
+                olds[last] = items[last] if last < numItems else None
+            items.pop()
+
+        changes = []
+        for pos in sorted(olds):
+            new = items[pos] if pos < len(items) else None
+            if(olds[pos] is not new):
+                changes.append((pos, olds[pos], new))
+        return items, changes
+
+    def rows(self, rows):
+        '''Returns the rows of a geonames file, as dictionaries, with the diff applied.
+
+        Rows are in the order apply() puts the cities of the file in: modified
+        rows in place of the old ones, the last row in place of each deleted
+        one, and added rows last.
+        '''
+        rows = list(rows)
+        positions = dict((int(row['id']), pos) for pos, row in enumerate(rows))
+        return self.place(rows, positions, self.modifiedRows,
+                          lambda row: int(row['id']))[0]
+
+
+def main(args):
+    '''Apply the modification file args[1] and deletion file args[2], if any, to the TSV file args[0].
+
+    The TSV file is replaced once the new one is complete. Only the cities of
+    UPDATE_COUNTRIES with a population of at least UPDATE_MIN_POPULATION
+    (see configs.py) are kept.
+    '''
+    if(len(args) not in (2, 3)):
+        print('Usage: python -m tools.geonamesdiff <cities.tsv> '
+              '<modifications> [<deletes>]')
+        return 2
+    from configs import UPDATE_COUNTRIES, UPDATE_MIN_POPULATION
+    diff = GeonamesDiff.read(args[1], args[2] if len(args) > 2 else None,
+                             UPDATE_COUNTRIES, UPDATE_MIN_POPULATION)
+    path = args[0]
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                               suffix='.tsv')
+    try:
+        with open(path, 'rt', encoding='utf-8', newline='') as f, \
+             os.fdopen(fd, 'wt', encoding='utf-8', newline='') as out:
+            reader = csv.DictReader(f, delimiter='\t', quoting=csv.QUOTE_NONE)
+            # Fields are written back as they were read, quotes and all.
+            out.write('\t'.join(reader.fieldnames) + '\n')
+            for row in diff.rows(reader):
+                out.write('\t'.join(row.get(field) or ''
+                                    for field in reader.fieldnames) + '\n')
+        shutil.copymode(path, tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+    print('%s: %d cities added or modified, %d deletions' % (
+          path, len(diff.modified), len(diff.deleted)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,93 @@
+import json
+# Implemented in C where the interpreter has the json accelerator, in Python
+# otherwise; the output is the same.
+from json.encoder import encode_basestring_ascii
+
+class JSONFragments(object):
+    '''Writes suggestions in JSON from fragments worked out once for each city.
+
+    The JSON of a suggestion is json.dumps(matchResult.dict_repr()): the
+    displayed name, the city's coordinates and the score. All but the score
+    and the alternative name (if any) only depend on the city, so they are
+    escaped and formatted once, when the data set is loaded, and writing a
+    suggestion only joins a few strings. The output is exactly that of
+    json.dumps, which clients and cached responses rely on.
+
+    Attributes:
+        fragments -- dictionary from id(city) to (city, head, tail), where
+                     head is the JSON of a suggestion up to the end of the
+                     city's original name, and tail is the rest of it up to
+                     the score. The city is kept so that the id stays its
+                     own.
+
+    Methods:
+        suggestion -- the JSON of one MatchResult.
+        dumps -- the JSON of a list of MatchResults.
+        updated -- the fragments of a list with some cities changed.
+    '''
+
+    def __init__(self, cities=None):
+        '''Work out the fragments of each city of cities, if given.
+
+        Suggestions of cities without fragments (e.g. cities built on demand
+        by a CityTable) are still written correctly, only without the head
+        start.
+        '''
+        self.fragments = {}
+        if(cities != None):
+            for city in cities:
+                self.fragments[id(city)] = (city,) + self.city_fragments(city)
+
+    def updated(self, changes):
+        '''Returns new JSONFragments with those of some cities changed.
+
+        Arguments:
+            changes -- list of (pos, old, new) tuples, as for
+                       CityIndex.updated(): the fragments of the old cities
+                       are dropped and those of the new ones worked out.
+        '''
+        fragments = JSONFragments()
+        fragments.fragments = dict(self.fragments)
+        for _, old, _ in changes:
+            if(old is not None):
+                fragments.fragments.pop(id(old), None)
+        for _, _, new in changes:
+            if(new is not None):
+                fragments.fragments[id(new)] = (new,) + self.city_fragments(new)
+        return fragments
+
+    @staticmethod
+    def city_fragments(city):
+        '''Returns (head, tail) of the JSON of city's suggestions; see the class attributes.'''
+        # Escaping a string escapes each character on its own, so strings can
+        # be escaped in pieces.
+        head = '{"name": ' + encode_basestring_ascii(city.origName)[:-1]
+        tail = (encode_basestring_ascii(', ' + city.country)[1:] +
+                ', "latitude": ' + number(city.latitude) +
+                ', "longitude": ' + number(city.longitude) + ', "score": ')
+        return head, tail
+
+    def suggestion(self, matchResult):
+        '''Returns json.dumps(matchResult.dict_repr()).'''
+        city = matchResult.city
+        entry = self.fragments.get(id(city))
+        if(entry != None and entry[0] is city):
+            head, tail = entry[1], entry[2]
+        else:
+            head, tail = self.city_fragments(city)
+        if(city.origName != matchResult.hsn):
+            head = (head + ' (a.k.a: ' +
+                    encode_basestring_ascii(matchResult.hsn)[1:-1] + ')')
+        return head + tail + number(matchResult.score) + '}'
+
+    def dumps(self, matchResults):
+        '''Returns json.dumps(matchResults, default=MatchResult.dict_repr).'''
+        return '[' + ', '.join([self.suggestion(result)
+                                for result in matchResults]) + ']'
+
+
+def number(value):
+    '''Returns json.dumps(value) for a number; quickly for finite floats.'''
+    if(type(value) is float and value - value == 0.0):
+        return float.__repr__(value)
+    return json.dumps(value)
@@ -16,7 +16,8 @@ class MatchResult(object):
         dict_repr -- Returns a dictionary representation of this. 
 
     '''
-
+    
+    __slots__ = ('city', 'score', 'hsn')
 
     def __init__(self, city, score, hsn=None):
         '''
@@ -0,0 +1,238 @@
+'''
+Latency histograms and counters of the suggestions service, exposed in the
+Prometheus text format.
+
+Classes:
+    Counter -- thread-safe count of events.
+    Histogram -- thread-safe histogram of observed values.
+    Metrics -- the counters and per-stage latency histograms of the service.
+    PassTimer -- times the scoring passes of one query.
+'''
+
+import bisect
+import itertools
+import threading
+import time
+
+class Counter(object):
+    '''Thread-safe count of events, only ever increasing.
+
+    Attributes:
+        name -- the metric's name.
+        help -- one-line description of the metric.
+        value -- the count.
+    '''
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        '''Add amount (non-negative) to the count.'''
+        with self.lock:
+            self.value = self.value + amount
+
+    def render(self):
+        '''Returns the lines of the counter in the Prometheus text format.'''
+        return ['# HELP ' + self.name + ' ' + self.help,
+                '# TYPE ' + self.name + ' counter',
+                self.name + ' ' + str(self.value)]
+
+
+class Histogram(object):
+    '''Thread-safe histogram of observed values, with cumulative buckets.
+
+    Attributes:
+        buckets -- ascending upper bounds of the buckets; a last bucket,
+                   with no upper bound, holds the rest.
+        counts -- number of values observed in each bucket (not cumulative).
+        sum -- sum of the values observed.
+        count -- number of values observed.
+    '''
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0]*(len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        '''Add value to the histogram.'''
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] = self.counts[i] + 1
+            self.sum = self.sum + value
+            self.count = self.count + 1
+
+    def render(self, name, labels=''):
+        '''Returns the sample lines of the histogram in the Prometheus text format.
+
+        Arguments:
+            name -- the metric's name.
+            labels -- labels of the samples other than le, as 'key="value",'.
+        '''
+        with self.lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        lines = []
+        cumulative = 0
+        for bound, n in zip(self.buckets + ('+Inf',), counts):
+            cumulative = cumulative + n
+            lines.append('%s_bucket{%sle="%s"} %d' % (name, labels, bound,
+                                                      cumulative))
+        labels = '{' + labels.rstrip(',') + '}' if labels else ''
+        lines.append('%s_sum%s %r' % (name, labels, total))
+        lines.append('%s_count%s %d' % (name, labels, count))
+        return lines
+
+
+class Metrics(object):
+    '''Counters and per-stage latency histograms of the suggestions service.
+
+    Stages are timed with time.perf_counter() at a few points per query, cheap
+    enough to leave on. Timing the literal, alternative name and phonetic
+    passes means timing each name scored, which is not; they are timed for
+    one query in passSample (see PassTimer), so their histograms are of a
+    sample of the queries. Shared by all threads, and by the successive
+    search services of a reloaded data set.
+
+    Attributes:
+        STAGES -- the stages timed, in the order they run:
+            request -- a whole query, as answered by SearchService.
+            normalize -- preprocessing the query string.
+            candidates -- looking up the cities that could match in the index.
+            score -- scoring the candidates, with all passes.
+            literal, alt, phonetic -- scoring primary names, alternative names
+                                      and phonetic representations (sampled).
+            proximity -- weighing matches by proximity to the caller.
+            rank -- ranking the matches.
+            serialize -- writing the suggestions in JSON.
+        stages -- dictionary from stage to its Histogram of seconds.
+        requests, cacheHits, cacheMisses, partial, candidates, results --
+            Counters of queries answered, of cached suggestions found and not
+            found, of queries cut short by their deadline, of candidate cities
+            considered (before pruning, see AutoComplete.score_city())
+            and of suggestions returned.
+        passSample -- one in passSample queries has its passes timed; 0 for
+                      none.
+
+    Methods:
+        observe -- add the duration of a stage.
+        sample_passes -- whether to time the passes of a query.
+        render -- everything in the Prometheus text format.
+    '''
+
+    STAGES = ('request', 'normalize', 'candidates', 'score', 'literal', 'alt',
+              'phonetic', 'proximity', 'rank', 'serialize')
+    # Bucket bounds in seconds; from well under a millisecond for a typical
+    # stage to seconds for whole one-letter queries over large data sets.
+    BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+               0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+    PREFIX = 'autocomplete_'
+
+    def __init__(self, passSample=100):
+        self.stages = dict((stage, Histogram(self.BUCKETS))
+                           for stage in self.STAGES)
+        prefix = self.PREFIX
+        self.requests = Counter(prefix + 'requests_total',
+                                'Queries answered.')
+        self.cacheHits = Counter(prefix + 'cache_hits_total',
+                                 'Queries answered from the cache.')
+        self.cacheMisses = Counter(prefix + 'cache_misses_total',
+                                   'Queries not found in the cache.')
+        self.partial = Counter(prefix + 'partial_total',
+                               'Queries cut short by their deadline.')
+        self.candidates = Counter(prefix + 'candidates_considered_total',
+                                  'Candidate cities considered for scoring, '
+                                  'including those whose names were pruned.')
+        self.results = Counter(prefix + 'results_returned_total',
+                               'Suggestions returned.')
+        self.passSample = passSample
+        self.sampled = itertools.count()
+
+    def observe(self, stage, seconds):
+        '''Add seconds spent in stage, one of STAGES.'''
+        self.stages[stage].observe(seconds)
+
+    def sample_passes(self):
+        '''Returns True for one call in passSample.'''
+        # next() on itertools.count is atomic under the GIL.
+        return self.passSample > 0 and next(self.sampled) % self.passSample == 0
+
+    def render(self):
+        '''Returns all metrics in the Prometheus text exposition format.'''
+        name = self.PREFIX + 'stage_seconds'
+        lines = ['# HELP ' + name + ' Seconds spent in each stage of a query.',
+                 '# TYPE ' + name + ' histogram']
+        for stage in self.STAGES:
+            lines.extend(self.stages[stage].render(name,
+                                                   'stage="' + stage + '",'))
+        for counter in [self.requests, self.cacheHits, self.cacheMisses,
+                        self.partial, self.candidates, self.results]:
+            lines.extend(counter.render())
+        return '\n'.join(lines) + '\n'
+
+
+class PassTimer(object):
+    '''Times the literal, alternative name and phonetic passes of one query.
+
+    Stands in for the scorers of the query: each name scored is timed, and
+    the time added to its pass. The primary name and the alternative names
+    are scored by the same scorer; a call is counted in the literal pass if
+    it is the first for the city being scored, set in name, and for its
+    primary name.
+
+    Attributes:
+        times -- dictionary from pass ('literal', 'alt', 'phonetic') to
+                 seconds spent in it.
+        name -- the primary name of the city being scored.
+        scorer -- stands in for the query's scorer.
+        phoneticScorers -- stand in for the query's phonetic scorers.
+
+    Methods:
+        record -- add the times to the Metrics.
+    '''
+
+    def __init__(self, scorer, phoneticScorers):
+        self.times = {'literal':0.0, 'alt':0.0, 'phonetic':0.0}
+        self.name = None
+        self.scorer = TimedScorer(scorer, self, None)
+        self.phoneticScorers = [TimedScorer(phoneticScorer, self, 'phonetic')
+                                for phoneticScorer in phoneticScorers]
+
+    def record(self, metrics):
+        for stage, seconds in self.times.items():
+            metrics.observe(stage, seconds)
+
+
+class TimedScorer(object):
+    '''QueryScorer adding the time of each call to a pass of a PassTimer.'''
+
+    def __init__(self, scorer, timer, stage):
+        self.scorer = scorer
+        self.timer = timer
+        self.stage = stage
+        self.ceiling = scorer.ceiling
+
+    def pass_of(self, text):
+        if(self.stage != None):
+            return self.stage
+        if(text is self.timer.name):
+            self.timer.name = None
+            return 'literal'
+        return 'alt'
+
+    def upper_bound(self, text):
+        start = time.perf_counter()
+        bound = self.scorer.upper_bound(text)
+        self.timer.times['literal' if self.stage == None else self.stage] += (
+            time.perf_counter() - start)
+        return bound
+
+    def score(self, text):
+        start = time.perf_counter()
+        score = self.scorer.score(text)
+        self.timer.times[self.pass_of(text)] += time.perf_counter() - start
+        return score
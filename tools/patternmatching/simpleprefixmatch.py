@@ -21,6 +21,49 @@ def get_matches(pattern, text, minLength=1):
         Preconditions: 
             -- all alphabetical characters in pattern and text are in the same case.
         '''
+        '''
+        A match always starts with the first character of pattern, so rather 
+        than comparing each character of text to pattern, text is searched 
+        for that character with str.find(), and the match extended from there.
+        As before, a match is never extended backwards, and the search resumes
+        at the character that ended the previous match; so text is read once.
+        '''
+        if(minLength < 1):
+            return scan_matches(pattern, text, minLength)
+        
+        matches = []
+        n = len(pattern)
+        m = len(text)
+        if(n == 0):
+            return matches 
+        
+        first = pattern[0]
+        j = text.find(first)
+        while(j != -1):
+            # Extend the match as far as it goes. 
+            end = j + 1
+            k = 1 
+            while(k < n and end < m and text[end] == pattern[k]):
+                end = end + 1
+                k = k + 1
+            
+            # A full match is kept even if shorter than minLength, unless it 
+            # ends the text. 
+            if(k >= minLength or (k == n and end < m)):
+                matches.append((j, k))
+            
+            # The character that ended the match may begin the next one. 
+            j = text.find(first, end)
+        
+        return matches 
+
+
+def scan_matches(pattern, text, minLength=1):
+        '''Returns get_matches(pattern, text, minLength) by comparing every character.
+        
+        Needed for minLength < 1, in which case characters not matching 
+        pattern at all are returned as matches of length 0. 
+        '''
         matches = []
         # Length of consecutive matching characters 
         matchLen = 0
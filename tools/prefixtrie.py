@@ -0,0 +1,142 @@
+import heapq
+import itertools
+
+class PrefixTrie(object):
+    '''Compressed prefix tree (radix tree) from strings to entries.
+
+    Each edge is labelled with a whole run of characters rather than a single
+    character, so a chain of nodes with one child each is stored as a single
+    edge. Every string is stored with an entry (any value; e.g. the position
+    of a city in a list) and a non-negative integer key, and each node records
+    the smallest key in its subtree. This allows the strings that begin with a
+    prefix to be visited in ascending order of key without visiting all of
+    them; see best_first().
+
+    Attributes:
+        root -- the root Node; its path is the empty string.
+        size -- the number of strings stored.
+
+    Methods:
+        insert -- store a string with an entry and key.
+        find -- the node whose subtree holds exactly the strings with a prefix.
+        best_first -- entries of a subtree in ascending order of key.
+    '''
+
+    class Node(object):
+        '''A node of a PrefixTrie.
+
+        Attributes:
+            children -- dictionary in which the key is the first character of
+                        an edge label, and the value a tuple (label, child).
+            entries -- list of (key, entry) tuples of strings ending here.
+            minKey -- smallest key of any string in this node's subtree, or
+                      None if the subtree is empty.
+        '''
+        __slots__ = ('children', 'entries', 'minKey')
+
+        def __init__(self):
+            self.children = {}
+            self.entries = []
+            self.minKey = None
+
+        def update_key(self, key):
+            if(self.minKey == None or key < self.minKey):
+                self.minKey = key
+
+    def __init__(self):
+        self.root = PrefixTrie.Node()
+        self.size = 0
+
+    def insert(self, string, entry, key=0):
+        '''Store string in the trie with the given entry and key.
+
+        Storing the same string more than once keeps every entry.
+        '''
+        node = self.root
+        node.update_key(key)
+        i = 0
+        while(i < len(string)):
+            edge = node.children.get(string[i])
+            if(edge == None):
+                # No edge shares a first character; add a leaf for the rest.
+                child = PrefixTrie.Node()
+                node.children[string[i]] = (string[i:], child)
+                node = child
+                node.update_key(key)
+                break
+
+            label, child = edge
+            # Length of the common prefix of label and the rest of string.
+            j = 1
+            while(j < len(label) and i + j < len(string) and
+                  label[j] == string[i + j]):
+                j = j + 1
+
+            if(j < len(label)):
+                # Split the edge at the first difference.
+                middle = PrefixTrie.Node()
+                middle.children[label[j]] = (label[j:], child)
+                middle.minKey = child.minKey
+                node.children[string[i]] = (label[0:j], middle)
+                child = middle
+
+            node = child
+            node.update_key(key)
+            i = i + j
+
+        node.entries.append((key, entry))
+        self.size = self.size + 1
+
+    def find(self, prefix):
+        '''Returns the node whose subtree holds the strings beginning with prefix.
+
+        Returns:
+            A tuple (node, exact), where exact is True iff the node's path is
+            prefix itself (so that the strings ending at node are equal to
+            prefix), or (None, False) if no string begins with prefix.
+        '''
+        node = self.root
+        i = 0
+        while(i < len(prefix)):
+            edge = node.children.get(prefix[i])
+            if(edge == None):
+                return None, False
+
+            label, node = edge
+            rest = prefix[i:i + len(label)]
+            if(not label.startswith(rest)):
+                return None, False
+            i = i + len(label)
+
+        return node, i == len(prefix)
+
+    def best_first(self, node, skipOwn=False):
+        '''Yields the (key, entry) tuples of node's subtree in ascending order of key.
+
+        Only as much of the subtree is visited as is needed for the tuples
+        yielded so far, so a caller can stop as soon as the keys are too large.
+
+        Arguments:
+            node -- a node of this trie; e.g. as returned by find().
+            skipOwn -- if True, the entries of strings ending at node itself
+                       are not yielded.
+        '''
+        # Heap of (key, tie-breaker, node or None, entry).
+        counter = itertools.count()
+        heap = []
+        if(node.minKey != None):
+            heap.append((node.minKey, next(counter), node, None))
+
+        while(len(heap) > 0):
+            key, _, current, entry = heapq.heappop(heap)
+            if(current == None):
+                yield key, entry
+                continue
+
+            if(current is not node or not skipOwn):
+                for key, entry in current.entries:
+                    heapq.heappush(heap, (key, next(counter), None, entry))
+
+            for _, child in current.children.values():
+                if(child.minKey != None):
+                    heapq.heappush(heap, (child.minKey, next(counter), child, None))
@@ -7,6 +7,8 @@ class Query(object):
         q -- UTF-8 query string; e.g. 'lond', 'banff'
         coord -- decimal degree coordinates, in a 2-tuple. 
     '''
+    
+    __slots__ = ('q', 'coord')
 
     def __init__(self, q, lat, longi):
         '''Create a query with the search string, and optionally latitude and longitude.
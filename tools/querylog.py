@@ -0,0 +1,82 @@
+'''
+Log of the latest queries answered, to replay real keystroke streams against
+the service (see benchmarks.replay).
+
+Classes:
+    QueryLog -- fixed-size ring buffer of the latest queries and latencies.
+'''
+
+import collections
+import json
+import time
+
+class QueryLog(object):
+    '''Fixed-size ring buffer of the latest queries answered and their latencies.
+
+    Recording a query appends one tuple to a collections.deque with a maximum
+    length, which drops the oldest entry once full: no lock, and no
+    formatting until the log is read. Appending to and copying a deque are
+    atomic under the GIL, so one log is shared by all threads, and by the
+    successive search services of a reloaded data set.
+
+    Entries are exported as newline-delimited JSON objects with the FIELDS as
+    keys, which read() reads back.
+
+    Attributes:
+        FIELDS -- the fields of an entry:
+            time -- when the query was answered, in seconds since the epoch.
+            q -- the query string.
+            latitude, longitude -- the location of the caller as given, or
+                                   None.
+            n -- the number of suggestions asked for; negative for all.
+            session -- the session token, or None.
+            ms -- milliseconds the service took to answer.
+        size -- the maximum number of entries kept; 0 for none.
+        entries -- deque of the entries, as tuples in FIELDS order, oldest
+                   first.
+
+    Methods:
+        record -- add a query to the log.
+        records -- the entries, as dictionaries.
+        ndjson -- the entries in newline-delimited JSON.
+        read -- the entries of lines of newline-delimited JSON.
+    '''
+
+    FIELDS = ('time', 'q', 'latitude', 'longitude', 'n', 'session', 'ms')
+
+    def __init__(self, size=10000):
+        self.size = size
+        self.entries = collections.deque(maxlen=size)
+
+    def record(self, q, lat, longi, numRes, token, seconds):
+        '''Add a query answered in seconds to the log; arguments as for SearchService.suggestions().'''
+        self.entries.append((time.time(), q, lat, longi, numRes, token,
+                             seconds*1000))
+
+    def records(self):
+        '''Returns a list of the entries, oldest first, as dictionaries with the FIELDS as keys.'''
+        return [dict(zip(self.FIELDS, entry)) for entry in list(self.entries)]
+
+    def ndjson(self):
+        '''Returns the entries, oldest first, as newline-delimited JSON.'''
+        return ''.join(json.dumps(record) + '\n' for record in self.records())
+
+    @staticmethod
+    def read(lines):
+        '''Yields the entries, as dictionaries, of lines of newline-delimited JSON.
+
+        Blank lines are skipped, and a line which is not a JSON object is
+        taken as a query string alone, so that a list of queries, one per
+        line, can also be read. Missing fields are None.
+        '''
+        for line in lines:
+            line = line.strip()
+            if(len(line) == 0):
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            if(not isinstance(record, dict)):
+                record = {'q':line}
+            yield dict((field, record.get(field)) for field in QueryLog.FIELDS)
@@ -0,0 +1,278 @@
+'''
+Hot reload of the data set: a new search service is built in the background
+and swapped in, while the old one keeps serving.
+
+Classes:
+    Reloader -- reloads the data set on request, on a signal or when its
+                files change.
+'''
+
+import logging
+import os
+import queue
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from tools.searchservice import SearchService
+from tools.snapshot import Snapshot, SnapshotFormatException
+
+# Project root, where the child process compiling a snapshot runs.
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Run by the child process: python -m tools.snapshot, at a lower priority.
+COMPILE = ('import os, sys\n'
+           'if(hasattr(os, "nice")):\n'
+           '    os.nice(10)\n'
+           'from tools.snapshot import main\n'
+           'sys.exit(main(sys.argv[1:]))\n')
+RELOAD = 'reload'
+STOP = 'stop'
+
+class Reloader(object):
+    '''Reloads the data set and swaps a new search service in, without downtime.
+
+    A search service is never changed once built (see SearchService), so a
+    new data set gets a new one, which install() swaps in with a single
+    assignment: requests already running keep the service they started
+    with, and later ones get the new one, with its own empty cache. The old
+    service is closed graceSeconds later.
+
+    Reloads run in a background thread, requested by reload() (e.g. from an
+    admin endpoint), by a signal (see listen()) or, every pollSeconds, by a
+    change of the modification time of the TSV file or of its snapshot that
+    has lasted one poll (so that a file still being written is not read).
+    Requests arriving during a reload are merged into one more reload.
+
+    The daily changes of geonames are applied to the service being served
+    with update(), which swaps in the service SearchService.updated()
+    returns, without reading the data set again. They last until the next
+    reload, unless applied to the TSV file too (python -m tools.geonamesdiff);
+    the reload that follows then has the same cities.
+
+    Preprocessing the data set and building its index would hold the GIL for
+    as long as it takes, slowing down the requests served meanwhile, so it is
+    done in a child process at a lower priority (python -m tools.snapshot):
+    the server itself only reads the snapshot the child writes, which is
+    several times cheaper. A snapshot of the TSV file as it is now is read
+    directly, as is the TSV file when nothing is being served yet.
+
+    Attributes:
+        path, snapshotPath, columnar -- the data set, as for
+                                        SearchService.read().
+        build -- function(cities, index) returning a new SearchService over
+                 cities; index may be None.
+        install -- function(service) serving service from then on, and
+                   returning the service it replaces, if any.
+        graceSeconds -- seconds a replaced service is kept open for the
+                        requests still using it.
+        logger -- logging.Logger reloads and their failures are logged to.
+        generation -- number of data sets loaded so far.
+        loadedAt -- time.time() of the latest load, or None.
+        error -- the exception of the latest reload if it failed, else None.
+        mtimes -- modification times of the TSV file and of its snapshot
+                  (None if missing) when the latest load started.
+        service -- the service installed by the latest load or update, or
+                   None.
+        updates -- number of diffs applied since the latest load.
+
+    Methods:
+        reload_now -- load the data set and swap the new service in.
+        update -- apply a diff to the service and swap the new one in.
+        reload -- request a reload in the background.
+        start -- start the background thread.
+        listen -- request a reload on a signal.
+        stop -- stop the background thread.
+        status -- the generation, time and error of the latest load, and
+                  the number of updates since.
+    '''
+
+    def __init__(self, path, snapshotPath, build, install, columnar=False,
+                 graceSeconds=30.0, logger=None):
+        self.path = path
+        self.snapshotPath = snapshotPath
+        self.columnar = columnar
+        self.build = build
+        self.install = install
+        self.graceSeconds = graceSeconds
+        self.logger = logger if logger != None else logging.getLogger(__name__)
+        self.generation = 0
+        self.loadedAt = None
+        self.error = None
+        self.mtimes = None
+        self.service = None
+        self.updates = 0
+        # Only one load or update at a time.
+        self.lock = threading.Lock()
+        # SimpleQueue.put() is reentrant, so safe to call from a signal handler.
+        self.requests = queue.SimpleQueue()
+        self.thread = None
+
+    def reload_now(self):
+        '''Load the data set, swap the new service in and return it.
+
+        Raises:
+            Whatever reading the data set raises; the old service is then
+            kept.
+        '''
+        with self.lock:
+            mtimes = self.file_times()
+            start = time.time()
+            try:
+                if(self.generation == 0 or self.snapshot_fresh()):
+                    cities, index = SearchService.read(self.path,
+                                                       self.snapshotPath,
+                                                       self.columnar,
+                                                       self.logger)
+                else:
+                    cities, index = self.compile()
+                service = self.build(cities, index)
+            except Exception as e:
+                self.error = e
+                raise
+            old = self.install(service)
+            self.service = service
+            self.updates = 0
+            self.mtimes = mtimes
+            self.generation = self.generation + 1
+            self.loadedAt = time.time()
+            self.error = None
+        self.logger.info('Loaded %s (generation %d) in %.2f s', self.path,
+                         self.generation, self.loadedAt - start)
+        if(old != None):
+            self.retire(old)
+        return service
+
+    def update(self, diff):
+        '''Apply a GeonamesDiff to the service, swap the updated one in and return it.
+
+        Raises:
+            RuntimeError -- raised if no data set has been loaded yet.
+        '''
+        with self.lock:
+            if(self.service == None):
+                raise RuntimeError('No data set loaded to update')
+            start = time.time()
+            service = self.service.updated(diff)
+            old = self.install(service)
+            self.service = service
+            self.updates = self.updates + 1
+        self.logger.info('Applied %d modifications and %d deletions to %s in '
+                         '%.3f s', len(diff.modified), len(diff.deleted),
+                         self.path, time.time() - start)
+        if(old != None):
+            self.retire(old)
+        return service
+
+    def compile(self):
+        '''Returns the cities and index of the TSV file, preprocessed in a child process.'''
+        fd, tmp = tempfile.mkstemp(suffix='.snapshot')
+        os.close(fd)
+        try:
+            child = subprocess.run([sys.executable, '-c', COMPILE, self.path, tmp],
+                                   cwd=ROOT_DIR, stdout=subprocess.DEVNULL,
+                                   stderr=subprocess.PIPE)
+            if(child.returncode != 0):
+                lines = child.stderr.decode('utf-8', 'replace').strip().splitlines()
+                raise RuntimeError('Compiling %s failed: %s' % (
+                                   self.path, lines[-1] if lines else
+                                   'exit status %d' % child.returncode))
+            return Snapshot.read(tmp, self.columnar)
+        finally:
+            os.remove(tmp)
+
+    def retire(self, service):
+        '''Close service once the requests using it have had graceSeconds to finish.'''
+        if(self.graceSeconds <= 0):
+            service.close()
+            return
+        timer = threading.Timer(self.graceSeconds, service.close)
+        timer.daemon = True
+        timer.start()
+
+    def file_times(self):
+        '''Returns the modification times of the TSV file and its snapshot, None if missing.'''
+        times = []
+        for path in [self.path, self.snapshotPath]:
+            try:
+                times.append(os.path.getmtime(path) if path != None else None)
+            except OSError:
+                times.append(None)
+        return tuple(times)
+
+    def snapshot_fresh(self):
+        '''Returns True iff there is a snapshot compiled from the TSV file as it is now.'''
+        pathTime, snapshotTime = self.file_times()
+        if(snapshotTime == None or pathTime == None or snapshotTime < pathTime):
+            return False
+        try:
+            return Snapshot.source(self.snapshotPath) == Snapshot.stamp(self.path)
+        except (OSError, SnapshotFormatException):
+            return False
+
+    def reload(self):
+        '''Request a reload by the background thread (see start()); returns at once.'''
+        self.requests.put(RELOAD)
+
+    def start(self, pollSeconds=None):
+        '''Start the background thread reloading the data set.
+
+        Arguments:
+            pollSeconds -- [OPTIONAL] seconds between checks of the
+                           modification times of the files; None for no
+                           checks, only reloads requested by reload().
+        '''
+        self.thread = threading.Thread(target=self.run, args=(pollSeconds,),
+                                       name='reloader', daemon=True)
+        self.thread.start()
+
+    def run(self, pollSeconds):
+        seen = self.file_times()
+        while(True):
+            try:
+                requests = [self.requests.get(timeout=pollSeconds)]
+            except queue.Empty:
+                requests = []
+            while(not self.requests.empty()):
+                requests.append(self.requests.get())
+            if(STOP in requests):
+                return
+            times = self.file_times()
+            changed = times != self.mtimes and times == seen
+            seen = times
+            if(RELOAD in requests or changed):
+                try:
+                    self.reload_now()
+                except Exception:
+                    self.logger.exception('Reloading %s failed; still serving '
+                                          'generation %d', self.path,
+                                          self.generation)
+
+    def listen(self, signum=signal.SIGHUP):
+        '''Request a reload whenever the process receives signal signum.
+
+        Returns:
+            False if the handler could not be installed, as signal handlers
+            can only be installed from the main thread; True otherwise.
+        '''
+        try:
+            signal.signal(signum, lambda signum, frame: self.reload())
+        except ValueError:
+            self.logger.warning('Not reloading on signal %d: not in the main '
+                                'thread', signum)
+            return False
+        return True
+
+    def stop(self):
+        '''Stop the background thread, once the reload in progress, if any, is done.'''
+        if(self.thread != None):
+            self.requests.put(STOP)
+            self.thread.join()
+            self.thread = None
+
+    def status(self):
+        '''Returns a dictionary of the generation, time and error of the latest load, and the updates since.'''
+        return {'generation':self.generation, 'loaded_at':self.loadedAt,
+                'error':None if self.error == None else str(self.error),
+                'updates':self.updates}
@@ -1,4 +1,4 @@
-from tools.scoringmethods.scoringmethod import ScoringMethod
+from tools.scoringmethods.scoringmethod import ScoringMethod, QueryScorer
 from tools.patternmatching import simpleprefixmatch
 from tools.utils import sigmoid
 
@@ -101,6 +101,168 @@ class PrefixPriority(ScoringMethod):
         return sigmoid(baseScore)     
     
     
+    def compile(self, query):
+        '''Returns a PrefixPriorityScorer for query.
+        
+        Overrides ScoringMethod.compile()
+        '''
+        return PrefixPriorityScorer(self, query)
+    
+    
+    def upper_bound(self, query, text=None):
+        '''Returns an upper bound of score(query, text), or of any text's score if text is None.
+        
+        Overrides ScoringMethod.upper_bound(); see 
+        PrefixPriorityScorer.upper_bound(). 
+        '''
+        if(text == None):
+            return 1.0 if len(query) > 0 else 0.0
+        return self.compile(query).upper_bound(text)
+    
+    
+    def required_grams(self, query, minScore):
+        '''Returns n-grams at least one of which text must contain to score above minScore.
+        
+        Overrides ScoringMethod.required_grams()
+        
+        A text not containing the first character of query has no match at all
+        and scores 0. A text not containing the first two characters of query 
+        has no matching run longer than one character, so at best it gets the
+        start bonus for a single character. 
+        '''
+        # Even texts that do not match at all score above minScore.
+        if(minScore < 0):
+            return None
+        
+        if(len(query) == 0):
+            return []
+        
+        if(len(query) >= 2 and 
+           sigmoid(max(self.startMatchBonus, 0) - self.baseShift) <= minScore):
+            return [query[0:2]]
+        
+        return [query[0]]
+    
+    
     def name(self):
         return 'Prefix Priority'
+
+
+class PrefixPriorityScorer(QueryScorer):
+    '''Scores texts against one query exactly as PrefixPriority.score() does.
+    
+    Rather than building the list of matches with simpleprefixmatch and then
+    going through it, the matches are found and added up in one pass, in the
+    same way and with the same arithmetic. Texts without matching runs longer
+    than one character (most of them, and all of them for one-character 
+    queries) can only get one of two scores, which are worked out up front. 
+    
+    Attributes:
+        length -- length of the query. 
+        first -- first character of the query. 
+        noRuns -- score of a text with no matching run longer than one 
+                  character, and no match at its start. 
+        startOnly -- as noRuns, but with a match at the start of the text. 
+        prefix -- first two characters of the query. 
+        bounds -- bounds[full][start] is the best score of a text other than
+                  the query, which contains the query iff full, and whose
+                  match at the start is at most start characters long. 
+    '''
+    
+    def __init__(self, method, query):
+        QueryScorer.__init__(self, method, query)
+        self.length = len(query)
+        self.first = query[0:1]
+        # See PrefixPriority.score(); with a total matching length of 0.
+        baseScore = 0.0 - method.baseShift
+        self.noRuns = sigmoid(baseScore)
+        self.startOnly = sigmoid(baseScore + method.startMatchBonus*1)
+        
+        self.prefix = query[0:2]
+        # As if the whole text matched, with the same order of operations as
+        # score(), so that rounding never takes a score above its bound. 
+        self.bounds = []
+        for bonus in [0, max(method.subStringBonus, 0)]:
+            baseScore = 1.0 - method.baseShift
+            if(bonus > 0):
+                baseScore = baseScore + bonus
+            self.bounds.append([sigmoid(baseScore + 
+                                        max(method.startMatchBonus, 0)*start)
+                                for start in range(self.length + 1)])
+    
+    def score(self, text):
+        '''Returns the same as PrefixPriority.score(query, text).'''
+        n = self.length
+        if(n == 0):
+            return 0.0
+        first = self.first
+        j = text.find(first)
+        if(j == -1):
+            return 0.0
+        if(text == self.query):
+            return 1.0
+        if(n == 1):
+            return self.startOnly if j == 0 else self.noRuns
+        
+        # The matches of simpleprefixmatch.get_matches(query, text, 1). 
+        query = self.query
+        m = len(text)
+        matchLen = 0.0
+        fullSubString = False
+        # Length of the match at the start of text, if any. 
+        startLen = 0
+        while(j != -1):
+            end = j + 1
+            k = 1 
+            while(k < n and end < m and text[end] == query[k]):
+                end = end + 1
+                k = k + 1
+            if(j == 0):
+                startLen = k
+            if(k > 1):
+                matchLen = matchLen + k
+                if(k >= n):
+                    fullSubString = True
+            j = text.find(first, end)
+        
+        if(matchLen == 0.0):
+            return self.startOnly if startLen > 0 else self.noRuns
+        
+        method = self.method
+        baseScore = matchLen/m
+        baseScore = baseScore - method.baseShift
+        if(fullSubString):
+            baseScore = baseScore + method.subStringBonus
+            if(n == m):
+                baseScore = baseScore + method.exactMatchBonus
+        if(startLen > 0):
+            baseScore = baseScore + method.startMatchBonus*startLen
+        
+        return sigmoid(baseScore)
     
+    def upper_bound(self, text):
+        '''Returns an upper bound of score(text).
+        
+        Overrides QueryScorer.upper_bound()
+        
+        Only needs a few searches of text, done in C, rather than going 
+        through its matches: texts without a matching run longer than one
+        character get their exact score, and others are scored as if all
+        of the text matched. 
+        '''
+        n = self.length
+        if(n == 0):
+            return 0.0
+        j = text.find(self.first)
+        if(j == -1):
+            return 0.0
+        if(text == self.query):
+            return 1.0
+        if(n == 1 or self.prefix not in text):
+            return self.startOnly if j == 0 else self.noRuns
+        
+        m = len(text)
+        start = 0
+        if(j == 0):
+            start = min(n, m) if text.startswith(self.prefix) else 1
+        return self.bounds[m > n and self.query in text][start]
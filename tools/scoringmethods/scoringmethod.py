@@ -10,6 +10,11 @@ class ScoringMethod(object):
     Methods:
         score -- returns a score between 0 and 1 inclusive, indicating how closely  
                  two strings match
+        required_grams -- n-grams a string must contain to score above a 
+                          threshold against a query.
+        compile -- returns a QueryScorer scoring many strings against one 
+                   query. 
+        upper_bound -- an upper bound of score(), cheaper to work out. 
     '''
 
 
@@ -28,9 +33,70 @@ class ScoringMethod(object):
         '''
         pass
     
+    def required_grams(self, query, minScore):
+        '''Returns n-grams at least one of which text must contain to score above minScore.
+        
+        Used to look up candidate strings in an n-gram index (see 
+        tools.cityindex); the n-grams returned are 1 or 2 characters long. 
+        By default no guarantee is made about which strings can score above
+        minScore, so every string is a candidate.
+        
+        Returns: 
+            A list of 1- or 2-character strings, or None if any string could 
+            score above minScore.
+        '''
+        return None
+    
+    def compile(self, query):
+        '''Returns a QueryScorer for query; its score(text) is score(query, text).
+        
+        Scoring methods that can precompute anything about a query should 
+        return a subclass of QueryScorer that does; by default, score() is 
+        simply called. 
+        '''
+        return QueryScorer(self, query)
+    
+    def upper_bound(self, query, text=None):
+        '''Returns an upper bound of score(query, text), or of any text's score if text is None.
+        
+        Searches use it to skip scoring strings whose score could not make
+        any difference. It must never be below the score, and should be
+        cheaper to work out; by default, the highest possible score.
+        '''
+        return 1.0
+    
     @abstractmethod
     def name(self):
         '''Returns name of this scoring algorithm. 
         '''
-        
+
+
+class QueryScorer(object):
+    '''Scores texts against one query; see ScoringMethod.compile(). 
+    
+    A search scores thousands of names against the same query, so anything
+    that only depends on the query is worth working out once. 
+    
+    Attributes:
+        method -- the ScoringMethod. 
+        query -- the query string. 
+        ceiling -- upper bound of the score of any text; 
+                   method.upper_bound(query). 
+    
+    Methods:
+        score -- returns method.score(query, text). 
+        upper_bound -- returns method.upper_bound(query, text). 
+    '''
+    
+    def __init__(self, method, query):
+        self.method = method 
+        self.query = query 
+        self.ceiling = method.upper_bound(query)
+    
+    def score(self, text):
+        '''Returns the same as method.score(query, text).'''
+        return self.method.score(self.query, text)
     
+    def upper_bound(self, text):
+        '''Returns the same as method.upper_bound(query, text).'''
+        return self.method.upper_bound(self.query, text)
@@ -0,0 +1,385 @@
+import logging
+import os
+from time import perf_counter
+from tools.autocomp import AutoComplete
+from tools.cache import LRUCache, SuggestionCache
+from tools.cityindex import CandidateSet, CityIndex
+from tools.citytable import CityTable
+from tools.dataloader import DataLoader
+from tools.deadline import Deadline
+from tools.geonamesdiff import GeonamesDiff
+from tools.jsonfragments import JSONFragments
+from tools.shardedengine import ShardedEngine
+from tools.snapshot import Snapshot, SnapshotFormatException
+from tools.trieengine import TrieEngine
+from tools.scoringmethods.prefixpriority import PrefixPriority
+
+class SearchService(object):
+    '''Suggestions for city names over one data set, built once and shared by all requests.
+
+    Everything a search needs that does not depend on the query - the cities,
+    the CityIndex over them, the search engine, the JSON fragments of the
+    cities, the scoring method and the parameters passed to AutoComplete - is
+    built when the service is created, rather than for each request. The
+    service also owns the cache of suggestions and the state of sessions, which
+    are only valid for its data set.
+
+    Safe to share between threads: nothing but the cache and the sessions
+    changes after the service is created, and both are thread-safe. To change
+    the data set, build a new service and swap it in; to apply the daily
+    changes of geonames to it, see updated().
+
+    Attributes:
+        cities -- list of City objects, or CityTable.
+        index -- CityIndex over cities.
+        engine -- TrieEngine or ShardedEngine searching cities, or None to
+                  scan the cities that could match (see
+                  AutoComplete.get_query_results()).
+        fragments -- JSONFragments of the cities.
+        params -- the parameters for AutoComplete.get_suggestions_json(),
+                  without a session. Treat as immutable.
+        cache -- SuggestionCache of the suggestions of queries.
+        sessions -- LRUCache from session tokens to the state kept between
+                    the queries of each session.
+        timeoutMs -- milliseconds a search may take by default, after which
+                     the best results found so far are returned; None for
+                     no limit.
+        metrics -- Metrics the queries are recorded in, or None.
+        queryLog -- QueryLog the queries are recorded in, or None.
+        positions -- GeonamesDiff.positions() of cities, worked out by the
+                     first call to updated(); None until then.
+
+    Methods:
+        load -- create a service over a data set read from a TSV file or a
+                snapshot.
+        read -- read a data set from a TSV file or a snapshot.
+        suggestions -- the JSON suggestions for a query.
+        suggestions_stream -- all JSON suggestions for a query, in chunks.
+        suggestions_batch -- the JSON suggestions for many queries.
+        session_params -- the parameters with the state of a session.
+        snap -- a coordinate snapped to the grid of the cache.
+        updated -- a new service with a GeonamesDiff applied to the cities.
+        close -- release the resources of the engine.
+    '''
+
+    ENGINES = ('scan', 'trie', 'sharded')
+
+    def __init__(self, cities, index=None, engine='scan', numShards=None,
+                 scoreMethod=None, phoneticPenalty=0.6, minScore=0.1,
+                 altNamePenalty=0.5, proximityWeight=0.1, cache=None,
+                 sessions=None, timeoutMs=None, metrics=None, queryLog=None,
+                 fragments=None):
+        '''Create a service over cities.
+
+        Arguments:
+            cities -- list of City objects, or CityTable.
+            index -- [OPTIONAL] CityIndex over cities; built if not given.
+            engine -- [OPTIONAL] 'scan', 'trie' or 'sharded'; see the
+                      SEARCH_ENGINE setting in configs.py.
+            numShards -- [OPTIONAL] number of shards of a 'sharded' engine;
+                         by default, the number of CPUs.
+            scoreMethod -- [OPTIONAL] ScoringMethod; by default PrefixPriority().
+            phoneticPenalty, minScore, altNamePenalty, proximityWeight --
+                [OPTIONAL] as for AutoComplete.get_query_results().
+            cache -- [OPTIONAL] SuggestionCache; by default, none is kept.
+            sessions -- [OPTIONAL] LRUCache for the state of sessions.
+            timeoutMs, metrics, queryLog -- [OPTIONAL] see the class
+                                            attributes.
+            fragments -- [OPTIONAL] JSONFragments of cities; worked out if
+                         not given.
+
+        Raises:
+            ValueError -- raised if engine is not one of ENGINES.
+        '''
+        if(engine not in self.ENGINES):
+            raise ValueError('Unknown search engine ' + repr(engine))
+        self.cities = cities
+        self.index = index if index != None else CityIndex(cities)
+        self.engine = None
+        if(engine == 'trie'):
+            self.engine = TrieEngine(cities, self.index)
+        elif(engine == 'sharded'):
+            self.engine = ShardedEngine(cities, numShards)
+        # A CityTable builds new City objects each time, which have no fragments.
+        if(fragments == None):
+            fragments = JSONFragments(None if isinstance(cities, CityTable)
+                                      else cities)
+        self.fragments = fragments
+        self.params = {'scoreMethod':scoreMethod if scoreMethod != None
+                                     else PrefixPriority(),
+                       'phoneticPenalty':phoneticPenalty, 'minScore':minScore,
+                       'altNamePenalty':altNamePenalty,
+                       'proximityWeight':proximityWeight, 'index':self.index,
+                       'engine':self.engine, 'fragments':self.fragments,
+                       'metrics':metrics}
+        self.cache = cache if cache != None else SuggestionCache(0, grid=0)
+        self.sessions = sessions if sessions != None else LRUCache()
+        self.timeoutMs = timeoutMs
+        self.metrics = metrics
+        self.queryLog = queryLog
+        self.positions = None
+        self.autoComplete = AutoComplete()
+
+    @classmethod
+    def load(cls, path, snapshotPath=None, columnar=False, logger=None, **kwargs):
+        '''Returns a service over the data set of a geonames TSV file.
+
+        The data set is read as by read().
+
+        Arguments:
+            path, snapshotPath, columnar, logger -- as for read().
+            kwargs -- other arguments of the constructor.
+        '''
+        cities, index = cls.read(path, snapshotPath, columnar, logger)
+        return cls(cities, index, **kwargs)
+
+    @staticmethod
+    def read(path, snapshotPath=None, columnar=False, logger=None):
+        '''Returns the cities and CityIndex (or None) of the data set of a geonames TSV file.
+
+        The data set is read from the snapshot at snapshotPath (see
+        tools.snapshot) if there is one compiled from the TSV file at path as
+        it is now, and from the TSV file otherwise; the index is then None.
+        A snapshot older than the TSV file is not even opened; one more
+        recent is still checked, as copying or restoring a file may give it
+        an older modification time than it had.
+
+        Arguments:
+            path -- path to the TSV file.
+            snapshotPath -- [OPTIONAL] path to the snapshot of the TSV file.
+            columnar -- [OPTIONAL] if True, the cities are held in a CityTable.
+            logger -- [OPTIONAL] logging.Logger to warn of unusable snapshots.
+        '''
+        cities, index = None, None
+        if(snapshotPath != None and os.path.exists(snapshotPath) and
+           os.path.getmtime(snapshotPath) >= os.path.getmtime(path)):
+            try:
+                cities, index = Snapshot.read(snapshotPath, columnar, path)
+            except SnapshotFormatException as e:
+                logger = logger if logger != None else logging.getLogger(__name__)
+                logger.warning('Ignoring snapshot %s: %s', snapshotPath, e)
+        if(cities == None):
+            cities = DataLoader.get_cities_tsv(path)
+            if(columnar):
+                cities = CityTable.from_cities(cities)
+        return cities, index
+
+    def suggestions(self, q, lat=None, longi=None, numRes=10, token=None,
+                    timeoutMs=None):
+        '''Returns the JSON suggestions for a query, from the cache if there.
+
+        Searches stop at their deadline (timeoutMs, or the service's default)
+        with the best results found so far, scoring the most populous cities
+        first (see AutoComplete.get_query_results()); such partial results
+        are not cached. Searches by a 'trie' or 'sharded' engine are never
+        partial.
+
+        The query is recorded in the query log, if any, with the location
+        as given rather than snapped, and the time taken to answer it.
+
+        Arguments:
+            q -- the query string. If None or empty, '{}' is returned.
+            lat, longi -- [OPTIONAL] location of the caller; snapped to the
+                          grid of the cache.
+            numRes -- [OPTIONAL] the number of suggestions; if negative, all
+                      of them (better streamed with suggestions_stream()).
+            token -- [OPTIONAL] session token; see session_params().
+            timeoutMs -- [OPTIONAL] milliseconds the search may take. If
+                         given, the suggestions are returned in a JSON object
+                         which also says whether they are partial.
+
+        Returns:
+            As AutoComplete.get_suggestions_json() or, if timeoutMs is given
+            or the search was cut short by either deadline,
+            '{"suggestions": <the same>, "partial": <true or false>}'.
+        '''
+        if(q == None or len(q) == 0):
+            return '{}'
+        start = perf_counter()
+        # As given, for the query log.
+        origLat, origLongi = lat, longi
+        lat, longi = self.snap(lat), self.snap(longi)
+        key = self.cache.key(q, lat, longi, numRes)
+        suggestions = self.cache.get(key)
+        partial = False
+        metrics = self.metrics
+        if(metrics != None):
+            metrics.requests.inc()
+            (metrics.cacheMisses if suggestions == None else metrics.cacheHits).inc()
+        if(suggestions == None):
+            params = self.session_params(token)
+            timeout = timeoutMs if timeoutMs != None else self.timeoutMs
+            deadline = None
+            if(timeout != None):
+                deadline = Deadline(timeout/1000.0)
+                params = dict(params, deadline=deadline)
+            suggestions = self.autoComplete.get_suggestions_json(
+                              q, lat, longi, self.cities, params, numRes)
+            partial = deadline != None and deadline.reached
+            if(not partial):
+                self.cache.put(key, suggestions)
+            elif(metrics != None):
+                metrics.partial.inc()
+        elapsed = perf_counter() - start
+        if(metrics != None):
+            metrics.observe('request', elapsed)
+        if(self.queryLog != None):
+            self.queryLog.record(q, origLat, origLongi, numRes, token, elapsed)
+        if(timeoutMs == None and not partial):
+            return suggestions
+        return ('{"suggestions": ' + suggestions + ', "partial": ' +
+                ('true' if partial else 'false') + '}')
+
+    def suggestions_stream(self, q, lat=None, longi=None, ndjson=False,
+                           token=None):
+        '''Yields all JSON suggestions for a query, a chunk at a time; not cached.
+
+        Arguments are as for suggestions(), and ndjson as for
+        AutoComplete.get_suggestions_stream(). If q is None or empty, yields
+        '{}'.
+        '''
+        if(q == None or len(q) == 0):
+            return iter(['{}'])
+        if(self.metrics != None):
+            self.metrics.requests.inc()
+        chunks = self.autoComplete.get_suggestions_stream(
+                     q, self.snap(lat), self.snap(longi), self.cities,
+                     self.session_params(token), ndjson)
+        if(self.queryLog == None):
+            return chunks
+        return self.logged_stream(chunks, q, lat, longi, token)
+
+    def logged_stream(self, chunks, q, lat, longi, token):
+        '''Yields chunks, then records the query in the query log with the time they took.'''
+        start = perf_counter()
+        for chunk in chunks:
+            yield chunk
+        self.queryLog.record(q, lat, longi, -1, token, perf_counter() - start)
+
+    def suggestions_batch(self, queries):
+        '''Yields the JSON suggestions for each of many queries; not cached.
+
+        Arguments:
+            queries -- iterable of (q, lat, longi, numRes) tuples; see
+                       suggestions().
+
+        Returns:
+            As AutoComplete.get_suggestions_batch().
+        '''
+        snapped = ((q, self.snap(lat), self.snap(longi), numRes)
+                   for q, lat, longi, numRes in queries)
+        return self.autoComplete.get_suggestions_batch(snapped, self.cities,
+                                                       self.params)
+
+    def session_params(self, token):
+        '''Returns the parameters for AutoComplete with the state of a session.
+
+        Arguments:
+            token -- token chosen by the client, the same for all the queries
+                     made as a user types; None or empty for no session.
+        '''
+        if(token == None or len(token) == 0):
+            return self.params
+        session = self.sessions.get(token)
+        if(session == None):
+            session = {}
+            self.sessions.put(token, session)
+        return dict(self.params, session=session)
+
+    def snap(self, degrees):
+        '''Returns degrees snapped to the grid of the cache; see SuggestionCache.snap().'''
+        return self.cache.snap(degrees)
+
+    def updated(self, diff):
+        '''Returns a new service over the cities of this one with a GeonamesDiff applied.
+
+        Only what depends on the cities added, modified, deleted or moved
+        (see GeonamesDiff.apply()) is worked out again: the CityIndex and the
+        JSON fragments are updated (see CityIndex.updated()), and the cached
+        suggestions the changes cannot affect are kept (see unaffected()),
+        so that the cost in Python is proportional to the size of the diff
+        rather than to the number of cities. That holds for the 'scan'
+        engine over a list of City objects; a 'trie' engine is built again,
+        a 'sharded' one started again, and a CityTable converted to City
+        objects and back, all at the cost of a full load.
+
+        The sessions, metrics and query log are shared with this service,
+        which is left as it was for the requests still using it.
+        '''
+        cities = self.cities
+        columnar = isinstance(cities, CityTable)
+        if(columnar):
+            cities = list(cities)
+        if(self.positions == None):
+            self.positions = GeonamesDiff.positions(cities)
+        cities, positions, changes = diff.apply(cities, self.positions)
+        fragments = None
+        if(columnar):
+            cities = CityTable.from_cities(cities)
+        else:
+            fragments = self.fragments.updated(changes)
+
+        engine, numShards = 'scan', None
+        if(isinstance(self.engine, TrieEngine)):
+            engine = 'trie'
+        elif(isinstance(self.engine, ShardedEngine)):
+            engine, numShards = 'sharded', len(self.engine.bounds)
+        params = self.params
+        service = SearchService(cities, self.index.updated(cities, changes),
+                                engine, numShards, params['scoreMethod'],
+                                params['phoneticPenalty'], params['minScore'],
+                                params['altNamePenalty'],
+                                params['proximityWeight'],
+                                self.cache.filtered(self.unaffected(changes)),
+                                self.sessions, self.timeoutMs, self.metrics,
+                                self.queryLog, fragments)
+        service.positions = positions
+        return service
+
+    def unaffected(self, changes):
+        '''Returns a function telling whether the cached suggestions of a key are unaffected by changes.
+
+        The suggestions for a query only depend on the cities which could
+        score above minScore for it, and their positions (which order
+        ties); a city can only do so if one of its names of some kind
+        contains one of the n-grams the scoring method requires of that kind
+        (see CityIndex.required_grams()). Suggestions are unaffected if, for
+        every kind, none of the n-grams required is in a name of a changed
+        city, before or after the change.
+
+        Arguments:
+            changes -- list of (pos, old, new) tuples; see CityIndex.updated().
+        '''
+        changed = dict((kind, set()) for kind in CandidateSet.KINDS)
+        for _, old, new in changes:
+            for city in (old, new):
+                if(city is not None):
+                    changed['names'].update(CityIndex.grams((city.name,)))
+                    changed['altNames'].update(CityIndex.grams(city.altNames))
+                    for codes in city.phonetics.values():
+                        changed['phonetics'].update(CityIndex.grams(codes))
+        params = self.params
+        # Keys differing by number of results or location share the grams.
+        verdicts = {}
+
+        def unaffected(key):
+            queryStr, pq = key[0], key[1]
+            if((queryStr, pq) not in verdicts):
+                verdict = True
+                for kind in CandidateSet.KINDS:
+                    grams = CityIndex.required_grams(kind, queryStr, pq,
+                                                     params['scoreMethod'],
+                                                     params['phoneticPenalty'],
+                                                     params['minScore'],
+                                                     params['altNamePenalty'])
+                    if(grams == None or not changed[kind].isdisjoint(grams)):
+                        verdict = False
+                        break
+                verdicts[(queryStr, pq)] = verdict
+            return verdicts[(queryStr, pq)]
+        return unaffected
+
+    def close(self):
+        '''Stop the worker processes of a sharded engine, if any.'''
+        if(isinstance(self.engine, ShardedEngine)):
+            self.engine.close()
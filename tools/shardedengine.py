@@ -0,0 +1,215 @@
+import heapq
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from tools.autocomp import AutoComplete
+from tools.cityindex import CityIndex
+
+# The shard of the worker process this module is loaded in, as (cities, index);
+# set by load_shard().
+_shard = None
+
+def load_shard(cities, start, end):
+    '''Initialise a worker process with cities[start:end] and a CityIndex over them.'''
+    global _shard
+    shard = [cities[pos] for pos in range(start, end)]
+    _shard = (shard, CityIndex(shard))
+
+def search_shard(query, scoreMethod, phoneticPenalty, minScore, altNamePenalty,
+                 proximityWeight, numRes, session=None):
+    '''Returns AutoComplete.get_query_results() over the shard of this worker process.'''
+    cities, index = _shard
+    return AutoComplete().get_query_results(query, cities, scoreMethod,
+                                            phoneticPenalty, minScore,
+                                            altNamePenalty, proximityWeight,
+                                            index, numRes, session)
+
+def search_shard_batch(queries, scoreMethod, phoneticPenalty, minScore,
+                       altNamePenalty, proximityWeight):
+    '''Returns the results of search_shard() for each (query, numRes) of queries.
+
+    The queries share a session, so those requiring the same n-grams share
+    the cities that could match them; see CityIndex.candidates().
+    '''
+    session = {}
+    return [search_shard(query, scoreMethod, phoneticPenalty, minScore,
+                         altNamePenalty, proximityWeight, numRes, session)
+            for query, numRes in queries]
+
+
+class ShardedEngine(object):
+    '''Search engine spreading each query over shards held by worker processes.
+
+    The cities are split into contiguous shards, and each shard is searched by
+    its own long-lived worker process, with its own CityIndex, so that one
+    query runs on as many cores as there are shards. Each worker returns the
+    top numRes results of its shard, and these are merged into the overall
+    top numRes.
+
+    Results are ranked by descending score, with ties broken by position in
+    the data set. Shards are contiguous and in order, so a stable merge of the
+    shards' ranked lists by score, in shard order, ranks ties exactly as the
+    single-process search does; the results are the same as those of
+    AutoComplete.get_query_results().
+
+    Worker processes are started by a fork server where the platform has
+    one, and spawned otherwise, but never forked from the server itself: it
+    has other threads by then (request threads, the reloader, which also
+    builds the engines of reloaded data sets), and a forked child could
+    inherit a lock one of them holds, e.g. that of logging, and deadlock.
+    Each worker receives a pickled copy of its own shard only, and builds its
+    index. As with any start method but fork, the worker processes import
+    the main module again, under the name '__mp_main__'; a script creating
+    an engine must not start serving when imported so (see main.py).
+
+    Sessions are not used: the candidates of a session's previous query are
+    in the worker processes, which do not know about sessions.
+
+    A worker process which dies (e.g. killed for want of memory) breaks its
+    executor for good; the executor is then replaced by a new one, loading
+    the shard again, and the work it was given is given to the new one,
+    once. 
+
+    Attributes:
+        cities -- the cities the shards are taken from. 
+        bounds -- list of (start, end) of the shards' positions in cities.
+        executors -- one single-process ProcessPoolExecutor per shard.
+
+    Methods:
+        get_query_results -- as AutoComplete.get_query_results().
+        get_query_results_batch -- get_query_results() of many queries, with
+                                   one round trip to each worker process.
+        run -- a function called in each worker process, with the same
+               arguments.
+        close -- stop the worker processes.
+    '''
+
+    def __init__(self, cities, numShards=None):
+        '''Split cities into shards and start a worker process for each.
+
+        Arguments:
+            cities -- list of City objects, or CityTable.
+            numShards -- [OPTIONAL] number of shards; by default, the number
+                         of CPUs. Never more than the number of cities.
+        '''
+        if(numShards == None):
+            numShards = os.cpu_count() or 1
+        numShards = max(1, min(numShards, len(cities)))
+        size = max(1, -(-len(cities)//numShards))
+        self.cities = cities
+        self.bounds = [(start, min(start + size, len(cities)))
+                       for start in range(0, len(cities), size)]
+        # Held while a broken executor is replaced. 
+        self.lock = threading.Lock()
+        self.executors = [self.executor(shard) for shard in range(len(self.bounds))]
+        # Workers are only started when given work; have them load their
+        # shards now, all at once, rather than on the first query. 
+        self.run(int)
+
+    @staticmethod
+    def context():
+        '''Returns the multiprocessing context the worker processes are started with.'''
+        if('forkserver' not in multiprocessing.get_all_start_methods()):
+            return multiprocessing.get_context('spawn')
+        context = multiprocessing.get_context('forkserver')
+        # The fork server is started once, without other threads, and
+        # imports what the workers need, rather than the main module.
+        context.set_forkserver_preload(['tools.shardedengine'])
+        return context
+
+    def executor(self, shard):
+        '''Returns a new executor with a worker process for the shard of index shard.'''
+        start, end = self.bounds[shard]
+        # The arguments are pickled, so only send the shard.
+        initargs = ([self.cities[pos] for pos in range(start, end)], 0, end - start)
+        return ProcessPoolExecutor(1, self.context(), load_shard, initargs)
+
+    def run(self, function, *args):
+        '''Returns the list of function(*args) called in each worker process, in shard order.
+
+        A worker process which died is replaced, and the new one called
+        instead; if it dies too, BrokenProcessPool is raised.
+        '''
+        futures = []
+        for executor in list(self.executors):
+            try:
+                futures.append((executor, executor.submit(function, *args)))
+            except BrokenProcessPool:
+                futures.append((executor, None))
+        results = []
+        for shard, (executor, future) in enumerate(futures):
+            try:
+                if(future == None):
+                    raise BrokenProcessPool()
+                results.append(future.result())
+            except BrokenProcessPool:
+                executor = self.replace(shard, executor)
+                results.append(executor.submit(function, *args).result())
+        return results
+
+    def replace(self, shard, broken):
+        '''Replaces the broken executor of a shard, unless another thread did; returns the new one.'''
+        with self.lock:
+            if(self.executors[shard] is broken):
+                broken.shutdown(wait=False)
+                self.executors[shard] = self.executor(shard)
+            return self.executors[shard]
+
+    def get_query_results(self, query, scoreMethod, phoneticPenalty=0.2,
+                          minScore=0.15, altNamePenalty=0.5, proximityWeight=0.1,
+                          numRes=-1, session=None):
+        '''Get the numRes best cities matching the query with a score > minScore.
+
+        Arguments:
+            query -- Query object with user's query string, and optionally
+                     latitude, and longitude.
+            numRes -- the number of results to return; if negative, all
+                      results are returned.
+            session -- ignored; see the class documentation.
+            Other arguments are as for AutoComplete.get_query_results().
+
+        Returns:
+            A list of at most numRes MatchResults, identical to the first
+            numRes results of AutoComplete.get_query_results().
+        '''
+        return self.merge(self.run(search_shard, query, scoreMethod,
+                                   phoneticPenalty, minScore, altNamePenalty,
+                                   proximityWeight, numRes), numRes)
+
+    def get_query_results_batch(self, queries, scoreMethod, phoneticPenalty=0.2,
+                                minScore=0.15, altNamePenalty=0.5,
+                                proximityWeight=0.1):
+        '''Returns the results of get_query_results() for each of many queries.
+
+        Each worker process searches its shard for all the queries in one go,
+        so the cost of sending work to the workers and results back is paid
+        once for all the queries rather than for each.
+
+        Arguments:
+            queries -- list of (query, numRes) tuples; see get_query_results().
+            Other arguments are as for get_query_results().
+
+        Returns:
+            A list of lists of MatchResults, in the same order as queries.
+        '''
+        shards = self.run(search_shard_batch, queries, scoreMethod,
+                          phoneticPenalty, minScore, altNamePenalty,
+                          proximityWeight)
+        return [self.merge([shard[i] for shard in shards], numRes)
+                for i, (_, numRes) in enumerate(queries)]
+
+    @staticmethod
+    def merge(shards, numRes):
+        '''Returns the best numRes of the results of all shards, given those of each.'''
+        # heapq.merge is stable: ties are taken from earlier shards first.
+        merged = heapq.merge(*shards, key=lambda result: -result.score)
+        if(numRes < 0):
+            return list(merged)
+        return [result for _, result in zip(range(numRes), merged)]
+
+    def close(self):
+        '''Stop the worker processes; the engine cannot be used afterwards.'''
+        for executor in self.executors:
+            executor.shutdown()
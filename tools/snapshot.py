@@ -0,0 +1,280 @@
+'''
+Binary snapshots of a preprocessed data set, so that workers can start without
+preprocessing it again.
+
+Loading a geonames TSV file strips and uppercases every name and computes
+its double metaphone representations (see City), and CityIndex then builds
+its postings; all of that in Python, before the first request can be served.
+A snapshot stores the result once and for all: reading one only decodes a
+string table and a few arrays.
+
+Compile a snapshot from the project root with
+```
+python -m tools.snapshot data/cities_canada-usa.tsv data/cities_canada-usa.snapshot
+```
+
+Format (all numbers little-endian): a header of MAGIC, VERSION (uint32), the
+number of sections (uint32), and the size (uint64) and modification time in
+nanoseconds (int64) of the TSV file compiled, or 0 and -1 if not known,
+followed by the sections in a fixed order.
+Each section is a one-byte type code ('s' for text, otherwise a NumPy dtype
+character), the number of items (uint64), and the items, padded to a
+multiple of 8 bytes. The first section is the string table: every distinct
+string, UTF-8 encoded and joined by NUL characters. Strings are stored
+elsewhere as their uint32 index in the table. The cities are stored as the
+columns of a CityTable; see Snapshot.write() for the sections.
+'''
+
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import numpy as np
+from tools.citytable import CityTable
+from tools.cityindex import CandidateSet, CityIndex
+from tools.dataloader import DataLoader
+
+class Snapshot(object):
+    '''Methods for writing and reading binary snapshots of a data set.
+
+    Attributes:
+        MAGIC -- the bytes a snapshot file begins with.
+        VERSION -- version of the format. Bump it whenever the format, or
+                   anything stored in it (how names are preprocessed,
+                   CityIndex.MAX_GRAM, ...), changes, so that old snapshots
+                   are rejected rather than silently used.
+
+    Methods:
+        write -- write the cities and index of a data set to a file.
+        read -- read the cities and index of a data set from a file.
+        source -- the size and modification time of the TSV file compiled
+                  into a snapshot file.
+        stamp -- the size and modification time of a TSV file.
+    '''
+
+    MAGIC = b'CITYSNAP'
+    VERSION = 3
+    HEADER = struct.Struct('<8sIIQq')
+    # Source of a snapshot written without the path of its TSV file.
+    UNKNOWN = (0, -1)
+    SECTION = struct.Struct('<cQ')
+    SEPARATOR = '\x00'
+
+    @classmethod
+    def write(cls, path, cities, index, sourcePath=None):
+        '''Write cities and the CityIndex built over them to a snapshot file.
+
+        The cities are stored as the columns of a CityTable, and then the
+        grams, offsets and positions of each kind of postings of the index.
+
+        The snapshot is written to a temporary file next to path, which then
+        replaces it, so that a reader never sees a snapshot half written.
+
+        Arguments:
+            path -- path to the snapshot file.
+            cities -- list of City objects, or CityTable.
+            index -- CityIndex over cities.
+            sourcePath -- [OPTIONAL] path to the TSV file cities were read
+                          from, whose stamp() is stored so that read() can
+                          tell whether the snapshot is still that of the file.
+
+        Preconditions:
+            -- no string in cities contains SEPARATOR
+        '''
+        # The phonetic entries of an updated index are no longer in the order
+        # of the cities, which read() assumes.
+        if(None in index.phoneticEntries):
+            index = CityIndex(cities)
+        table = cities
+        if(not isinstance(cities, CityTable)):
+            table = CityTable.from_cities(cities)
+        strings = dict((table.string(i), i) 
+                       for i in range(len(table.stringOffsets) - 1))
+
+        def ref(string):
+            return strings.setdefault(string, len(strings))
+
+        sections = [(typecode, getattr(table, name)) 
+                    for name, typecode in CityTable.COLUMNS]
+        # Postings of the index; the grams, and the positions of each.
+        for kind in CandidateSet.KINDS:
+            postings = getattr(index, kind)
+            grams = list(postings)
+            offsets = [0]
+            positions = []
+            for gram in grams:
+                positions.extend(postings[gram])
+                offsets.append(len(positions))
+            sections.extend([('I', [ref(gram) for gram in grams]),
+                             ('I', offsets), ('I', positions)])
+
+        text = cls.SEPARATOR.join(strings).encode('utf-8')
+        source = cls.stamp(sourcePath) if sourcePath != None else cls.UNKNOWN
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                                   suffix='.snapshot')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(cls.HEADER.pack(cls.MAGIC, cls.VERSION, 
+                                        len(sections) + 1, *source))
+                cls.write_section(f, b's', len(text), text)
+                for code, items in sections:
+                    data = np.array(items, dtype='<' + code).tobytes()
+                    cls.write_section(f, code.encode('ascii'), len(items), data)
+            if(os.path.exists(path)):
+                shutil.copymode(path, tmp)
+            else:
+                os.chmod(tmp, 0o644)
+            os.replace(tmp, path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+    @classmethod
+    def write_section(cls, f, code, count, data):
+        f.write(cls.SECTION.pack(code, count))
+        f.write(data)
+        f.write(b'\x00'*(-len(data) % 8))
+
+    @classmethod
+    def read(cls, path, columnar=False, sourcePath=None):
+        '''Returns (cities, index) as stored in a snapshot file.
+        
+        Arguments:
+            path -- path to the snapshot file.
+            columnar -- if True, cities is a CityTable, which takes much less
+                        memory than a list of City objects but is slower to 
+                        search; otherwise, a list of City objects.
+            sourcePath -- [OPTIONAL] path to the TSV file the snapshot must
+                          have been compiled from, as it is now. 
+
+        Raises:
+            SnapshotFormatException -- raised if the file is not a snapshot,
+                                       or one of another version, or is 
+                                       truncated or corrupt.
+            StaleSnapshotException -- raised if sourcePath is given, and the
+                                      size or modification time of the file
+                                      differ from those the snapshot was
+                                      compiled from.
+        '''
+        with open(path, 'rb') as f:
+            if(os.fstat(f.fileno()).st_size == 0):
+                raise SnapshotFormatException('Not a snapshot')
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                count, source = cls.read_header(data)
+                if(sourcePath != None and source != cls.stamp(sourcePath)):
+                    raise StaleSnapshotException('Not compiled from ' + 
+                                                 sourcePath + ' as it is now')
+                sections = cls.read_sections(data, count)
+
+        numColumns = len(CityTable.COLUMNS)
+        if(len(sections) != numColumns + 1 + 3*len(CandidateSet.KINDS)):
+            raise SnapshotFormatException(str(len(sections)) + ' sections')
+        strings = sections[0]
+        cities = CityTable(*sections[0:numColumns + 1])
+        if(not columnar):
+            cities = list(cities)
+
+        postings = []
+        for k in range(len(CandidateSet.KINDS)):
+            grams, offsets, positions = sections[numColumns + 1 + 3*k:
+                                                 numColumns + 4 + 3*k]
+            postings.append(dict((strings[gram],
+                                  positions[offsets[j]:offsets[j + 1]])
+                                 for j, gram in enumerate(grams)))
+
+        return cities, CityIndex(cities, postings)
+
+    @classmethod
+    def source(cls, path):
+        '''Returns the stamp() of the TSV file a snapshot file was compiled from, or UNKNOWN.
+
+        Raises:
+            SnapshotFormatException -- as for read().
+        '''
+        with open(path, 'rb') as f:
+            return cls.read_header(f.read(cls.HEADER.size))[1]
+
+    @staticmethod
+    def stamp(path):
+        '''Returns (size, modification time in nanoseconds) of a file.'''
+        stat = os.stat(path)
+        return (stat.st_size, stat.st_mtime_ns)
+
+    @classmethod
+    def read_header(cls, data):
+        '''Returns the number of sections of a snapshot and the stamp() of its TSV file.'''
+        # Snapshots of version 1 and 2 had a shorter header. 
+        if(len(data) < 16 or data[0:8] != cls.MAGIC):
+            raise SnapshotFormatException('Not a snapshot')
+        version = struct.unpack_from('<I', data, 8)[0]
+        if(version != cls.VERSION):
+            raise SnapshotFormatException('Snapshot version ' + str(version) +
+                                          ', expected ' + str(cls.VERSION))
+        if(len(data) < cls.HEADER.size):
+            raise SnapshotFormatException('Not a snapshot')
+        _, _, count, size, mtime = cls.HEADER.unpack_from(data, 0)
+        return count, (size, mtime)
+
+    @classmethod
+    def read_sections(cls, data, count):
+        '''Returns the count sections of a snapshot, as a list of strings or of numbers.
+
+        Raises:
+            SnapshotFormatException -- raised if the sections do not take 
+                                       exactly the rest of data, or cannot 
+                                       be decoded.
+        '''
+        sections = []
+        offset = cls.HEADER.size
+        try:
+            for _ in range(count):
+                code, length = cls.SECTION.unpack_from(data, offset)
+                offset = offset + cls.SECTION.size
+                if(code != b's'):
+                    dtype = np.dtype('<' + code.decode('ascii'))
+                    length = length*dtype.itemsize
+                if(offset + length > len(data)):
+                    raise SnapshotFormatException('Truncated snapshot')
+                if(code == b's'):
+                    text = data[offset:offset + length].decode('utf-8')
+                    sections.append(text.split(cls.SEPARATOR))
+                else:
+                    # As Python numbers, which are faster to use one by one. 
+                    sections.append(np.frombuffer(data, dtype, 
+                                                  length//dtype.itemsize, 
+                                                  offset).tolist())
+                offset = offset + length + (-length % 8)
+        except (struct.error, UnicodeDecodeError, TypeError) as e:
+            raise SnapshotFormatException('Corrupt snapshot: ' + str(e))
+        if(offset != len(data)):
+            raise SnapshotFormatException(str(len(data) - offset) + 
+                                          ' bytes after the last section')
+
+        return sections
+
+
+class SnapshotFormatException(Exception):
+    '''Exception raised if a file is not a snapshot of the expected version.'''
+    pass
+
+
+class StaleSnapshotException(SnapshotFormatException):
+    '''Exception raised if a snapshot was not compiled from a TSV file as it is now.'''
+    pass
+
+
+def main(args):
+    '''Compile the TSV file args[0] into the snapshot file args[1].'''
+    if(len(args) != 2):
+        print('Usage: python -m tools.snapshot <cities.tsv> <cities.snapshot>')
+        return 2
+
+    cities = DataLoader.get_cities_tsv(args[0])
+    Snapshot.write(args[1], cities, CityIndex(cities), args[0])
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
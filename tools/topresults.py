@@ -0,0 +1,65 @@
+import heapq
+from tools.matchresult import MatchResult
+
+class TopResults(object):
+    '''The n best-scoring results seen so far, above a minimum score.
+
+    Results are ranked by descending score, with ties broken by ascending
+    position of the city in the data set; i.e., exactly as a stable sort by
+    descending score of the cities in data set order would rank them. This
+    means results may be added in any order.
+
+    Attributes:
+        n -- the number of results to keep; if negative, all results are kept.
+        minScore -- results must score strictly above this to be kept.
+
+    Methods:
+        could_enter -- whether a result scoring at most some bound could be kept.
+        count_above -- the number of results kept scoring above some bound.
+        add -- offer a result.
+        results -- the kept results as a ranked list of MatchResults.
+    '''
+
+    def __init__(self, n, minScore):
+        self.n = n
+        self.minScore = minScore
+        # Min-heap of (score, -position, city, hsn); the root is the worst
+        # result kept.
+        self.heap = []
+        # (score, -position) of the worst result kept once n are kept, which
+        # any new result must beat; None until then.
+        self.floor = None
+
+    def full(self):
+        '''True iff n results are kept and a new one must displace one of them.'''
+        return self.n >= 0 and len(self.heap) >= self.n
+
+    def could_enter(self, bound):
+        '''Returns False if no result with score at most bound can be kept.'''
+        if(bound <= self.minScore or self.n == 0):
+            return False
+
+        # A result tying with the worst kept one may still rank above it.
+        return self.floor == None or bound >= self.floor[0]
+
+    def count_above(self, bound):
+        '''Returns the number of results kept with a score strictly above bound.'''
+        return sum(1 for item in self.heap if item[0] > bound)
+
+    def add(self, score, pos, city, hsn):
+        '''Offer the result for the city at position pos of the data set.'''
+        if(score <= self.minScore or self.n == 0):
+            return
+
+        if(self.floor == None):
+            heapq.heappush(self.heap, (score, -pos, city, hsn))
+            if(len(self.heap) == self.n):
+                self.floor = self.heap[0][0:2]
+        elif((score, -pos) > self.floor):
+            heapq.heapreplace(self.heap, (score, -pos, city, hsn))
+            self.floor = self.heap[0][0:2]
+
+    def results(self):
+        '''Returns the kept results as MatchResults, best first.'''
+        ranked = sorted(self.heap, key=lambda item: item[0:2], reverse=True)
+        return [MatchResult(city, score, hsn) for score, _, city, hsn in ranked]
@@ -0,0 +1,311 @@
+import bisect
+import heapq
+from tools.autocomp import AutoComplete
+from tools.cityindex import CityIndex
+from tools.prefixtrie import PrefixTrie
+from tools.topresults import TopResults
+from tools.scoringmethods.prefixpriority import PrefixPriority
+from tools.utils import sigmoid
+
+class TrieEngine(object):
+    '''Search engine answering top-n queries from prefix tries of city names.
+
+    An alternative to the exhaustive scan of AutoComplete.get_query_results()
+    for the common case of a user typing the beginning of a city's name. The
+    preprocessed names, alternative names and phonetic representations of the
+    cities are stored in compressed prefix tries (tools.prefixtrie). For a
+    query, the names beginning with the query are visited best-first, then the
+    names containing it elsewhere, and the search stops as soon as no city that
+    has not been scored yet can make the top n. If that cannot be shown, the
+    query is handed to the exhaustive scan, so the results are always the same
+    as those of AutoComplete.get_query_results().
+
+    That happens whenever the n-th best score is below the best score of a
+    name not containing the query (rest_bound(); about 0.55 for 7 characters,
+    0.40 for 4): not only for misspellings, but for most full names and
+    multi-word prefixes at n=10 ('toronto', 'new y', 'san fr'), which few
+    names begin with or contain. Where it is clear after the names beginning
+    with the query, because too few other names contain it to fill the top
+    n, the query is handed over at once; so that such queries take about as
+    long as with the scan, rather than longer. 
+
+    Under Prefix Priority, a name beginning with the query scores higher the
+    shorter it is (unless the query's first two characters recur later in the
+    name), so each name is stored in the tries with its length as key, and
+    each node of a trie knows the shortest name in its subtree; i.e., the best
+    possible score of its subtree.
+
+    Only Prefix Priority is supported; for other scoring methods, for negative
+    n and for negative proximity weights, the exhaustive scan is used.
+
+    Attributes:
+        cities -- the list of City objects searched.
+        index -- CityIndex over cities, used when the exhaustive scan is needed.
+        names, altNames, phonetics -- PrefixTries of the cities' preprocessed
+                                      names, alternative names and phonetic
+                                      representations; the entries are
+                                      positions in cities.
+        nameText, altNameText, phoneticText -- SubstringIndex of the same.
+    '''
+
+    def __init__(self, cities, index=None):
+        '''Build the tries over a list of City objects.
+
+        Arguments:
+            cities -- list of City objects.
+            index -- [OPTIONAL] CityIndex built over cities; built if None.
+        '''
+        self.cities = cities
+        self.index = index if index != None else CityIndex(cities)
+        self.names = PrefixTrie()
+        self.altNames = PrefixTrie()
+        self.phonetics = PrefixTrie()
+        self.nameText = SubstringIndex()
+        self.altNameText = SubstringIndex()
+        self.phoneticText = SubstringIndex()
+
+        for pos, city in enumerate(cities):
+            self.add(self.names, self.nameText, city.name, pos)
+            for name in city.altNames:
+                self.add(self.altNames, self.altNameText, name, pos)
+            for codes in city.phonetics.values():
+                for code in codes:
+                    self.add(self.phonetics, self.phoneticText, code, pos)
+
+        self.nameText.freeze()
+        self.altNameText.freeze()
+        self.phoneticText.freeze()
+
+    @staticmethod
+    def add(trie, text, string, pos):
+        '''Store string, a name of the city at position pos, for searching.'''
+        # Empty strings never match anything.
+        if(len(string) == 0):
+            return
+
+        text.add(string, pos)
+        trie.insert(string, pos, TrieEngine.key(string))
+
+    @staticmethod
+    def key(string):
+        '''Returns the key under which string is stored in a trie.
+
+        Besides the run matching the query at its start, a name beginning with
+        the query can only have other matching runs if the name's first two
+        characters occur again after them. If they do not, the score only
+        depends on the name's length, so that is the key; otherwise the key is
+        0, as for the shortest possible name.
+        '''
+        if(string.find(string[0:2], 2) != -1):
+            return 0
+        return len(string)
+
+    def get_query_results(self, query, scoreMethod, phoneticPenalty=0.2,
+                          minScore=0.15, altNamePenalty=0.5, proximityWeight=0.1,
+                          numRes=-1, session=None):
+        '''Get the numRes best cities matching the query with a score > minScore.
+
+        Arguments:
+            query -- Query object with user's query string, and optionally
+                     latitude, and longitude.
+            numRes -- the number of results to return; if negative, all
+                      results are returned.
+            Other arguments are as for AutoComplete.get_query_results().
+
+        Returns:
+            A list of at most numRes MatchResults, identical to the first
+            numRes results of AutoComplete.get_query_results().
+        '''
+        autoComplete = AutoComplete()
+        queryStr, pq = autoComplete.preprocess_query(query.q)
+
+        if(numRes < 0 or not isinstance(scoreMethod, PrefixPriority) or
+           proximityWeight < 0 or len(queryStr) == 0 or
+           SubstringIndex.SEPARATOR in queryStr):
+            return self.scan(query, scoreMethod, phoneticPenalty, minScore,
+                             altNamePenalty, proximityWeight, numRes, session)
+
+        top = TopResults(numRes, minScore)
+        scorer = scoreMethod.compile(queryStr)
+        phoneticScorers = [scoreMethod.compile(q) for q in pq]
+        passBounds = autoComplete.pass_bounds(scorer, phoneticScorers,
+                                              phoneticPenalty, altNamePenalty)
+        # Positions of the cities scored so far.
+        scored = set()
+
+        def consider(pos, scoreNames=True, phoneticNames=None):
+            if(pos in scored):
+                return
+            scored.add(pos)
+
+            city = self.cities[pos]
+            maxScore, bestName = autoComplete.score_city(city, scorer,
+                                        phoneticScorers, phoneticPenalty,
+                                        altNamePenalty, scoreNames,
+                                        phoneticNames, top, passBounds)
+            if(query.coord != None and maxScore > minScore):
+                maxScore = self.index.coordinates.weigh_proximity(query.coord,
+                                        [pos], [maxScore], proximityWeight)[0]
+            top.add(maxScore, pos, city, bestName)
+
+        # The tries and substring indexes to search, with the (preprocessed)
+        # query string to search for and the penalty applied to their scores.
+        searches = [(self.names, self.nameText, queryStr, 1.0),
+                    (self.altNames, self.altNameText, queryStr, altNamePenalty)]
+        for code in pq:
+            searches.append((self.phonetics, self.phoneticText, code,
+                             phoneticPenalty))
+
+        # First the names beginning with the query, best first. Streams of
+        # (-bound, position), where bound is the best possible penalised score.
+        streams = []
+        for trie, _, q, penalty in searches:
+            node, exact = trie.find(q)
+            if(node == None or penalty <= 0):
+                continue
+            if(exact):
+                # Names equal to the query score 1.0.
+                for _, pos in node.entries:
+                    consider(pos)
+            streams.append(self.prefix_stream(scoreMethod, trie, node, exact,
+                                              len(q), penalty))
+
+        for negBound, pos in heapq.merge(*streams):
+            if(not top.could_enter(-negBound)):
+                break
+            consider(pos)
+
+        # Then the names containing the query elsewhere, and lastly any city
+        # left, which could still make it unless restBound says no.
+        restBound = 0.0
+        containing = []
+        for _, text, q, penalty in searches:
+            penalty = max(penalty, 0)
+            bound = penalty*self.contains_bound(scoreMethod, len(q))
+            if(top.could_enter(bound)):
+                containing.extend(text.entries_containing(q))
+            restBound = max(restBound, penalty*self.rest_bound(scoreMethod, len(q)))
+
+        # Unless n results end up above restBound, the other cities must all
+        # be scored, which the scan does faster (see the class documentation);
+        # so the names containing the query are not scored first. 
+        if(top.could_enter(restBound) and top.n >= 0 and 
+           top.count_above(restBound) + len(set(containing) - scored) < top.n):
+            return self.scan(query, scoreMethod, phoneticPenalty, minScore, 
+                             altNamePenalty, proximityWeight, numRes, session)
+        for pos in containing:
+            consider(pos)
+        if(top.could_enter(restBound)):
+            return self.scan(query, scoreMethod, phoneticPenalty, minScore, 
+                             altNamePenalty, proximityWeight, numRes, session)
+
+        return top.results()
+
+    def scan(self, query, scoreMethod, phoneticPenalty, minScore, altNamePenalty,
+             proximityWeight, numRes, session):
+        '''Returns AutoComplete.get_query_results() over the cities, with the index.'''
+        return AutoComplete().get_query_results(query, self.cities, scoreMethod,
+                                phoneticPenalty, minScore, altNamePenalty,
+                                proximityWeight, self.index, numRes, session)
+
+    @staticmethod
+    def prefix_stream(scoreMethod, trie, node, exact, length, penalty):
+        '''Yields (-bound, position) for names in node's subtree, best first.
+
+        bound is the best score (times penalty) that a name of node's subtree,
+        other than the query itself, can get for a query of the given length
+        that it begins with.
+        '''
+        for key, pos in trie.best_first(node, exact):
+            yield -penalty*TrieEngine.prefix_bound(scoreMethod, length, key), pos
+
+    @staticmethod
+    def prefix_bound(pp, length, key):
+        '''Best Prefix Priority score of a name beginning with a query but not equal to it.
+
+        Arguments:
+            pp -- the PrefixPriority scoring method.
+            length -- the length of the query.
+            key -- the name's key; see key().
+        '''
+        if(length == 1):
+            # Single-character runs do not count, only the start bonus does.
+            return sigmoid(-pp.baseShift + pp.startMatchBonus)
+
+        # Same order of operations as PrefixPriority.score(), so that the
+        # bound is never below the score due to rounding.
+        baseScore = 1.0 if key == 0 else length/key
+        baseScore = baseScore - pp.baseShift
+        baseScore = baseScore + pp.subStringBonus
+        baseScore = baseScore + pp.startMatchBonus*length
+        return sigmoid(baseScore)
+
+    @staticmethod
+    def contains_bound(pp, length):
+        '''Best Prefix Priority score of a name containing a query, but not at the start.'''
+        if(length == 1):
+            return sigmoid(-pp.baseShift)
+
+        baseScore = 1.0 - pp.baseShift
+        baseScore = baseScore + pp.subStringBonus
+        baseScore = baseScore + max(pp.startMatchBonus*(length - 1), 0)
+        return sigmoid(baseScore)
+
+    @staticmethod
+    def rest_bound(pp, length):
+        '''Best Prefix Priority score of a name not containing a query.'''
+        if(length == 1):
+            return 0.0
+
+        baseScore = 1.0 - pp.baseShift
+        baseScore = baseScore + max(pp.startMatchBonus*(length - 1), 0)
+        return sigmoid(baseScore)
+
+
+class SubstringIndex(object):
+    '''A set of strings joined into one, to find the ones containing a substring.
+
+    Searching uses str.find() on the joined text, so that the strings are not
+    looped over in Python.
+
+    Attributes:
+        text -- the strings joined by SEPARATOR; only set by freeze().
+        starts -- offset in text of each string, in ascending order.
+        entries -- entry stored with each string, in the same order.
+    '''
+
+    SEPARATOR = '\x00'
+
+    def __init__(self):
+        self.parts = []
+        self.starts = []
+        self.entries = []
+        self.text = None
+        self.length = 0
+
+    def add(self, string, entry):
+        '''Add string with its entry; only allowed before freeze().'''
+        self.parts.append(string)
+        self.starts.append(self.length)
+        self.entries.append(entry)
+        self.length = self.length + len(string) + len(self.SEPARATOR)
+
+    def freeze(self):
+        '''Join the strings added so far; call once after adding all of them.'''
+        self.text = self.SEPARATOR.join(self.parts)
+        self.parts = None
+
+    def entries_containing(self, sub):
+        '''Yields the entry of each string containing sub other than at its start.
+
+        An entry is yielded once per occurrence.
+
+        Preconditions:
+            -- sub is non-empty and does not contain SEPARATOR
+        '''
+        i = self.text.find(sub)
+        while(i != -1):
+            k = bisect.bisect_right(self.starts, i) - 1
+            if(self.starts[k] != i):
+                yield self.entries[k]
+            i = self.text.find(sub, i + 1)
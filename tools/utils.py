@@ -3,21 +3,50 @@ Miscellaneous utility functions.
 
 Attributes: 
     EARTH_RADIUS_KM -- approximate radius of the earth in km. 
-    PUNCTUATION_SPACES -- unicode punctuation and whitespace characters. 
+    MAX_DIST_KM -- approximate maximum distance in km between two points on
+                   the surface of the earth. 
+    PUNCTUATION_SPACES -- translation table deleting unicode punctuation and 
+                          whitespace characters; filled in lazily. 
     
 Methods:
     haversine -- computes haversine distance between two coordinates. 
     sigmoid -- computes sigmoid function, i.e., 1.0/(1.0 + exp(-x))
+    to_float -- parses a request parameter as a finite float. 
 '''
 
-from math import radians, cos, sin, asin, sqrt, exp 
+from math import radians, cos, sin, asin, sqrt, exp, isfinite
 import unicodedata
-import sys 
 
 EARTH_RADIUS_KM = 6371.0088
-PUNCTUATION_SPACES = dict.fromkeys(i for i in range(sys.maxunicode)
-                            if unicodedata.category(chr(i)).startswith('P')
-                            or unicodedata.category(chr(i)).startswith('Z'))
+MAX_DIST_KM = 20016
+
+class PunctuationSpaces(dict):
+    '''Translation table (for str.translate) deleting punctuation and whitespace.
+    
+    Rather than classifying every unicode code point up front, which takes a
+    noticeable amount of CPU time at import (the table itself is small), each
+    code point is classified the first time it is looked up. The table maps a
+    code point to None if the character is punctuation or whitespace, and to
+    itself otherwise; punctuation and whitespace (under a thousand code
+    points) are kept, and so are other characters below CACHED_BELOW, which
+    covers the alphabets of most names. Other characters are classified again
+    each time, so that queries cannot fill the table, shared by all requests,
+    with every code point.
+    '''
+    
+    CACHED_BELOW = 0x3000
+    
+    def __missing__(self, codePoint):
+        if(unicodedata.category(chr(codePoint))[0] in ('P', 'Z')):
+            value = None
+        else:
+            value = codePoint 
+        if(value == None or codePoint < self.CACHED_BELOW):
+            self[codePoint] = value
+        return value
+
+PUNCTUATION_SPACES = PunctuationSpaces()
+
 def haversine(c1, c2):
     '''Returns the haversine distance between two coordinates. 
     
@@ -47,6 +76,14 @@ def sigmoid(x):
     '''Compute sigmoid of x.'''
     return 1.0/(1.0 + exp(-x))
 
+def to_float(value):
+    '''Returns value as a float, or None if it is not a finite number.'''
+    try:
+        value = None if isinstance(value, bool) else float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if value != None and isfinite(value) else None
+
 def strip_punctuation_spaces(text):
     return text.translate(PUNCTUATION_SPACES)
 